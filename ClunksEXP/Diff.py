@@ -0,0 +1,192 @@
+from itertools import zip_longest
+
+from Privileges import SCHEMA
+from Sources import COLUMNS, ReadSource
+from Validator import TABLES, TITLES
+
+OURS = 'ours'
+THEIRS = 'theirs'
+
+def Columns(table):
+    if table == 'elevation':
+        return ('name',) + SCHEMA.flags + ('sectors',)
+    return COLUMNS[table]
+
+def Keyed(pairs):
+    """
+    Builds a configuration, {table: {key: row}}, from (table, row) pairs. Rows are keyed by their first column
+    like in the store, a later row with the same key replacing the earlier one.
+    """
+    config = {table: {} for table in TABLES}
+    for table, row in pairs:
+        config[table][row[0]] = row
+    return config
+
+def Load(path, logFunc=lambda text: None, mapping=None):
+    """
+    Reads a configuration from a source. The subserver and room sectors of an .exp are the sectors of the users
+    placed under them rather than those they were configured with, which an .exp doesn't hold, so comparing
+    .exp compares placements: a configured change which doesn't move any user isn't seen.
+    """
+    return Keyed(ReadSource(path, logFunc, mapping))
+
+def Sectors(value):
+    return value.split(',') if value else []
+
+def MergeSectors(base, ours, theirs):
+    """
+    Merges the sector lists of both sides as sets: sectors either side added are kept and sectors either side
+    removed are dropped. Ours come first, in their order, then those only theirs has.
+    """
+    baseSectors = set(Sectors(base)) if base is not None else set()
+    ourSectors = Sectors(ours)
+    theirSectors = Sectors(theirs)
+    removed = (baseSectors - set(ourSectors)) | (baseSectors - set(theirSectors))
+    merged = [sector for sector in ourSectors if sector not in removed]
+    seen = set(merged)
+    for sector in theirSectors:
+        if sector not in removed and sector not in seen:
+            merged.append(sector)
+            seen.add(sector)
+    return ','.join(merged)
+
+def Changes(table, old, new):
+    """
+    Describes what changed between two versions of a row, column by column. Passwords are hashes, so only
+    whether they changed is given.
+    """
+    changes = []
+    for column, before, after in zip_longest(Columns(table), old, new, fillvalue=''):
+        if before == after:
+            continue
+        if column == 'password':
+            changes.append('password changed')
+        else:
+            changes.append(f"{column} '{before}' -> '{after}'")
+    return changes
+
+class TableDiff:
+    """
+    The rows added to, removed from and changed in one table, keyed like the table. changed maps each key to
+    its (old, new) rows.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.added = {}
+        self.removed = {}
+        self.changed = {}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def Summary(self):
+        return f'{self.table}: {len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed'
+
+    def Lines(self):
+        for key in sorted(self.added):
+            yield f"+ {self.table} '{key}'"
+        for key in sorted(self.removed):
+            yield f"- {self.table} '{key}'"
+        for key in sorted(self.changed):
+            old, new = self.changed[key]
+            yield f"~ {self.table} '{key}': {', '.join(Changes(self.table, old, new))}"
+
+def Diff(base, other):
+    """
+    Compares two configurations table by table through their keys, returning {table: TableDiff}.
+    """
+    diffs = {}
+    for table in TABLES:
+        diff = diffs[table] = TableDiff(table)
+        old = base[table]
+        new = other[table]
+        for key, row in new.items():
+            before = old.get(key)
+            if before is None:
+                diff.added[key] = row
+            elif before != row:
+                diff.changed[key] = (before, row)
+        for key, row in old.items():
+            if key not in new:
+                diff.removed[key] = row
+    return diffs
+
+class Conflict:
+    """
+    A row both sides of a merge changed in ways which can't be combined: one removed it and the other changed
+    it ('delete/modify'), both changed the same columns differently ('modify/modify') or both added it with
+    different columns ('add/add'). columns names the conflicting columns and row is what the merge kept.
+    """
+    def __init__(self, table, key, kind, columns, base, ours, theirs, row):
+        self.table = table
+        self.key = key
+        self.kind = kind
+        self.columns = tuple(columns)
+        self.base = base
+        self.ours = ours
+        self.theirs = theirs
+        self.row = row
+
+    def __str__(self):
+        subject = f"{TITLES[self.table]} '{self.key}'"
+        if self.kind == 'delete/modify':
+            removed, changed = (OURS, THEIRS) if self.ours is None else (THEIRS, OURS)
+            return f'{subject} was removed in {removed} and changed in {changed}.'
+        columns = ', '.join(self.columns)
+        if self.kind == 'add/add':
+            return f'{subject} was added in both with different {columns}.'
+        return f'{subject} has conflicting changes to {columns}.'
+
+def MergeRow(table, key, base, ours, theirs, prefer=None):
+    """
+    Merges one row, returning the merged row (None if it was removed) and a Conflict or None. Conflicting
+    rows or columns are taken from ours unless prefer is THEIRS.
+    """
+    if ours == theirs or theirs == base:
+        return ours, None
+    if ours == base:
+        return theirs, None
+    if ours is None or theirs is None:
+        row = theirs if prefer == THEIRS else ours
+        return row, Conflict(table, key, 'delete/modify', (), base, ours, theirs, row)
+    sectors = Columns(table).index('sectors')
+    row = []
+    columns = []
+    for x, (column, mine, yours) in enumerate(zip_longest(Columns(table), ours, theirs, fillvalue='')):
+        before = base[x] if base is not None and x < len(base) else None
+        if mine == yours or yours == before:
+            row.append(mine)
+        elif mine == before:
+            row.append(yours)
+        elif x == sectors:
+            row.append(MergeSectors(before, mine, yours))
+        else:
+            columns.append(column)
+            row.append(yours if prefer == THEIRS else mine)
+    if not columns:
+        return row, None
+    return row, Conflict(table, key, 'modify/modify' if base is not None else 'add/add', columns, base, ours, theirs, row)
+
+def Merge(base, ours, theirs, prefer=None):
+    """
+    Three-way merges two configurations derived from base, returning the merged configuration and the list
+    of conflicts. Rows are matched by key, so this is linear in the number of rows; keys come out in the
+    order of ours followed by those only theirs or base had.
+    """
+    merged = {}
+    conflicts = []
+    for table in TABLES:
+        rows = merged[table] = {}
+        old = base[table]
+        mine = ours[table]
+        yours = theirs[table]
+        keys = list(mine)
+        keys.extend([key for key in yours if key not in mine])
+        keys.extend([key for key in old if key not in mine and key not in yours])
+        for key in keys:
+            row, conflict = MergeRow(table, key, old.get(key), mine.get(key), yours.get(key), prefer)
+            if row is not None:
+                rows[key] = row
+            if conflict is not None:
+                conflicts.append(conflict)
+    return merged, conflicts
@@ -0,0 +1,46 @@
+class EntityModel:
+    """
+    The rows behind an editor's grid, in table order, with a hashed index from each row's key (its first
+    column) to the row. Membership checks and lookups are O(1) and the grid reads rows by position, so
+    nothing has to be asked of Tk to find out what an editor holds.
+    """
+    def __init__(self, rows=()):
+        self.keys = []
+        self.rows = {}
+        self.Extend(rows)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return str(key) in self.rows
+
+    def Key(self, row):
+        return str(row[0])
+
+    def Get(self, key):
+        return self.rows.get(str(key))
+
+    def Row(self, position):
+        return self.rows[self.keys[position]]
+
+    def Slice(self, start, stop):
+        return [self.rows[key] for key in self.keys[start:stop]]
+
+    def Add(self, row):
+        key = self.Key(row)
+        if key not in self.rows:
+            self.keys.append(key)
+        self.rows[key] = row
+
+    def Extend(self, rows):
+        for row in rows:
+            self.Add(row)
+
+    def Remove(self, keys):
+        removed = {str(key) for key in keys if str(key) in self.rows}
+        if removed:
+            for key in removed:
+                del self.rows[key]
+            self.keys = [key for key in self.keys if key not in removed]
+        return removed
@@ -0,0 +1,306 @@
+from bisect import bisect_left, insort
+
+DIRECT = 5000
+CHUNK = 10000
+
+class EntityQuery:
+    """
+    A filtered and sorted view of an EntityModel, read by position like the model itself so a VirtualTreeView
+    can show it. Rows are added and removed through the query, which keeps its indexes up to date as they are:
+    trigrams of the lowercased names, the sectors and the parents of the rows (when the table has those
+    columns) mapped to the keys holding them, and a sorted list of (value, key) for each column, the names'
+    doubling as the prefix index. Each index is built the first time a search or sort needs it.
+    A search is made of words: 'sector:NAME' and 'parent:NAME' keep the rows with that sector or parent and the
+    rest is looked for in the names, anywhere in them if it is at least three characters long and at their start
+    otherwise. Everything is compared ignoring case.
+    When one of the indexes narrows a search down to at most DIRECT rows, those are checked and ordered at once.
+    Otherwise the rows are scanned in view order by Step(), CHUNK at a time, so the first rows show straight
+    away however big the table is and the rest of the view fills in between keystrokes.
+    """
+    def __init__(self, model, sectors=None, parent=None):
+        self.model = model
+        self.sectorColumn = sectors
+        self.parentColumn = parent
+        self.trigrams = None
+        self.sectors = None
+        self.parents = None
+        self.sortKeys = {}
+        self.order = {key: x for x, key in enumerate(model.keys)}
+        self.next = len(model.keys)
+        self.search = ''
+        self.column = None
+        self.descending = False
+        self.view = None
+        self.visible = None
+        self.pending = None
+
+    def __len__(self):
+        return len(self.model) if self.view is None else len(self.view)
+
+    def __contains__(self, key):
+        return key in self.model if self.visible is None else str(key) in self.visible
+
+    def Key(self, row):
+        return self.model.Key(row)
+
+    def Keys(self, start, stop):
+        if self.view is not None:
+            return self.view[start:stop]
+        if self.column is None:
+            return self.model.keys[start:stop]
+        entries = self.sortKeys[self.column]
+        if self.descending:
+            total = len(entries)
+            return [key for value, key in reversed(entries[max(0, total - stop):max(0, total - start)])]
+        return [key for value, key in entries[start:stop]]
+
+    def Row(self, position):
+        return self.Slice(position, position + 1)[0]
+
+    def Slice(self, start, stop):
+        if self.view is None and self.column is None:
+            return self.model.Slice(start, stop)
+        return [self.model.Get(key) for key in self.Keys(start, stop)]
+
+    def Position(self, key):
+        """
+        Returns where the row with key is in the view, or None if it is filtered out (or not scanned yet).
+        """
+        key = str(key)
+        if key not in self:
+            return None
+        if self.view is not None:
+            return self.view.index(key)
+        if self.column is None:
+            return len(self.model) - 1 if self.model.keys[-1] == key else self.model.keys.index(key)
+        position = bisect_left(self.sortKeys[self.column], (self.Value(self.model.Get(key), self.column), key))
+        return len(self.model) - 1 - position if self.descending else position
+
+    def Add(self, row):
+        key = self.model.Key(row)
+        old = self.model.Get(key)
+        if old is not None:
+            self.Unindex(key, old)
+        else:
+            self.order[key] = self.next
+            self.next += 1
+        self.model.Add(row)
+        self.Index(key, row)
+        self.Update()
+
+    def Extend(self, rows):
+        self.model.Extend(rows)
+        self.trigrams = None
+        self.sectors = None
+        self.parents = None
+        self.sortKeys = {}
+        self.order = {key: x for x, key in enumerate(self.model.keys)}
+        self.next = len(self.model.keys)
+        self.Update()
+
+    def Remove(self, keys):
+        rows = {str(key): self.model.Get(key) for key in keys}
+        removed = self.model.Remove(keys)
+        for key in removed:
+            self.Unindex(key, rows[key])
+            del self.order[key]
+        self.Update()
+        return removed
+
+    def Filter(self, search):
+        self.search = search
+        self.Update()
+
+    def Sort(self, column=None, descending=False):
+        """
+        Sorts the view by a column, or puts it back in table order if column is None.
+        """
+        self.column = column
+        self.descending = descending
+        self.Update()
+
+    def Value(self, row, column):
+        return row[column].lower() if column < len(row) else ''
+
+    def Sectors(self, value):
+        return {sector.strip().lower() for sector in value.split(',') if sector.strip()}
+
+    def Trigrams(self, name):
+        return {name[x:x + 3] for x in range(len(name) - 2)}
+
+    def SortKeys(self, column):
+        entries = self.sortKeys.get(column)
+        if entries is None:
+            entries = self.sortKeys[column] = sorted([(self.Value(row, column), key) for key, row in self.model.rows.items()])
+        return entries
+
+    def TrigramIndex(self):
+        if self.trigrams is None:
+            self.trigrams = {}
+            for key in self.model.rows:
+                self.AddTrigrams(key)
+        return self.trigrams
+
+    def SectorIndex(self):
+        if self.sectors is None:
+            self.sectors = {}
+            for key, row in self.model.rows.items():
+                for sector in self.Sectors(row[self.sectorColumn]):
+                    self.AddKey(self.sectors, sector, key)
+        return self.sectors
+
+    def ParentIndex(self):
+        if self.parents is None:
+            self.parents = {}
+            for key, row in self.model.rows.items():
+                self.AddKey(self.parents, row[self.parentColumn].lower(), key)
+        return self.parents
+
+    def AddTrigrams(self, key):
+        trigrams = self.trigrams
+        name = key.lower()
+        for x in range(len(name) - 2):
+            keys = trigrams.get(name[x:x + 3])
+            if keys is None:
+                trigrams[name[x:x + 3]] = {key}
+            else:
+                keys.add(key)
+
+    def AddKey(self, index, value, key):
+        keys = index.get(value)
+        if keys is None:
+            index[value] = {key}
+        else:
+            keys.add(key)
+
+    def Discard(self, index, value, key):
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def Index(self, key, row):
+        if self.trigrams is not None:
+            self.AddTrigrams(key)
+        if self.sectors is not None:
+            for sector in self.Sectors(row[self.sectorColumn]):
+                self.AddKey(self.sectors, sector, key)
+        if self.parents is not None:
+            self.AddKey(self.parents, row[self.parentColumn].lower(), key)
+        for column, entries in self.sortKeys.items():
+            insort(entries, (self.Value(row, column), key))
+
+    def Unindex(self, key, row):
+        if self.trigrams is not None:
+            for trigram in self.Trigrams(key.lower()):
+                self.Discard(self.trigrams, trigram, key)
+        if self.sectors is not None:
+            for sector in self.Sectors(row[self.sectorColumn]):
+                self.Discard(self.sectors, sector, key)
+        if self.parents is not None:
+            self.Discard(self.parents, row[self.parentColumn].lower(), key)
+        for column, entries in self.sortKeys.items():
+            entry = (self.Value(row, column), key)
+            x = bisect_left(entries, entry)
+            if x < len(entries) and entries[x] == entry:
+                del entries[x]
+
+    def Criteria(self):
+        """
+        Parses the search into the key sets of its sector and parent words and the text to look for in the names.
+        """
+        sets = []
+        words = []
+        for word in self.search.split():
+            field, sep, value = word.partition(':')
+            field = field.lower()
+            if sep and field == 'sector' and self.sectorColumn is not None:
+                sets.append(self.SectorIndex().get(value.strip().lower(), set()))
+            elif sep and field == 'parent' and self.parentColumn is not None:
+                sets.append(self.ParentIndex().get(value.strip().lower(), set()))
+            else:
+                words.append(word.lower())
+        return sets, ' '.join(words)
+
+    def Candidates(self, sets, text):
+        """
+        Returns the smallest collection of keys the indexes narrow the search down to.
+        """
+        candidates = list(sets)
+        if len(text) >= 3:
+            trigrams = self.TrigramIndex()
+            candidates.extend([trigrams.get(trigram, ()) for trigram in self.Trigrams(text)])
+        elif text:
+            entries = self.SortKeys(0)
+            start = bisect_left(entries, (text, ''))
+            stop = bisect_left(entries, (text[:-1] + chr(ord(text[-1]) + 1), ''), start)
+            if stop - start <= DIRECT:
+                candidates.append([key for name, key in entries[start:stop]])
+        return min(candidates, key=len, default=None)
+
+    def Test(self, key, sets, text):
+        for keys in sets:
+            if key not in keys:
+                return False
+        if len(text) >= 3:
+            return text in key.lower()
+        return not text or key.lower().startswith(text)
+
+    def Source(self):
+        """
+        Returns an iterator over every key in view order, for the scan.
+        """
+        if self.column is None:
+            return iter(self.model.keys)
+        entries = self.SortKeys(self.column)
+        return (key for value, key in (reversed(entries) if self.descending else entries))
+
+    def Update(self):
+        self.pending = None
+        if self.column is not None:
+            self.SortKeys(self.column)
+        sets, text = self.Criteria()
+        if not sets and not text:
+            self.view = None
+            self.visible = None
+            return
+        sets.sort(key=len)
+        candidates = self.Candidates(sets, text)
+        if candidates is not None and len(candidates) <= DIRECT:
+            matches = {key for key in candidates if self.Test(key, sets, text)}
+            if self.column is None:
+                self.view = sorted(matches, key=self.order.__getitem__)
+            else:
+                self.view = sorted(matches, key=lambda key: (self.Value(self.model.Get(key), self.column), key), reverse=self.descending)
+            self.visible = matches
+            return
+        self.view = []
+        self.visible = set()
+        self.pending = (self.Source(), sets, text)
+        self.Step()
+
+    def Step(self, count=CHUNK):
+        """
+        Scans the next count rows of an unfinished view, returning whether there are more to scan.
+        """
+        if self.pending is None:
+            return False
+        source, sets, text = self.pending
+        scanned = 0
+        found = []
+        for key in source:
+            if self.Test(key, sets, text):
+                found.append(key)
+            scanned += 1
+            if scanned >= count:
+                break
+        self.view.extend(found)
+        self.visible.update(found)
+        if scanned < count:
+            self.pending = None
+        return self.pending is not None
+
+    def Finish(self):
+        while self.Step():
+            pass
@@ -0,0 +1,215 @@
+import contextlib
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+TABLES = ('user', 'subserver', 'room', 'elevation')
+SESSION_PREFIX = 'clunksexp-session-'
+CHECKPOINT_INTERVAL = 5.0
+
+def Modified(path):
+    return max([os.path.getmtime(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix)])
+
+def Sessions():
+    """
+    Returns (path, last modified) of the session stores left behind by a ClunksEXP which didn't close properly,
+    newest first. Stores still open in a running ClunksEXP are locked by it and left out, empty ones deleted.
+    """
+    sessions = []
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), SESSION_PREFIX + '*.db')):
+        try:
+            modified = Modified(path)
+            connection = sqlite3.connect(path, timeout=0)
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                rows = connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'entities'").fetchone()[0]
+                if rows:
+                    rows = connection.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+                connection.rollback()
+            finally:
+                connection.close()
+        except (sqlite3.Error, OSError):
+            continue
+        if not rows:
+            Discard(path)
+            continue
+        sessions.append((path, modified))
+    return sorted(sessions, key=lambda session: session[1], reverse=True)
+
+def Discard(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+class EntityStore:
+    """
+    Session storage for the entity tables, kept in an SQLite database in the temp folder.
+    Rows are keyed by their first column (the entity's name) and keep the position they were first
+    added at, so upserting or deleting one row is a single indexed statement and reads come back in
+    table order. Deletes leave gaps in the positions, which only order the rows and never need renumbering.
+    The keys written since the last Forget() are tracked per table (cleared tables are tracked as a whole)
+    so that exports can tell what changed.
+    A session store (the GUI's) survives a crash: it is named so that Sessions() finds it, held locked while
+    open, and written through SQLite's write-ahead log, so every committed write reaches the file before
+    the call returns and a crash can neither lose nor tear it. The log is only synced to disk when it is
+    checkpointed into the database, at most every CHECKPOINT_INTERVAL seconds, so each edit costs an append
+    rather than an fsync. Opening a store left behind replays its log. Other stores aren't kept.
+    Stores are removed when closed unless a path was given for one which isn't a session.
+    """
+    def __init__(self, path=None, session=False):
+        self.temporary = path is None or session
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix=SESSION_PREFIX if session else 'clunksexp-', suffix='.db')
+            os.close(handle)
+        self.path = path
+        self.session = session
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.checkpointed = time.monotonic()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if session:
+            self.connection.execute('PRAGMA locking_mode=EXCLUSIVE')
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        else:
+            self.connection.execute('PRAGMA journal_mode=MEMORY')
+            self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entities (kind TEXT NOT NULL, key TEXT NOT NULL, position INTEGER NOT NULL, row TEXT NOT NULL, PRIMARY KEY (kind, key))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entities_position ON entities (kind, position)')
+        self.tables = {kind: EntityTable(self, kind) for kind in TABLES}
+        self.changed = {kind: set() for kind in TABLES}
+        self.cleared = set()
+
+    def __getitem__(self, kind):
+        return self.tables[kind]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def items(self):
+        return self.tables.items()
+
+    def values(self):
+        return self.tables.values()
+
+    def Execute(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def ExecuteMany(self, sql, rows):
+        with self.Transaction():
+            self.connection.executemany(sql, rows)
+
+    @contextlib.contextmanager
+    def Transaction(self):
+        """
+        Makes the writes within one transaction, committed at the end of the outermost Transaction().
+        """
+        with self.lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield
+                finally:
+                    self.depth -= 1
+                return
+            self.depth = 1
+            try:
+                with self.connection:
+                    self.connection.execute('BEGIN')
+                    yield
+            finally:
+                self.depth = 0
+            if self.session and time.monotonic() - self.checkpointed >= CHECKPOINT_INTERVAL:
+                self.Checkpoint()
+
+    def Checkpoint(self):
+        with self.lock:
+            self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            self.checkpointed = time.monotonic()
+
+    def Changes(self):
+        """
+        Returns a snapshot of the changes made so far: the set of cleared tables and the changed keys of each table.
+        """
+        with self.lock:
+            return set(self.cleared), {kind: set(keys) for kind, keys in self.changed.items()}
+
+    def Forget(self, changes):
+        """
+        Stops tracking the changes in a snapshot from Changes(), keeping anything changed since it was taken.
+        """
+        cleared, changed = changes
+        with self.lock:
+            self.cleared -= cleared
+            for kind, keys in changed.items():
+                self.changed[kind] -= keys
+
+    def Close(self):
+        with self.lock:
+            self.connection.close()
+        if self.temporary:
+            Discard(self.path)
+
+class EntityTable:
+    """
+    One entity type within an EntityStore.
+    """
+    def __init__(self, store, kind):
+        self.store = store
+        self.kind = kind
+
+    def Key(self, row):
+        return str(row[0])
+
+    def Count(self):
+        return self.store.Execute('SELECT COUNT(*) FROM entities WHERE kind = ?', (self.kind,))[0][0]
+
+    def Keys(self):
+        return [row[0] for row in self.store.Execute('SELECT key FROM entities WHERE kind = ?', (self.kind,))]
+
+    def Get(self, key):
+        rows = self.store.Execute('SELECT row FROM entities WHERE kind = ? AND key = ?', (self.kind, key))
+        return json.loads(rows[0][0]) if rows else None
+
+    def Range(self, start=0, count=-1):
+        rows = self.store.Execute('SELECT row FROM entities WHERE kind = ? ORDER BY position LIMIT ? OFFSET ?', (self.kind, count, start))
+        return [json.loads(row[0]) for row in rows]
+
+    def All(self):
+        return self.Range()
+
+    def Upsert(self, row):
+        self.UpsertMany([row])
+
+    def UpsertMany(self, rows):
+        with self.store.lock:
+            end = self.store.Execute('SELECT MAX(position) FROM entities WHERE kind = ?', (self.kind,))[0][0]
+            end = 0 if end is None else end + 1
+            self.store.changed[self.kind].update([self.Key(row) for row in rows])
+            self.store.ExecuteMany('INSERT INTO entities (kind, key, position, row) VALUES (?, ?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET row = excluded.row',
+                                   [(self.kind, self.Key(row), end + x, json.dumps(row)) for x, row in enumerate(rows)])
+
+    def Delete(self, key):
+        self.DeleteMany([key])
+
+    def DeleteMany(self, keys):
+        with self.store.lock:
+            self.store.changed[self.kind].update([str(key) for key in keys])
+        self.store.ExecuteMany('DELETE FROM entities WHERE kind = ? AND key = ?', [(self.kind, str(key)) for key in keys])
+
+    def Clear(self):
+        with self.store.Transaction():
+            self.store.cleared.add(self.kind)
+            self.store.Execute('DELETE FROM entities WHERE kind = ?', (self.kind,))
+
+    def Replace(self, rows):
+        with self.store.Transaction():
+            self.Clear()
+            self.UpsertMany(rows)
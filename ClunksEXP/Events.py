@@ -0,0 +1,85 @@
+import collections
+import threading
+import traceback
+
+class Dispatcher:
+    """
+    Runs callbacks on the thread of the Tk loop it is attached to, whichever thread they are posted from.
+    Posted calls wait in a thread-safe queue. Calls posted from the loop's own thread wake it once per batch
+    with after_idle; those posted from other threads are picked up by the loop polling the queue every
+    INTERVAL milliseconds with after(), as Tk may only be called from its own thread. Named events can be
+    subscribed to and emitted the same way.
+    Until a widget is attached (for example when running headless) posted calls run straight away, and once
+    detached they are dropped. If the loop can't be woken (Tk is being torn down), the calls stay queued for the
+    next poll, and a callback which raises is reported without holding up the rest.
+    """
+    INTERVAL = 20
+
+    def __init__(self):
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.handlers = {}
+        self.widget = None
+        self.thread = None
+        self.scheduled = False
+        self.detached = False
+
+    def Attach(self, widget):
+        self.widget = widget
+        self.detached = False
+        self.thread = threading.get_ident()
+        widget.after(self.INTERVAL, lambda: self.Poll(widget))
+
+    def Detach(self):
+        self.widget = None
+        self.detached = True
+        self.queue.clear()
+
+    def Post(self, callback, *args):
+        widget = self.widget
+        if widget is None:
+            if not self.detached:
+                callback(*args)
+            return
+        self.queue.append((callback, args))
+        if threading.get_ident() != self.thread:
+            return
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        try:
+            widget.after_idle(self.Pump)
+        except Exception:
+            with self.lock:
+                self.scheduled = False
+            raise
+
+    def Poll(self, widget):
+        if widget is not self.widget:
+            return
+        self.Pump()
+        widget.after(self.INTERVAL, lambda: self.Poll(widget))
+
+    def Pump(self):
+        with self.lock:
+            self.scheduled = False
+        while self.queue and self.widget is not None:
+            callback, args = self.queue.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def Subscribe(self, event, callback):
+        self.handlers.setdefault(event, []).append(callback)
+
+    def Unsubscribe(self, event, callback):
+        if callback in self.handlers.get(event, []):
+            self.handlers[event].remove(callback)
+
+    def Emit(self, event, *args):
+        for callback in list(self.handlers.get(event, [])):
+            self.Post(callback, *args)
+
+dispatcher = Dispatcher()
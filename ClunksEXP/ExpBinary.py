@@ -0,0 +1,347 @@
+import mmap
+import os
+import struct
+import zlib
+
+from ExpWriter import ExpWriter
+from Privileges import SCHEMA
+from Exporter import USERS
+from SectorIndex import SUBSERVER, ROOM
+
+MAGIC = b'CLXB'
+VERSION = 1
+NONE = 0xFFFFFFFF
+USER = 2
+TAGS = ('subserver', 'room', 'user')
+USER_TABLE = 1
+
+HEADER = struct.Struct('<4sHHQqIIIIIII8Q')
+STRING = struct.Struct('<II')
+NODE = struct.Struct('<BxxxIIIII')
+USER_RECORD = struct.Struct('<IIIII')
+ELEVATION = struct.Struct('<III')
+INDEX = struct.Struct('<I')
+
+def SidecarPath(expPath):
+    return os.path.splitext(expPath)[0] + '.expb'
+
+def Stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def Checksum(path):
+    """
+    Returns the size and CRC32 of a file, which a sidecar records to tell whether it still matches its .exp.
+    """
+    crc = 0
+    size = 0
+    with open(path, 'rb') as expFile:
+        for chunk in iter(lambda: expFile.read(1 << 20), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return size, crc
+
+class SidecarWriter:
+    """
+    Writes the compact binary companion of an .exp from an Exporter which has placed every user. Strings are
+    stored once in a string table and everything else refers to them by index: the subserver, room and user
+    elements as fixed-width node records in document order (each with its parent and the index just past its
+    subtree), one record per user in the order they first appear in the document, the elevations, the global
+    users, and the subserver/room nodes in document order and sorted by name. An .exp in the USERS layout
+    keeps the order of its user table, so user records are numbered by their ids.
+    """
+    def __init__(self):
+        self.strings = {}
+        self.nodes = bytearray()
+        self.nodeCount = 0
+        self.entities = bytearray()
+        self.nameIndex = []
+        self.users = bytearray()
+        self.userRecords = {}
+
+    def String(self, text):
+        if text is None:
+            return NONE
+        try:
+            return self.strings[text]
+        except KeyError:
+            self.strings[text] = len(self.strings)
+            return self.strings[text]
+
+    def Node(self, kind, a, b, c, parent):
+        self.nodes += NODE.pack(kind, a, b, c, parent, 0)
+        self.nodeCount += 1
+        return self.nodeCount - 1
+
+    def User(self, exporter, x):
+        try:
+            return self.userRecords[x]
+        except KeyError:
+            pass
+        attrs = exporter.UserAttrs(x)
+        self.users += USER_RECORD.pack(*[self.String(attrs[key]) for key in ('username', 'password', 'sectors', 'global', 'elevation')])
+        self.userRecords[x] = len(self.userRecords)
+        return self.userRecords[x]
+
+    def End(self, node):
+        NODE.pack_into(self.nodes, node * NODE.size, *NODE.unpack_from(self.nodes, node * NODE.size)[:5], self.nodeCount)
+
+    def Add(self, exporter):
+        self.flags = 0
+        if exporter.layout == USERS:
+            self.flags |= USER_TABLE
+            for x in exporter.userIds:
+                self.User(exporter, x)
+        for x in range(len(exporter.subservers)):
+            stack = [(x, None, NONE)]
+            while stack:
+                entity, children, node = stack.pop()
+                if children is None:
+                    attrs = exporter.EntityAttrs(entity)
+                    parent = node
+                    node = self.Node(SUBSERVER if entity < exporter.roomBase else ROOM, self.String(attrs['name']), self.String(attrs.get('password')),
+                                     self.String(attrs.get('sectors')), parent)
+                    self.entities += INDEX.pack(node)
+                    self.nameIndex.append((attrs['name'], node))
+                    children = iter(exporter.subserverChildren[entity] if entity < exporter.roomBase else exporter.roomChildren[entity - exporter.roomBase])
+                child = next(children, None)
+                if child is not None:
+                    stack.append((entity, children, node))
+                    stack.append((exporter.roomBase + child, None, node))
+                    continue
+                for x in exporter.elementUsers.get(entity, ()):
+                    self.End(self.Node(USER, self.User(exporter, x), NONE, NONE, node))
+                self.End(node)
+        self.globalUsers = b''.join([INDEX.pack(self.User(exporter, x)) for x in exporter.globalUsers])
+        self.elevations = bytearray()
+        for x in range(len(exporter.elevations)):
+            attrs = exporter.ElevationAttrs(x)
+            self.elevations += ELEVATION.pack(self.String(attrs['name']), self.String(str(exporter.privileges[x])), self.String(attrs['sectors']))
+        self.nameIndex.sort(key=lambda item: item[0].encode('utf-8'))
+        self.userCount = len(self.userRecords)
+        self.elevationCount = len(exporter.elevations)
+        self.globalCount = len(exporter.globalUsers)
+
+    def Write(self, path, expSize, expMtime, expCrc):
+        index = bytearray()
+        data = []
+        offset = 0
+        for text in self.strings:
+            encoded = text.encode('utf-8')
+            index += STRING.pack(offset, len(encoded))
+            data.append(encoded)
+            offset += len(encoded)
+        data = b''.join(data)
+        names = b''.join([INDEX.pack(node) for name, node in self.nameIndex])
+        sections = [index, data, self.nodes, self.users, self.elevations, self.globalUsers, self.entities, names]
+        offsets = []
+        position = HEADER.size
+        for section in sections:
+            offsets.append(position)
+            position += len(section)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as binaryFile:
+            binaryFile.write(HEADER.pack(MAGIC, VERSION, self.flags, expSize, expMtime, expCrc, len(self.strings), self.nodeCount, len(self.nameIndex),
+                                         self.userCount, self.elevationCount, self.globalCount, *offsets))
+            for section in sections:
+                binaryFile.write(section)
+        os.replace(temporary, path)
+
+def WriteSidecar(exporter, expPath):
+    """
+    Writes the sidecar of the .exp at expPath, which must already have been written from exporter.
+    """
+    writer = SidecarWriter()
+    writer.Add(exporter)
+    size, crc = Checksum(expPath)
+    writer.Write(SidecarPath(expPath), size, Stamp(expPath)[1], crc)
+
+def OpenSidecar(expPath):
+    """
+    Returns the Sidecar of the .exp at expPath if there is one which still matches it, otherwise None.
+    """
+    if not isinstance(expPath, str) or not os.path.exists(SidecarPath(expPath)):
+        return None
+    try:
+        sidecar = Sidecar(SidecarPath(expPath))
+    except (OSError, ValueError):
+        return None
+    if not sidecar.Matches(expPath):
+        sidecar.Close()
+        return None
+    return sidecar
+
+class Sidecar:
+    """
+    A memory-mapped sidecar. Records are read straight out of the mapping with struct.unpack_from and strings
+    are only decoded when asked for, once each. Rows() yields the same rows of each table, in the same order,
+    as reading the .exp with ExpReader, without visiting the user elements, and WriteExp() writes the .exp
+    back out byte for byte.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"'{path}' is empty.")
+        if len(self.map) < HEADER.size:
+            self.Close()
+            raise ValueError(f"'{path}' is not an EXP sidecar.")
+        (magic, version, self.flags, self.expSize, self.expMtime, self.expCrc, self.stringCount, self.nodeCount, self.named, self.userCount, self.elevationCount,
+         self.globalCount, self.stringIndex, self.stringData, self.nodeOffset, self.userOffset, self.elevationOffset,
+         self.globalOffset, self.entityOffset, self.nameOffset) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or self.nameOffset + INDEX.size * self.named != len(self.map):
+            self.Close()
+            raise ValueError(f"'{path}' is not an EXP sidecar.")
+        self.view = memoryview(self.map)
+        self.decoded = {}
+
+    def Matches(self, expPath):
+        """
+        Whether the .exp at expPath is the one this sidecar was written from. The .exp is only checksummed
+        when its modification time has changed since, for example after being copied.
+        """
+        try:
+            size, mtime = Stamp(expPath)
+            if size != self.expSize:
+                return False
+            return mtime == self.expMtime or Checksum(expPath) == (self.expSize, self.expCrc)
+        except OSError:
+            return False
+
+    def String(self, index):
+        if index == NONE:
+            return None
+        try:
+            return self.decoded[index]
+        except KeyError:
+            pass
+        offset, length = STRING.unpack_from(self.map, self.stringIndex + index * STRING.size)
+        start = self.stringData + offset
+        self.decoded[index] = str(self.view[start:start + length], 'utf-8')
+        return self.decoded[index]
+
+    def Node(self, index):
+        """
+        Returns (kind, a, b, c, parent, end) for a node. Subserver and room nodes hold the string indexes of
+        their name, password and sectors; user nodes hold the index of their user record in a.
+        """
+        return NODE.unpack_from(self.map, self.nodeOffset + index * NODE.size)
+
+    def User(self, index):
+        return [self.String(x) for x in USER_RECORD.unpack_from(self.map, self.userOffset + index * USER_RECORD.size)]
+
+    def Elevation(self, index):
+        return [self.String(x) for x in ELEVATION.unpack_from(self.map, self.elevationOffset + index * ELEVATION.size)]
+
+    def GlobalUsers(self):
+        return [x for x, in INDEX.iter_unpack(self.view[self.globalOffset:self.globalOffset + self.globalCount * INDEX.size])]
+
+    def Nodes(self):
+        return NODE.iter_unpack(self.view[self.nodeOffset:self.userOffset])
+
+    def Find(self, name):
+        """
+        Returns the node of the subserver or room with the given name, or None, by binary search of the name index.
+        """
+        key = name.encode('utf-8')
+        low = 0
+        high = self.named
+        while low < high:
+            middle = (low + high) // 2
+            node, = INDEX.unpack_from(self.map, self.nameOffset + middle * INDEX.size)
+            offset, length = STRING.unpack_from(self.map, self.stringIndex + self.Node(node)[1] * STRING.size)
+            value = self.map[self.stringData + offset:self.stringData + offset + length]
+            if value == key:
+                return node
+            if value < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def Entities(self):
+        return [x for x, in INDEX.iter_unpack(self.view[self.entityOffset:self.nameOffset])]
+
+    def Rows(self):
+        for node in self.Entities():
+            kind, a, b, c, parent, end = self.Node(node)
+            name = self.String(a)
+            sectors = self.String(c) or ''
+            if kind == SUBSERVER:
+                yield 'subserver', [name, sectors]
+            else:
+                yield 'room', [name, self.String(b), self.String(self.Node(parent)[1]), sectors]
+        for x in range(self.elevationCount):
+            name, privilege, sectors = self.Elevation(x)
+            yield 'elevation', [name] + SCHEMA.Decode(int(privilege)) + [sectors]
+        usernames = set()
+        for x in range(self.userCount):
+            user = self.User(x)
+            if user[0] not in usernames:
+                usernames.add(user[0])
+                yield 'user', user[:4]
+
+    def WriteExp(self, expFile):
+        writer = ExpWriter(expFile)
+        writer.Start('root')
+        if self.flags & USER_TABLE:
+            writer.Start('users')
+            for x in range(self.userCount):
+                attrs = {'id': str(x)}
+                attrs.update(self.UserAttrs(x))
+                writer.Empty('user', attrs)
+            writer.End()
+        writer.Start('subservers')
+        ends = []
+        for index, (kind, a, b, c, parent, end) in enumerate(self.Nodes()):
+            while ends and ends[-1] == index:
+                ends.pop()
+                writer.End()
+            if kind == USER:
+                writer.Empty(*self.UserElement(a))
+                continue
+            attrs = {'name': self.String(a)}
+            if b != NONE:
+                attrs['password'] = self.String(b)
+            if c != NONE:
+                attrs['sectors'] = self.String(c)
+            if end == index + 1:
+                writer.Empty(TAGS[kind], attrs)
+            else:
+                writer.Start(TAGS[kind], attrs)
+                ends.append(end)
+        while ends:
+            ends.pop()
+            writer.End()
+        writer.End()
+        writer.Start('elevations')
+        for x in range(self.elevationCount):
+            name, privilege, sectors = self.Elevation(x)
+            writer.Empty('elevation', SCHEMA.Attributes(name, int(privilege), sectors))
+        writer.End()
+        globalUsers = self.GlobalUsers()
+        if globalUsers:
+            writer.Start('globalUsers')
+            for x in globalUsers:
+                writer.Empty(*self.UserElement(x))
+            writer.End()
+        else:
+            writer.Empty('globalUsers')
+        writer.Close()
+
+    def UserAttrs(self, x):
+        return dict(zip(('username', 'password', 'sectors', 'global', 'elevation'), self.User(x)))
+
+    def UserElement(self, x):
+        if self.flags & USER_TABLE:
+            return 'member', {'user': str(x)}
+        return 'user', self.UserAttrs(x)
+
+    def Close(self):
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,38 @@
+import gzip
+import zlib
+
+GZIP = '.gz'
+MAGIC = b'\x1f\x8b'
+LEVEL = 1
+ERRORS = (OSError, EOFError, zlib.error)
+
+def IsExp(path):
+    """
+    Whether path names an .exp, compressed (.exp.gz) or not.
+    """
+    path = path.lower()
+    return path.endswith('.exp') or path.endswith('.exp' + GZIP)
+
+def Compressed(path):
+    return path.lower().endswith(GZIP)
+
+def IsGzip(path):
+    with open(path, 'rb') as expFile:
+        return expFile.read(len(MAGIC)) == MAGIC
+
+def OpenExp(path, mode='r', level=LEVEL):
+    """
+    Opens an .exp as text for ElementTree/ExpWriter. Written .exp are gzip compressed when path ends in .gz.
+    .exp are extremely redundant, so even the fastest level shrinks them about fifteenfold at a fraction of
+    the cost of exporting them. Read .exp are decompressed as they are read when they start like a gzip
+    stream, whatever they are named. gzip embeds the CRC32 and size of the content, which are checked once
+    the end of the stream is read, so a damaged or truncated .exp fails to load with one of ERRORS (raised
+    by the read) instead of loading short.
+    """
+    if mode == 'w':
+        if Compressed(path):
+            return gzip.open(path, 'wt', compresslevel=level, encoding='utf-8')
+        return open(path, 'w', encoding='utf-8')
+    if IsGzip(path):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
@@ -0,0 +1,115 @@
+import xml.etree.ElementTree as ET
+
+from ExpFile import ERRORS
+from Privileges import SCHEMA
+
+class ExpReader:
+    """
+    Reads an .exp in a single pass with ElementTree.iterparse, yielding (table, row) pairs in the
+    row format used by the editors as each element is opened. Elements are cleared and detached from
+    their parent once they close, so memory use does not grow with the size of the file (apart from
+    the set of usernames needed to drop the copies of a user placed under several parents).
+    Both export layouts are read: users written under their parents, or a <users> table of users with
+    ids referred to by <member user="id"/> elements, which only need to be checked against the table.
+    Problems are reported through logFunc and leave failed set; the offending element is skipped. A compressed
+    .exp (see ExpFile) which can't be decompressed or fails its checksum fails the whole read.
+    """
+    def __init__(self, expFile, logFunc=lambda text: None, progressEvery=10000):
+        self.expFile = expFile
+        self.logFunc = logFunc
+        self.progressEvery = progressEvery
+        self.failed = False
+        self.count = 0
+
+    def Fail(self, text):
+        self.logFunc(f'LOAD FAILED: {text}')
+        self.failed = True
+
+    def Rows(self):
+        stack = []
+        parents = []
+        usernames = set()
+        userIds = set()
+        subservers = 0
+        elevations = 0
+        try:
+            for event, element in ET.iterparse(self.expFile, events=('start', 'end')):
+                if event == 'end':
+                    stack.pop()
+                    if element.tag in ('subserver', 'room'):
+                        parents.pop()
+                    element.clear()
+                    if stack:
+                        stack[-1].remove(element)
+                    continue
+                stack.append(element)
+                tag = element.tag
+                if tag == 'subserver':
+                    subservers += 1
+                    name = element.get('name')
+                    if name is None:
+                        self.Fail(f'Subserver {subservers - 1} has no name attribute.')
+                    else:
+                        yield self.Counted('subserver', [name, element.get('sectors', '')])
+                    parents.append(name)
+                elif tag == 'room':
+                    name = element.get('name')
+                    password = element.get('password')
+                    if name is None:
+                        self.Fail('Room has no name attribute.')
+                    elif password is None:
+                        self.Fail(f"Room '{name}' has no password attribute.")
+                    elif not parents:
+                        self.Fail(f"Room '{name}' is not inside a subserver.")
+                    elif parents[-1] is not None:
+                        yield self.Counted('room', [name, password, parents[-1], element.get('sectors', '')])
+                    parents.append(name)
+                elif tag == 'user':
+                    name = element.get('username')
+                    password = element.get('password')
+                    if name is None:
+                        self.Fail('User has no name attribute.')
+                    elif password is None:
+                        self.Fail(f"User '{name}' has no password attribute.")
+                    else:
+                        if element.get('id') is not None:
+                            userIds.add(element.get('id'))
+                        if name not in usernames:
+                            usernames.add(name)
+                            yield self.Counted('user', [name, password, element.get('sectors', ''), element.get('global', 'False')])
+                elif tag == 'member':
+                    if element.get('user') not in userIds:
+                        self.Fail(f"Member '{element.get('user')}' does not refer to a user in the user table.")
+                elif tag == 'elevation':
+                    elevations += 1
+                    row = self.Elevation(element, elevations - 1)
+                    if row:
+                        yield self.Counted('elevation', row)
+        except ET.ParseError as e:
+            if self.count == 0 and not stack:
+                self.Fail(f"'{getattr(self.expFile, 'name', self.expFile)}' is empty or is not an EXP.")
+            else:
+                self.Fail(f'Could not parse EXP ({e}).')
+            return
+        except ERRORS as e:
+            self.Fail(f"Could not read '{getattr(self.expFile, 'name', self.expFile)}' ({e}).")
+            return
+        if not subservers:
+            self.Fail('The selected EXP has no subservers.')
+
+    def Elevation(self, element, index):
+        name = element.get('name')
+        if name is None:
+            self.Fail(f'Elevation {index} has no name attribute.')
+            return None
+        mask = SCHEMA.Parse(element.get('privilege'), element.get('extendedPrivilege'))
+        if mask is None:
+            self.Fail(f"Elevation '{name}' has no valid privilege attribute.")
+            return None
+        return [name] + SCHEMA.Decode(mask) + [element.get('sectors', '')]
+
+    def Counted(self, table, row):
+        self.count += 1
+        if self.count % self.progressEvery == 0:
+            self.logFunc(f'Loaded {self.count} entities...')
+        return table, row
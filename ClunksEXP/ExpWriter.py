@@ -0,0 +1,48 @@
+ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#09;'})
+
+class ExpWriter:
+    """
+    An incremental XML writer for .exp documents. Tags are written as soon as they are opened and
+    output is collected into a small buffer which is handed to the underlying file whenever it fills,
+    so the only state kept is the stack of open tags. The output matches ElementTree.tostring for
+    the same document (attributes in insertion order, empty elements written as <tag ... />).
+    """
+    def __init__(self, expFile, bufferSize=1 << 16):
+        self.expFile = expFile
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.open = []
+
+    def Tag(self, tag, attrs):
+        if not attrs:
+            return f'<{tag}'
+        return f'<{tag} ' + ' '.join([f'{key}="{value.translate(ESCAPES)}"' for key, value in attrs.items()])
+
+    def Start(self, tag, attrs=None):
+        self.Write(self.Tag(tag, attrs) + '>')
+        self.open.append(tag)
+
+    def Empty(self, tag, attrs=None):
+        self.Write(self.Tag(tag, attrs) + ' />')
+
+    def End(self):
+        self.Write(f'</{self.open.pop()}>')
+
+    def Write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.bufferSize:
+            self.Flush()
+
+    def Flush(self):
+        self.expFile.write(''.join(self.buffer))
+        self.written += self.buffered
+        self.buffer = []
+        self.buffered = 0
+
+    def Close(self):
+        while self.open:
+            self.End()
+        self.Flush()
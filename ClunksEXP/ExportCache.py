@@ -0,0 +1,124 @@
+import tempfile
+
+from Exporter import SUBSERVER
+
+class ExportCache:
+    """
+    Keeps what an incremental export needs from the last export: the rendered XML of each subserver, spilled
+    to a temp file so it is not held in memory, and the dependency edges used to work out which subservers
+    an edit can reach. These are, for every sector, the subservers holding an entity registered under it,
+    and the row each room, subserver and user had, along with the elevation each user was given.
+    """
+    def __init__(self):
+        self.fragments = {}
+        self.fragmentFile = None
+        self.storing = None
+        self.sectorRoots = {}
+        self.roomRows = {}
+        self.roomRoots = {}
+        self.subserverRows = {}
+        self.userRows = {}
+        self.userElevations = {}
+        self.lastSubserver = None
+
+    def Begin(self):
+        self.storing = ({}, tempfile.TemporaryFile())
+
+    def Fragment(self, name):
+        start, length = self.fragments[name]
+        self.fragmentFile.seek(start)
+        return self.fragmentFile.read(length).decode('utf-8')
+
+    def Store(self, name, text):
+        fragments, fragmentFile = self.storing
+        data = text.encode('utf-8')
+        fragmentFile.seek(0, 2)
+        fragments[name] = (fragmentFile.tell(), len(data))
+        fragmentFile.write(data)
+
+    def Abort(self):
+        if self.storing:
+            self.storing[1].close()
+            self.storing = None
+
+    def Commit(self, exporter):
+        """
+        Replaces the fragments with the ones stored since Begin() and records the edges of the exported tables.
+        """
+        self.Close()
+        self.fragments, self.fragmentFile = self.storing
+        self.storing = None
+        roots = [subserver[0] for subserver in exporter.subservers]
+        self.sectorRoots = {}
+        for sector, entities in exporter.sectors.sectorToSubserver.items():
+            self.sectorRoots.setdefault(sector, set()).update([roots[x] for x in entities])
+        for sector, entities in exporter.sectors.sectorToRoom.items():
+            self.sectorRoots.setdefault(sector, set()).update([roots[exporter.roomRoots[x]] for x in entities])
+        self.roomRows = {room[0]: room for room in exporter.rooms}
+        self.roomRoots = {room: roots[exporter.roomRoots[x]] for room, x in exporter.nameToRoom.items()}
+        self.subserverRows = {subserver[0]: subserver for subserver in exporter.subservers}
+        self.userRows = {user[0]: user for user in exporter.users}
+        self.userElevations = dict(zip([user[0] for user in exporter.users], exporter.userElevations))
+        self.lastSubserver = roots[-1]
+
+    def Sectors(self, sectors):
+        """
+        Every key a sector string can be registered under: each of its sectors, stripped, and the whole string
+        (which is how sectors are inherited by parents with no sectors of their own).
+        """
+        keys = {sector.strip() for sector in sectors.split(',')}
+        keys.add(sectors.strip())
+        return keys
+
+    def Dirty(self, exporter, changed):
+        """
+        Returns the indexes of the subservers in an indexed Exporter which have to be rendered again after the
+        changes tracked by the store, or None if everything does.
+        """
+        if self.fragmentFile is None or exporter.subservers[-1][0] != self.lastSubserver:
+            return None
+        names = set()
+        sectors = set()
+        #The first sectored room under a subserver with no sectors registers the last subserver instead.
+        if changed['subserver']:
+            names.add(self.lastSubserver)
+        for key in changed['subserver']:
+            names.add(key)
+            if key in self.subserverRows:
+                sectors |= self.Sectors(self.subserverRows[key][1])
+            if key in exporter.nameToSubserver:
+                sectors |= self.Sectors(exporter.subservers[exporter.nameToSubserver[key]][1])
+        for key in changed['room']:
+            if key in self.roomRows:
+                names.add(self.roomRoots[key])
+                sectors |= self.Sectors(self.roomRows[key][3])
+                if self.roomRows[key][2] in self.subserverRows:
+                    names.add(self.lastSubserver)
+            if key in exporter.nameToRoom:
+                index = exporter.nameToRoom[key]
+                names.add(exporter.subservers[exporter.roomRoots[index]][0])
+                sectors |= self.Sectors(exporter.rooms[exporter.roomOrder[index]][3])
+                if exporter.roomParents[index][0] == SUBSERVER:
+                    names.add(self.lastSubserver)
+        users = set(changed['user'])
+        if changed['elevation']:
+            users.update([user[0] for x, user in enumerate(exporter.users) if self.userElevations.get(user[0]) != exporter.userElevations[x]])
+        if users:
+            for user in exporter.users:
+                if user[0] in users:
+                    sectors |= self.Sectors(user[2])
+            for key in users:
+                if key in self.userRows:
+                    sectors |= self.Sectors(self.userRows[key][2])
+        roots = set()
+        for sector in sectors:
+            names |= self.sectorRoots.get(sector, set())
+            roots |= exporter.SectorRoots(sector)
+        roots.update([exporter.nameToSubserver[name] for name in names if name in exporter.nameToSubserver])
+        roots.update([x for x, subserver in enumerate(exporter.subservers) if subserver[0] not in self.fragments])
+        return roots
+
+    def Close(self):
+        if self.fragmentFile is not None:
+            self.fragmentFile.close()
+            self.fragmentFile = None
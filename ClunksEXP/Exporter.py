@@ -0,0 +1,518 @@
+from array import array
+import concurrent.futures
+import io
+import xml.etree.ElementTree as ET
+
+from ExpWriter import ExpWriter
+from Instrumentation import Tracer
+from Privileges import SCHEMA
+from SectorIndex import SectorIndex, SUBSERVER, ROOM
+
+NESTED = 'nested'
+USERS = 'users'
+LAYOUTS = (NESTED, USERS)
+
+class ExportError(Exception):
+    pass
+
+class ExportCancelled(ExportError):
+    pass
+
+worker = None
+
+def StartWorker(exporter):
+    global worker
+    worker = exporter
+    worker.tracer = Tracer()
+    worker.cancelled = None
+    worker.progressFunc = None
+
+def RenderChunk(roots, users):
+    return worker.RenderChunk(roots, users)
+
+class Exporter:
+    """
+    Builds the .exp document from the four entity tables held by IOManager.
+    All the lookups are done against indexes built once up front: hashed name sets, a parent/child
+    forest of the rooms and, for each sector, the entities registered under it along with whether
+    they are the lowest such entity in their subtree. Placing a user is then a walk over its own
+    sectors rather than over the whole document. Sector registration is resolved by a SectorIndex,
+    which follows the original exporter exactly so that the output is unchanged.
+    Placement only records user indexes against entity ids (subservers first, then rooms), so the
+    document can either be built as an ElementTree with Build() or streamed out with Write().
+    In the NESTED layout (what the server reads) a copy of each user is written under every entity it is
+    placed in. The USERS layout writes each user once, numbered by id, in a <users> table ahead of the
+    subservers, and only a <member user="id"/> reference under the entities and in <globalUsers>.
+    """
+    def __init__(self, subservers, rooms, elevations, users, tracer=None, cancelled=None, progressFunc=None, layout=NESTED):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}'.")
+        self.layout = layout
+        self.tracer = tracer or Tracer()
+        self.cancelled = cancelled
+        self.progressFunc = progressFunc
+        self.subservers = subservers
+        self.rooms = rooms
+        self.elevations = elevations
+        self.users = users
+        self.sectors = SectorIndex()
+        self.sectorToElevation = {}
+        self.placements = {}
+        self.elementSectors = {}
+        self.elementUsers = {}
+        self.roots = None
+
+    def __getstate__(self):
+        #Workers which aren't forked are sent the indexes but not what only the exporting process can use.
+        state = dict(self.__dict__)
+        state.update(tracer=None, cancelled=None, progressFunc=None, placements={}, elementSectors={}, elementUsers={})
+        return state
+
+    def Prepare(self, roots=None):
+        self.Index()
+        self.Place(roots)
+
+    def Index(self):
+        with self.tracer.Span('index', subservers=len(self.subservers), rooms=len(self.rooms), elevations=len(self.elevations), users=len(self.users)):
+            self.IndexSubservers()
+            self.IndexRooms()
+            with self.tracer.Span('sectors') as span:
+                self.sectors.Resolve(self.subservers, self.rooms, self.roomOrder, self.roomParents)
+                span.Count(sectors=len(self.sectors.sectorToSubserver.keys() | self.sectors.sectorToRoom.keys()))
+            self.IndexElevations()
+            self.IndexUsers()
+
+    def Place(self, roots=None, users=None):
+        """
+        Places the non-global users. Given a set of subserver indexes, only the entities under those subservers
+        are filled in, which is all an incremental export needs to re-render them. users, ascending user indexes,
+        limits placement to those users; any user placed under roots must be among them.
+        """
+        self.roots = roots
+        with self.tracer.Span('placement', subservers=len(self.subservers) if roots is None else len(roots)) as span:
+            for count, x in enumerate(range(len(self.users)) if users is None else users):
+                if count % 10000 == 0:
+                    self.Check()
+                user = self.users[x]
+                if user[3] != 'True':
+                    for entity in self.PlaceUser(user):
+                        try:
+                            self.elementUsers[entity].append(x)
+                        except KeyError:
+                            self.elementUsers[entity] = array('L', [x])
+            span.Count(users=len(self.users), placements=sum(map(len, self.elementUsers.values())))
+
+    def NumberUsers(self):
+        """
+        Gives the users which are placed somewhere or global the ids they are written with in the USERS layout,
+        in the order of the user table.
+        """
+        placed = bytearray(len(self.users))
+        for users in self.elementUsers.values():
+            for x in users:
+                placed[x] = 1
+        for x in self.globalUsers:
+            placed[x] = 1
+        self.userIds = {}
+        for x in range(len(self.users)):
+            if placed[x]:
+                self.userIds[x] = str(len(self.userIds))
+
+    def Build(self):
+        self.Prepare()
+        root = ET.Element('root')
+        if self.layout == USERS:
+            self.NumberUsers()
+            userRoot = ET.SubElement(root, 'users')
+            for x in self.userIds:
+                ET.SubElement(userRoot, 'user', self.TableUserAttrs(x))
+        subserverRoot = ET.SubElement(root, 'subservers')
+        elements = [ET.SubElement(subserverRoot, 'subserver', {'name': subserver[0]}) for subserver in self.subservers]
+        for index, row in enumerate(self.roomOrder):
+            room = self.rooms[row]
+            kind, parent = self.roomParents[index]
+            parentElement = elements[parent if kind == SUBSERVER else self.roomBase + parent]
+            elements.append(ET.SubElement(parentElement, 'room', {'name': room[0], 'password': room[1]}))
+        elevationRoot = ET.SubElement(root, 'elevations')
+        for x in range(len(self.elevations)):
+            ET.SubElement(elevationRoot, 'elevation', self.ElevationAttrs(x))
+        globalUserRoot = ET.SubElement(root, 'globalUsers')
+        for x in self.globalUsers:
+            ET.SubElement(globalUserRoot, *self.UserElement(x))
+        for entity, users in self.elementUsers.items():
+            for x in users:
+                ET.SubElement(elements[entity], *self.UserElement(x))
+        for entity, element in enumerate(elements):
+            attrs = self.EntityAttrs(entity)
+            if 'sectors' in attrs:
+                element.set('sectors', attrs['sectors'])
+        return root
+
+    def Write(self, expFile, cache=None, roots=None, placeAll=False, workers=None):
+        """
+        Streams the document to expFile. Only the stack of currently open rooms is held by the writer,
+        so nothing proportional to the size of the document is built in memory.
+        With an ExportCache, each subserver is rendered on its own and stored in the cache, and subservers
+        outside roots are copied from the cache of the last export instead of being placed and rendered.
+        With placeAll they are still placed, for anything else which needs the placement of every user.
+        The USERS layout can't be cached, as the ids of the users change with the user table.
+        With workers, the subservers are placed and rendered by that many processes (see Fragments) and
+        written here in order. Only the NESTED layout can be, as the USERS layout numbers every user up front.
+        """
+        if (cache is not None or workers) and self.layout != NESTED:
+            raise ExportError(f'The {self.layout} layout cannot be exported incrementally or in parallel.')
+        if cache is None:
+            self.Index()
+            roots = None
+        if placeAll or not workers:
+            self.Place(None if placeAll else roots)
+        fragments = self.Fragments(roots, workers) if workers else None
+        with self.tracer.Span('serialization', subservers=len(self.subservers), layout=self.layout) as span:
+            writer = ExpWriter(expFile)
+            writer.Start('root')
+            if self.layout == USERS:
+                self.NumberUsers()
+                writer.Start('users')
+                for x in self.userIds:
+                    writer.Empty('user', self.TableUserAttrs(x))
+                writer.End()
+            writer.Start('subservers')
+            try:
+                for x in range(len(self.subservers)):
+                    self.Check()
+                    if self.progressFunc:
+                        self.progressFunc(x, len(self.subservers))
+                    if cache is None and fragments is None:
+                        self.WriteEntity(writer, x)
+                        continue
+                    name = self.subservers[x][0]
+                    if roots is not None and x not in roots:
+                        text = cache.Fragment(name)
+                    else:
+                        text = next(fragments) if fragments is not None else self.Render(x)
+                    if cache is not None:
+                        cache.Store(name, text)
+                    writer.Write(text)
+            finally:
+                if fragments is not None:
+                    fragments.close()
+            writer.End()
+            writer.Start('elevations')
+            for x in range(len(self.elevations)):
+                writer.Empty('elevation', self.ElevationAttrs(x))
+            writer.End()
+            if self.globalUsers:
+                writer.Start('globalUsers')
+                for x in self.globalUsers:
+                    writer.Empty(*self.UserElement(x))
+                writer.End()
+            else:
+                writer.Empty('globalUsers')
+            writer.End()
+            writer.Close()
+            span.Count(characters=writer.written, cached=0 if roots is None else len(self.subservers) - len(roots))
+
+    def Partition(self, roots, chunks):
+        """
+        Splits the subservers (those in roots, if given) into at most chunks runs of consecutive subservers of
+        about the same size, counting their rooms and the users placed under them. Returns a list of
+        (subservers, users) with the ascending indexes of the users each run needs to be placed, which are
+        found through the subservers holding the sectors of each user without placing anyone.
+        """
+        selected = list(range(len(self.subservers))) if roots is None else sorted(roots)
+        sizes = dict.fromkeys(selected, 1)
+        for root in self.roomRoots:
+            if root in sizes:
+                sizes[root] += 1
+        subserverUsers = {x: array('L') for x in selected}
+        sectorRoots = {}
+        for x, user in enumerate(self.users):
+            if user[3] == 'True':
+                continue
+            userRoots = set()
+            for sector in self.sectors.Split(user[2]):
+                found = sectorRoots.get(sector)
+                if found is None:
+                    found = sectorRoots[sector] = self.SectorRoots(sector).intersection(subserverUsers)
+                userRoots.update(found)
+            for root in userRoots:
+                subserverUsers[root].append(x)
+                sizes[root] += 1
+        target = sum(sizes.values()) / chunks
+        partition = []
+        run = []
+        size = 0
+        for x in selected:
+            run.append(x)
+            size += sizes[x]
+            if size >= target or x == selected[-1]:
+                users = set()
+                for root in run:
+                    users.update(subserverUsers[root])
+                partition.append((run, array('L', sorted(users))))
+                run = []
+                size = 0
+        return partition
+
+    def Fragments(self, roots, workers):
+        """
+        Yields the rendered subservers (those in roots, if given) in order, placed and rendered by a pool of
+        workers processes. Each worker gets a copy of the indexes, shared with this process where processes are
+        forked, and places only the users of the runs of subservers it is given (see Partition). The runs are
+        several times more than the workers so they even out, and are yielded as soon as every run before them
+        is done. Closing the generator drops the runs which haven't started.
+        """
+        with self.tracer.Span('partition', workers=workers) as span:
+            partition = self.Partition(roots, workers * 4)
+            span.Count(chunks=len(partition))
+        if not partition:
+            return
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=StartWorker, initargs=(self,))
+        try:
+            futures = [executor.submit(RenderChunk, run, users) for run, users in partition]
+            for future in futures:
+                yield from future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def RenderChunk(self, roots, users):
+        """
+        Places users under a run of subservers and returns the subservers rendered, in a worker process.
+        """
+        self.placements = {}
+        self.elementSectors = {}
+        self.elementUsers = {}
+        self.Place(set(roots), users)
+        return [self.Render(x) for x in roots]
+
+    def WriteEntity(self, writer, entity):
+        stack = [(entity, None)]
+        while stack:
+            entity, children = stack.pop()
+            if children is None:
+                tag = 'subserver' if entity < self.roomBase else 'room'
+                children = self.subserverChildren[entity] if entity < self.roomBase else self.roomChildren[entity - self.roomBase]
+                users = self.elementUsers.get(entity, ())
+                if not children and not users:
+                    writer.Empty(tag, self.EntityAttrs(entity))
+                    continue
+                writer.Start(tag, self.EntityAttrs(entity))
+                children = iter(children)
+            child = next(children, None)
+            if child is not None:
+                stack.append((entity, children))
+                stack.append((self.roomBase + child, None))
+                continue
+            for x in self.elementUsers.get(entity, ()):
+                writer.Empty(*self.UserElement(x))
+            writer.End()
+
+    def Check(self):
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise ExportCancelled('Cancelled.')
+
+    def Render(self, entity):
+        fragment = io.StringIO()
+        writer = ExpWriter(fragment)
+        self.WriteEntity(writer, entity)
+        writer.Close()
+        return fragment.getvalue()
+
+    def Root(self, entity):
+        return entity if entity < self.roomBase else self.roomRoots[entity - self.roomBase]
+
+    def SectorRoots(self, sector):
+        """
+        Returns the indexes of the subservers holding an entity registered under a sector.
+        """
+        roots = set(self.sectors.sectorToSubserver.get(sector, ()))
+        roots.update([self.roomRoots[x] for x in self.sectors.sectorToRoom.get(sector, ())])
+        return roots
+
+    def EntityAttrs(self, entity):
+        if entity < self.roomBase:
+            attrs = {'name': self.subservers[entity][0]}
+        else:
+            room = self.rooms[self.roomOrder[entity - self.roomBase]]
+            attrs = {'name': room[0], 'password': room[1]}
+        if entity in self.elementSectors:
+            attrs['sectors'] = ','.join(self.elementSectors[entity])
+        return attrs
+
+    def ElevationAttrs(self, x):
+        elevation = self.elevations[x]
+        return SCHEMA.Attributes(elevation[0], self.privileges[x], elevation[len(elevation) - 1])
+
+    def UserAttrs(self, x):
+        user = self.users[x]
+        return {'username': user[0], 'password': user[1], 'sectors': user[2], 'global': user[3], 'elevation': self.userElevations[x]}
+
+    def TableUserAttrs(self, x):
+        attrs = {'id': self.userIds[x]}
+        attrs.update(self.UserAttrs(x))
+        return attrs
+
+    def UserElement(self, x):
+        """
+        Returns the tag and attributes of the element placing a user under an entity or in <globalUsers>.
+        """
+        if self.layout == USERS:
+            return 'member', {'user': self.userIds[x]}
+        return 'user', self.UserAttrs(x)
+
+    def IndexSubservers(self):
+        if not self.subservers:
+            raise ExportError('There are no subservers.')
+        self.subserverNames = set()
+        self.nameToSubserver = {}
+        for x, subserver in enumerate(self.subservers):
+            name = subserver[0].lower().strip()
+            if name in self.subserverNames:
+                raise ExportError('Subserver names must be unique.')
+            self.subserverNames.add(name)
+            self.nameToSubserver[subserver[0]] = x
+
+    def IndexRooms(self):
+        roomNames = set()
+        nameToRow = {}
+        children = {}
+        topLevel = []
+        for x, room in enumerate(self.rooms):
+            name = room[0].lower().strip()
+            if name in roomNames or name in self.subserverNames:
+                raise ExportError('Room/subserver names must be unique.')
+            roomNames.add(name)
+            nameToRow[room[0]] = x
+            if room[2] in self.nameToSubserver:
+                topLevel.append(x)
+            else:
+                children.setdefault(room[2], []).append(x)
+        for parent, rows in children.items():
+            if parent not in nameToRow:
+                raise ExportError(f"Parent of room '{self.rooms[rows[0]][0]}' does not exist.")
+
+        #Rooms are numbered in the order the original exporter created them: rooms with subserver parents
+        #first, then rooms with room parents in table order. A room listed before its parent waits for it.
+        self.roomBase = len(self.subservers)
+        self.roomOrder = []
+        self.roomParents = []
+        self.roomChildren = []
+        self.roomRoots = []
+        self.subserverChildren = [[] for subserver in self.subservers]
+        self.nameToRoom = nameToRoom = {}
+        for x in topLevel:
+            self.AddRoom(x, (SUBSERVER, self.nameToSubserver[self.rooms[x][2]]), nameToRoom)
+        waiting = {}
+        for x in range(len(self.rooms)):
+            room = self.rooms[x]
+            if room[2] in self.nameToSubserver:
+                continue
+            if room[2] not in nameToRoom:
+                waiting.setdefault(room[2], []).append(x)
+                continue
+            pending = [x]
+            while pending:
+                row = pending.pop(0)
+                self.AddRoom(row, (ROOM, nameToRoom[self.rooms[row][2]]), nameToRoom)
+                pending = waiting.pop(self.rooms[row][0], []) + pending
+        if waiting:
+            raise ExportError(f"Parent of room '{self.rooms[next(iter(waiting.values()))[0]][0]}' does not exist.")
+
+    def AddRoom(self, row, parent, nameToRoom):
+        room = self.rooms[row]
+        index = len(self.roomOrder)
+        self.roomOrder.append(row)
+        self.roomParents.append(parent)
+        self.roomChildren.append([])
+        nameToRoom[room[0]] = index
+        kind, parentIndex = parent
+        self.roomRoots.append(parentIndex if kind == SUBSERVER else self.roomRoots[parentIndex])
+        if kind == ROOM:
+            self.roomChildren[parentIndex].append(index)
+        else:
+            self.subserverChildren[parentIndex].append(index)
+
+    def IndexElevations(self):
+        if not self.elevations:
+            raise ExportError('There are no elevations.')
+        elevationNames = set()
+        self.privileges = SCHEMA.EncodeMany(self.elevations)
+        for x, elevation in enumerate(self.elevations):
+            name = elevation[0].lower().strip()
+            if name in elevationNames:
+                raise ExportError('Elevation names must be unique.')
+            elevationNames.add(name)
+            for sector in elevation[len(elevation) - 1].split(','):
+                self.sectorToElevation[sector] = x
+
+    def IndexUsers(self):
+        usernames = set()
+        self.userElevations = []
+        self.globalUsers = []
+        for x, user in enumerate(self.users):
+            name = user[0].lower().strip()
+            if name in usernames:
+                raise ExportError('Usernames must be unique.')
+            usernames.add(name)
+            elevation = None
+            for sector in user[2].split(','):
+                if sector in self.sectorToElevation:
+                    if elevation is not None:
+                        raise ExportError(f"Elevation conflict on user '{user[0]}'.")
+                    elevation = self.sectorToElevation[sector]
+            if elevation is None:
+                raise ExportError(f"No elevation apllied to user '{user[0]}'.")
+            self.userElevations.append(self.elevations[elevation][0])
+            if user[3] == 'True':
+                self.globalUsers.append(x)
+
+    def Placements(self, sector):
+        """
+        Returns the subserver and room entity ids registered under a sector, each paired with whether it
+        is a lowest parent for the sector (no room below it is registered under the same sector).
+        """
+        try:
+            return self.placements[sector]
+        except KeyError:
+            pass
+        rooms = self.sectors.sectorToRoom.get(sector, [])
+        coveredRooms = set()
+        coveredSubservers = set()
+        for index in set(rooms):
+            while True:
+                kind, parent = self.roomParents[index]
+                if kind == SUBSERVER:
+                    coveredSubservers.add(parent)
+                    break
+                if parent in coveredRooms:
+                    break
+                coveredRooms.add(parent)
+                index = parent
+        subserverPlacements = [(x, x not in coveredSubservers) for x in self.sectors.sectorToSubserver.get(sector, [])]
+        roomPlacements = [(self.roomBase + x, x not in coveredRooms) for x in rooms]
+        if self.roots is not None:
+            subserverPlacements = [placement for placement in subserverPlacements if placement[0] in self.roots]
+            roomPlacements = [placement for placement in roomPlacements if self.roomRoots[placement[0] - self.roomBase] in self.roots]
+        self.placements[sector] = (subserverPlacements, roomPlacements)
+        return self.placements[sector]
+
+    def AppendSector(self, entity, sector):
+        parts = self.elementSectors.setdefault(entity, [])
+        if len(parts) == 1 and not parts[0]:
+            parts[0] = sector
+        else:
+            parts.append(sector)
+
+    def PlaceUser(self, user):
+        counts = {}
+        for sector in self.sectors.Split(user[2]):
+            if self.sectors.Registered(sector):
+                counts[sector] = counts.get(sector, 0) + 1
+        parents = []
+        for sector, count in counts.items():
+            subserverPlacements, roomPlacements = self.Placements(sector)
+            for entity, lowest in subserverPlacements * count + roomPlacements * count:
+                self.AppendSector(entity, sector)
+                if lowest:
+                    parents.append(entity)
+        return parents
@@ -0,0 +1,98 @@
+import concurrent.futures
+import os
+import threading
+
+DEFAULT_COST = 12
+
+def HashChunk(passwords, cost):
+    import bcrypt
+    salt = bcrypt.gensalt
+    return [bcrypt.hashpw(password.encode('utf-8'), salt(rounds=cost)).decode('utf-8') if password else '' for password in passwords]
+
+def HashPassword(password, cost=DEFAULT_COST):
+    return HashChunk([password], cost)[0]
+
+class HashPool:
+    """
+    A process pool for bcrypt hashing, so that hashing never runs on the Tk thread: single passwords
+    from the editors are hashed with Submit(), and
+    whole columns from bulk imports with HashMany(), which splits the work into chunks so throughput
+    scales with the number of cores. bcrypt is only imported inside the workers.
+    """
+    def __init__(self, workers=None, cost=DEFAULT_COST):
+        self.workers = workers or os.cpu_count() or 1
+        self.cost = cost
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def Executor(self):
+        with self.lock:
+            if not self.executor:
+                self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def Submit(self, password):
+        return self.Executor().submit(HashPassword, password, self.cost)
+
+    def HashMany(self, passwords, progressFunc=None, cancelled=None):
+        """
+        Hashes a list of passwords, returning the hashes in the same order. Empty passwords stay empty.
+        progressFunc is called with (done, total) as chunks complete; if the cancelled event is set the
+        remaining chunks are dropped and None is returned.
+        """
+        passwords = list(passwords)
+        total = len(passwords)
+        if not total:
+            return []
+        size = max(1, min(64, total // (self.workers * 4)))
+        executor = self.Executor()
+        futures = {executor.submit(HashChunk, passwords[x:x + size], self.cost): x for x in range(0, total, size)}
+        hashes = [None] * total
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            if cancelled is not None and cancelled.is_set():
+                for pending in futures:
+                    pending.cancel()
+                return None
+            start = futures[future]
+            chunk = future.result()
+            hashes[start:start + len(chunk)] = chunk
+            done += len(chunk)
+            if progressFunc:
+                progressFunc(done, total)
+        return hashes
+
+    def HashRows(self, rows, column=1, progressFunc=None, cancelled=None):
+        """
+        Replaces the plaintext password held in column of each row with its hash, in place.
+        """
+        hashes = self.HashMany([row[column] for row in rows], progressFunc, cancelled)
+        if hashes is None:
+            return False
+        for row, hashed in zip(rows, hashes):
+            row[column] = hashed
+        return True
+
+    def Close(self):
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+pool = None
+
+def GetPool():
+    global pool
+    if pool is None:
+        pool = HashPool()
+    return pool
+
+def Configure(workers=None, cost=DEFAULT_COST):
+    global pool
+    Shutdown()
+    pool = HashPool(workers, cost)
+    return pool
+
+def Shutdown():
+    if pool is not None:
+        pool.Close()
@@ -1,337 +1,263 @@
-import os
-import pickle
-import tempfile
-from tkinter import messagebox
 import xml.etree.ElementTree as ET
 
-from ThreadingHelper import QUIT
-
-NUM_PRIV = 9
+from EntityStore import EntityStore, TABLES
+from ExpReader import ExpReader
+from Exporter import Exporter, ExportError, ExportCancelled, NESTED
+from ExpBinary import OpenSidecar, WriteSidecar
+from ExpFile import Compressed
+from ExportCache import ExportCache
+from Importer import Importer
+from Instrumentation import Tracer
+from Sources import WriteJson
+from Validator import Validator
 
 class IOManager:
-    def __init__(self):
-        self.storage = {'user': tempfile.TemporaryFile(), 'subserver': tempfile.TemporaryFile(), 'room': tempfile.TemporaryFile(), 'elevation': tempfile.TemporaryFile()}
+    """
+    Holds the entity tables of a session and reads and writes them as .exp, JSON and other sources.
+    Every phase of the work (parse, index, sectors, placement, serialization, storage.read/write/delete)
+    is reported to self.tracer as a span; give it sinks to collect them.
+    With session, the tables are kept in a session store (see EntityStore) which can be recovered with
+    Recover() after a crash.
+    """
+    def __init__(self, tracer=None, session=False):
+        self.tracer = tracer or Tracer()
+        self.session = session
+        self.storage = self.NewStorage()
+        self.exportCache = ExportCache()
 
-    def Cleanup(self):
-        for f in self.storage.values():
-            f.close()
+    def NewStorage(self, path=None):
+        return EntityStore(path, self.session)
 
-    def Save(self, fileObj, values):
-        fileObj.seek(0)
-        fileObj.write(pickle.dumps(values))
+    def Recover(self, path):
+        """
+        Replaces the tables with those of a session store left behind by a crash, which this session takes
+        over, returning the number of rows of each table.
+        """
+        with self.tracer.Span('recover') as span:
+            self.Swap(self.NewStorage(path))
+            counts = {table: self.storage[table].Count() for table in TABLES}
+            span.Count(rows=sum(counts.values()))
+        return counts
 
-    def ReadAll(self, fileObj):
-        fileObj.seek(0)
-        data = fileObj.read()
-        if data:
-            return pickle.loads(data)
-        else:
-            return []
+    def Swap(self, storage):
+        """
+        Puts storage in place of the current store, which is closed.
+        """
+        previous, self.storage = self.storage, storage
+        previous.Close()
+        #Nothing in the new store has been exported by this session.
+        self.storage.cleared.update(TABLES)
 
-    def LoadTemp(self, fileObj):
-        try:
-            return self.ReadAll(fileObj)
-        except:
-            messagebox.showerror('Oh no!', 'Data has been corrupted, please restart the program.')
-            QUIT.set()
+    def Cleanup(self):
+        self.exportCache.Close()
+        self.storage.Close()
 
-    def LoadExp(self, logFunc, expFile):
-        failed = False
+    def Save(self, table, values):
+        with self.tracer.Span('storage.write', table=table.kind, rows=len(values), replace=True):
+            table.Replace(values)
 
-        def LoadUsers(users):
-            global failed
-            for user in users:
-                username = user.get('username', -1)
-                if username == -1:
-                    logFunc(f'LOAD FAILED: User has no name attribute.')
-                    failed = True
-                userPwd = user.get('password', -1)
-                if userPwd == -1:
-                    logFunc(f'LOAD FAILED: User has no password attribute.')
-                    failed = True
-                userSectors = user.get('sectors', [])
-                if not isinstance(userSectors, list):
-                    userSectors = [userSectors]
-                userList = [[username, userPwd, userSectors, user.get('global')]]
-                self.storage['user'].write(pickle.dumps(userList))
-                failed = False
+    def Append(self, table, values):
+        with self.tracer.Span('storage.write', table=table.kind, rows=len(values)):
+            table.UpsertMany(values)
 
-        def LoadRooms(rooms, parent):
-            global failed
-            for room in rooms:
-                roomName = room.get('name', -1)
-                if roomName == -1:
-                    logFunc(f'LOAD FAILED: Room has no name attribute.')
-                    failed = True
-                roomPwd = room.get('password', -1)
-                if roomName == -1:
-                    logFunc(f'LOAD FAILED: Room has no password attribute.')
-                    failed = True
-                roomSectors = room.get('sectors', [])
-                if not isinstance(roomSectors, list):
-                    roomSectors = [roomSectors]
-                roomList = [[roomName, roomPwd, parent, roomSectors, room.get('global')]]
-                self.storage['room'].write(pickle.dumps(roomList))
-                LoadUsers(room.findall('user'))
-                LoadRooms(room.findall('room'), roomName)
-                failed = False
+    def Apply(self, table, changes):
+        """
+        Writes the edits made in an editor: changes maps each touched key to its new row, or to None if it was removed.
+        """
+        removed = [key for key, row in changes.items() if row is None]
+        if removed:
+            with self.tracer.Span('storage.delete', table=table.kind, rows=len(removed)):
+                table.DeleteMany(removed)
+        self.Append(table, [row for row in changes.values() if row is not None])
 
-        self.Cleanup()
-        self.storage = {'user': tempfile.TemporaryFile(), 'subserver': tempfile.TemporaryFile(), 'room': tempfile.TemporaryFile(), 'elevation': tempfile.TemporaryFile()}
-        data = expFile.read()
-        if not data:
-            logFunc(f"LOAD FAILED: '{expFile.name}' is empty.")
-            failed = True
-        root = ET.fromstring(data)
-        subservers = root.findall('subservers')[0]
-        if not subservers:
-            logFunc('LOAD FAILED: The selected EXP has no subservers.')
-            failed = True
-        for subserver in subservers:
-            subserverName = subserver.get('name', -1)
-            if subserverName == -1:
-                logFunc(f'LOAD FAILED: Subserver {subservers.index(subserver)} has no name attribute.')
-                failed = True
-            subserverSectors = subserver.get('sectors', [])
-            if not isinstance(subserverSectors, list):
-                subserverSectors = [subserverSectors]
-            subserverList = [[subserverName, subserverSectors]]
-            self.storage['subserver'].write(pickle.dumps(subserverList))
-            LoadRooms(subserver.findall('room'), subserverName)
-            LoadUsers(subserver.findall('user'))
+    def ReadAll(self, table):
+        with self.tracer.Span('storage.read', table=table.kind) as span:
+            rows = table.All()
+            span.Count(rows=len(rows))
+        return rows
 
-        #Load elevations
-        elevations = root.findall('elevations')[0]
-        for elevation in elevations:
-            elevationName = elevation.get('name', -1)
-            if elevationName == -1:
-                logFunc(f'LOAD FAILED: Elevation {elevations.index(elevation)} has no name attribute.')
-                failed = True
-            privilege = elevation.get('privilege', -1)
-            if privilege == -1:
-                logFunc(f'LOAD FAILED: Elevation {elevations.index(elevation)} has no privilege attribute.')
-                failed = True
-            privileges = ['True' if i == '1' else 'False' for i in bin(int(privilege))[2:]]
-            while len(privileges) < NUM_PRIV:
-                privileges = ['False'] + privileges
-            elevationSectors = elevation.get('sectors', [])
-            if not isinstance(elevationSectors, list):
-                elevationSectors = [elevationSectors]
-            elevationList = [[elevationName] + privileges + elevationSectors]
-            self.storage['elevation'].write(pickle.dumps(elevationList))
+    def Tables(self):
+        return {table: self.ReadAll(self.storage[table]) for table in self.storage}
 
-        if not failed:
-            logFunc(f"Sucessfully loaded '{expFile.name}'")
+    def Import(self, rows, batchSize=1000, cancelled=None, storage=None):
+        """
+        Appends (table, row) pairs in batches to storage (the current store by default), returning False if the
+        cancelled event was set part way through.
+        """
+        storage = storage or self.storage
+        batches = {table: [] for table in storage}
+        for table, row in rows:
+            batch = batches[table]
+            batch.append(row)
+            if len(batch) >= batchSize:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                self.Append(storage[table], batch)
+                batch.clear()
+        for table, batch in batches.items():
+            if batch:
+                self.Append(storage[table], batch)
+        return True
 
-    def Export(self, logFunc, expFile):
-        noSectorSubservers = {}
-        noSectorRooms = {}
-        sectorToSubserver = {}
-        sectorToRoom = {}
+    def LoadExp(self, logFunc, expFile, cancelled=None):
+        """
+        Replaces the tables with the contents of an .exp, read from its binary sidecar instead when there is
+        one which still matches it. A compressed .exp opened with ExpFile.OpenExp is decompressed as it is
+        parsed and fails to load if its checksum doesn't match.
+        The rows are loaded into a new store which only replaces the current one once all of them were read
+        without a problem: a load which fails or is cancelled part way through leaves the tables as they were.
+        """
+        sidecar = OpenSidecar(getattr(expFile, 'name', None))
+        if sidecar is not None:
+            return self.LoadSidecar(logFunc, expFile, sidecar, cancelled)
+        storage = self.NewStorage()
+        try:
+            with self.tracer.Span('parse', file=getattr(expFile, 'name', None)) as span:
+                reader = ExpReader(expFile, logFunc)
+                finished = self.Import(reader.Rows(), cancelled=cancelled, storage=storage)
+                span.Count(entities=reader.count, failed=reader.failed)
+            if not finished:
+                logFunc(f"LOAD CANCELLED: '{expFile.name}' was not loaded, the tables are unchanged.")
+                return False
+            if reader.failed:
+                logFunc(f"'{expFile.name}' was not loaded, the tables are unchanged.")
+                return False
+            self.Swap(storage)
+            storage = None
+        finally:
+            if storage is not None:
+                storage.Close()
+        logFunc(f"Sucessfully loaded '{expFile.name}'")
+        return True
 
-        def ApplySectorsRecrusive(index, sectors, searchSubservers = False):
-            if searchSubservers:
-                for sector in sectors:
-                    if sector:
-                        try:
-                            sectorToSubserver[sector.strip()].append(index)
-                        except KeyError:
-                            sectorToSubserver[sector.strip()] = [index]
-                del noSectorSubservers[index]
-            else:
-                for sector in sectors:
-                    if sector:
-                        try:
-                            sectorToRoom[sector.strip()].append(index)
-                        except KeyError:
-                            sectorToRoom[sector.strip()] = [index]
-                del noSectorRooms[index]
-                found = False
-                for parent, child in noSectorRooms.items():
-                    if child == index:
-                        ApplySectorsRecrusive(parent, sectors)
-                        found = True
-                        break
-                if not found:
-                    for parent, child in noSectorSubservers.items():
-                        if child == index:
-                            ApplySectorsRecrusive(parent, sectors, True)
-                            break
+    def LoadSidecar(self, logFunc, expFile, sidecar, cancelled=None):
+        storage = self.NewStorage()
+        try:
+            with self.tracer.Span('parse', file=expFile.name, sidecar=True) as span:
+                try:
+                    finished = self.Import(sidecar.Rows(), cancelled=cancelled, storage=storage)
+                finally:
+                    sidecar.Close()
+                span.Count(entities=sum([table.Count() for table in storage.values()]))
+            if not finished:
+                logFunc(f"LOAD CANCELLED: '{expFile.name}' was not loaded, the tables are unchanged.")
+                return False
+            self.Swap(storage)
+            storage = None
+        finally:
+            if storage is not None:
+                storage.Close()
+        logFunc(f"Sucessfully loaded '{expFile.name}'")
+        return True
 
-        subserverNames = []
-        nameToSubserver = {}
-        subserverElements = []
-        entities = self.ReadAll(self.storage['subserver'])
-        subserverRoot = None
-        root = ET.Element('root')
-        if entities:
-            subserverRoot = ET.SubElement(root, 'subservers')
-        else:
-            logFunc('EXPORT FAILED: There are no subservers.')
-            return
+    def ImportFiles(self, logFunc, paths, hashPool=None, mapping=None, replace=False, cancelled=None):
+        """
+        Bulk imports .exp/.json/.jsonl/.ldif/.csv sources into the current tables through an Importer. Passing a HashPool
+        treats the passwords of non-EXP sources as plaintext and hashes them. With replace, rows named like an existing
+        row replace it, otherwise they are skipped.
+        """
+        importer = Importer(self, logFunc, hashPool, mapping, replace)
+        for path in paths:
+            with self.tracer.Span('import', file=path) as span:
+                imported = importer.Import(path, cancelled)
+                span.Count(rows=sum(importer.imported.values()), skipped=importer.skipped, invalid=importer.invalid)
+            if not imported:
+                return False
+            logFunc(f"Sucessfully loaded '{path}'")
+        logFunc(importer.Summary())
+        return True
 
-        for x in range(len(entities)):
-            name = entities[x][0].lower().strip()
-            if name not in subserverNames:
-                subserverNames.append(name)
-            else:
-                logFunc('EXPORT FAILED: Subserver names must be unique.')
-                return
-            subserverElements.append(ET.SubElement(subserverRoot, 'subserver', {'name': entities[x][0]}))
-            nameToSubserver[entities[x][0]] = x
-            if not entities[x][1].split(',')[0]:
-                noSectorSubservers[x] = None
-            else:
-                for sector in entities[x][1].split(','):
-                    if sector:
-                        try:
-                            sectorToSubserver[sector.strip()].append(x)
-                        except KeyError:
-                            sectorToSubserver[sector.strip()] = [x]
+    def LoadSource(self, logFunc, path, hashPool=None, mapping=None):
+        """
+        Merges a source into the current tables, rows with an existing name replacing the old ones.
+        """
+        return self.ImportFiles(logFunc, [path], hashPool, mapping, replace=True)
 
-        roomNames = []
-        nameToRoom = {}
-        roomElements = []
-        processedRooms = []
-        entities = self.ReadAll(self.storage['room'])
-        #Rooms with subserver parents
-        for x in range(len(entities)):
-            name = entities[x][0].lower().strip()
-            if name not in roomNames and name not in subserverNames:
-                roomNames.append(name)
-            else:
-                logFunc('EXPORT FAILED: Room/subserver names must be unique.')
-                return
-            if entities[x][2] in subserverNames:
-                room = entities[x]
-                processedRooms.append(x)
-                roomElements.append(ET.SubElement(subserverElements[nameToSubserver[room[2]]], 'room', {'name': room[0], 'password': room[1]}))
-                nameToRoom[room[0]] = len(roomElements) - 1
-                parentIndex = nameToSubserver[room[2]]
-                if not room[3].split(',')[0]:
-                    if parentIndex in noSectorSubservers.keys():
-                        noSectorSubservers[parentIndex] = len(roomElements) - 1
-                    noSectorRooms[len(roomElements) - 1] = None
-                else:
-                    for sector in room[3].split(','):
-                        if sector:
-                            if parentIndex in noSectorSubservers.keys():
-                                try:
-                                    sectorToSubserver[sector.strip()].append(len(subserverElements) - 1)
-                                except KeyError:
-                                    sectorToSubserver[sector.strip()] = [len(subserverElements) - 1]
-                                del noSectorSubservers[parentIndex]
-                            try:
-                                sectorToRoom[sector.strip()].append(len(roomElements) - 1)
-                            except KeyError:
-                                sectorToRoom[sector.strip()] = [len(roomElements) - 1]
-            elif entities[x][2] not in roomNames:
-                logFunc(f"EXPORT FAILED: Parent of room '{entities[x][0]}' does not exist.")
-                return
+    def SaveJson(self, logFunc, jsonFile):
+        WriteJson(jsonFile, self.Tables())
+        logFunc(f'Saved to: {jsonFile.name}')
 
-        #Rooms with room parents
-        for x in range(len(entities)):
-            if x not in processedRooms:
-                room = entities[x]
-                parent = roomElements[nameToRoom[entities[x][2]]]
-                roomElements.append(ET.SubElement(parent, 'room', {'name': entities[x][0], 'password': entities[x][1]}))
-                nameToRoom[room[0]] = len(roomElements) - 1
-                parentIndex = nameToRoom[room[2]]
-                if not room[3].split(',')[0]:
-                    if parentIndex in noSectorRooms.keys():
-                        noSectorRooms[parentIndex] = len(roomElements) - 1
-                    noSectorRooms[len(roomElements) - 1] = None
-                else:
-                    if parentIndex in noSectorRooms.keys():
-                        if isinstance(room[3], list):
-                            ApplySectorsRecrusive(parentIndex, room[3])
-                        else:
-                            ApplySectorsRecrusive(parentIndex, [room[3]])
-                    for sector in entities[x][3].split(','):
-                        if sector:
-                            try:
-                                sectorToRoom[sector.strip()].append(len(roomElements) - 1)
-                            except KeyError:
-                                sectorToRoom[sector.strip()] = [len(roomElements) - 1]
+    def Exporter(self, cancelled=None, progressFunc=None, layout=NESTED):
+        return Exporter(self.ReadAll(self.storage['subserver']), self.ReadAll(self.storage['room']), self.ReadAll(self.storage['elevation']), self.ReadAll(self.storage['user']),
+                        self.tracer, cancelled, progressFunc, layout)
 
-        elevationNames = []
-        elevationElements = []
-        sectorToElevation = {}
-        elevationRoot = None
-        entities = self.ReadAll(self.storage['elevation'])
-        if entities:
-            elevationRoot = ET.SubElement(root, 'elevations')
-        else:
-            logFunc('EXPORT FAILED: There are no subservers.')
-            return
-        for x in range(len(entities)):
-            name = entities[x][0].lower().strip()
-            if name not in elevationNames:
-                elevationNames.append(name)
-            else:
-                logFunc('EXPORT FAILED: Elevation names must be unique.')
-                return
-            privilege = sum([2**i if j == 'True' else 0 for i, j in enumerate(reversed(entities[x][1:len(entities[x]) - 1]))])
-            attrs = {'name': entities[x][0], 'privilege': str(privilege), 'sectors': entities[x][len(entities[x]) - 1]}
-            elevationElements.append(ET.SubElement(elevationRoot, 'elevation', attrs))
-            for sector in entities[x][len(entities[x]) - 1].split(','):
-                sectorToElevation[sector] = x
+    def Validator(self):
+        return Validator(self.ReadAll(self.storage['subserver']), self.ReadAll(self.storage['room']), self.ReadAll(self.storage['elevation']), self.ReadAll(self.storage['user']))
 
-        usernames = []
-        globalUserRoot = ET.SubElement(root, 'globalUsers')
-        entities = self.ReadAll(self.storage['user'])
-        for user in entities:
-            name = user[0].lower().strip()
-            if name not in usernames:
-                usernames.append(name)
+    def Validate(self, logFunc):
+        """
+        Logs every problem which would stop the tables from exporting.
+        """
+        with self.tracer.Span('validate') as span:
+            validator = self.Validator()
+            span.Count(problems=len(validator.problems))
+        if not validator.Report(logFunc):
+            return False
+        logFunc('Configuration is valid.')
+        return True
+
+    def Export(self, logFunc, expFile, stream=True, incremental=False, cancelled=None, progressFunc=None, sidecar=False, layout=NESTED, workers=None):
+        """
+        Writes the tables out as an .exp. With incremental, the subservers are cached as they are written and
+        the next incremental export only places and renders the subservers reachable from what was changed in
+        the store since, copying the rest from the cache. progressFunc is called with (done, total) subservers
+        as they are written and setting the cancelled event stops the export, leaving expFile incomplete.
+        With sidecar, a binary copy of the .exp which loads much faster (see ExpBinary) is written next to it,
+        unless expFile is compressed (see ExpFile): sidecars are matched against the bytes of their .exp, which
+        a compressed .exp only has once it is closed.
+        layout is one of Exporter.LAYOUTS; only the NESTED layout is exported incrementally, other layouts are
+        always written in full. With more than one workers, the subservers of a streamed NESTED export are
+        placed and rendered by that many processes.
+        """
+        sidecar = sidecar and isinstance(getattr(expFile, 'name', None), str) and not Compressed(expFile.name)
+        try:
+            workers = workers if workers and workers > 1 and stream and layout == NESTED else None
+            with self.tracer.Span('export', incremental=incremental, layout=layout, workers=workers or 1):
+                #Changes are taken before the tables are read: an edit made in between is exported, and then also
+                #re-rendered by the next incremental export, rather than forgotten without being exported.
+                changes = self.storage.Changes()
+                exporter = self.Exporter(cancelled, progressFunc, layout)
+                self.WriteExp(exporter, expFile, stream, incremental and layout == NESTED, sidecar, workers, changes)
+            if sidecar:
+                expFile.flush()
+                with self.tracer.Span('sidecar'):
+                    WriteSidecar(exporter, expFile.name)
+        except ExportCancelled:
+            self.exportCache.Abort()
+            logFunc(f'EXPORT CANCELLED: {expFile.name} is incomplete.')
+            return False
+        except ExportError as e:
+            self.exportCache.Abort()
+            #The exporter stops at the first problem, report all of them.
+            validator = self.Validator()
+            if validator.Valid():
+                logFunc(f'EXPORT FAILED: {e}')
             else:
-                logFunc('EXPORT FAILED: Usernames must be unique.')
-                return
-            elevationName = None
-            for sector in user[2].split(','):
-                if sector in sectorToElevation.keys():
-                    if not elevationName:
-                        userElevation = elevationElements[sectorToElevation[sector]]
-                        elevationName = userElevation.get('name')
-                    else:
-                        logFunc(f"EXPORT FAILED: Elevation conflict on user '{user[0]}'.")
-                        return
-            if elevationName == None:
-                logFunc(f"EXPORT FAILED: No elevation apllied to user '{user[0]}'.")
-                return
-            if user[3] == 'True':
-                ET.SubElement(globalUserRoot, 'user', {'username': user[0], 'password': user[1] , 'sectors': user[2], 'global': user[3], 'elevation': elevationName})
-                continue
-            sectorToParent = {}
-            for sector in user[2].split(','):
-                sector = sector.strip()
-                if sector in sectorToSubserver.keys():
-                    try:
-                        sectorToParent[sector][0] += [subserverElements[index] for index in sectorToSubserver[sector]]
-                    except KeyError:
-                        sectorToParent[sector] = [[subserverElements[index] for index in sectorToSubserver[sector]], []]
-                if sector in sectorToRoom.keys():
-                    try:
-                        sectorToParent[sector][1] += [roomElements[index] for index in sectorToRoom[sector]]
-                    except KeyError:
-                        sectorToParent[sector] = [[], [roomElements[index] for index in sectorToRoom[sector]]]
-            for sector, parents in sectorToParent.items():
-                finalParents = []
-                for parent in parents[0] + parents[1]:
-                    parentSectors = parent.get('sectors')
-                    if not parentSectors:
-                        parentSectors = sector
-                    else:
-                        parentSectors += f',{sector}'
-                    parent.set('sectors', parentSectors)
-                    lowest = True
-                    for child in parent.iter():
-                        if child is not parent and child in parents[1]:
-                            lowest = False
-                    if lowest:
-                        finalParents.append(parent)
-                for parent in finalParents:
-                    ET.SubElement(parent, 'user', {'username': user[0], 'password': user[1] , 'sectors': user[2], 'global': user[3], 'elevation': elevationName})
+                validator.Report(logFunc, 'EXPORT FAILED')
+            return False
+        logFunc(f'Exported to: {expFile.name}')
+        return True
 
-        expFile.write(ET.tostring(root).decode())
-        logFunc(f'Exported to: {expFile.name}')
\ No newline at end of file
+    def WriteExp(self, exporter, expFile, stream, incremental, placeAll=False, workers=None, changes=None):
+        """
+        changes is the snapshot of storage.Changes() taken before exporter read the tables, taken now if None.
+        """
+        if not incremental:
+            if stream:
+                exporter.Write(expFile, placeAll=placeAll, workers=workers)
+            else:
+                root = exporter.Build()
+                with self.tracer.Span('serialization'):
+                    expFile.write(ET.tostring(root).decode())
+        else:
+            if changes is None:
+                changes = self.storage.Changes()
+            cleared, changed = changes
+            exporter.Index()
+            with self.tracer.Span('dirty') as span:
+                roots = None if cleared else self.exportCache.Dirty(exporter, changed)
+                span.Count(subservers=len(exporter.subservers) if roots is None else len(roots))
+            self.exportCache.Begin()
+            exporter.Write(expFile, self.exportCache, roots, placeAll, workers)
+            self.exportCache.Commit(exporter)
+            self.storage.Forget(changes)
\ No newline at end of file
@@ -0,0 +1,127 @@
+from EntityStore import TABLES
+from ExpFile import IsExp
+from Sources import ReadRecords, Remap, ToRow, SourceError
+from Privileges import NUM_PRIV
+
+class Importer:
+    """
+    Streams records from CSV/JSON/JSON lines/LDIF exports (or .exp files) into IOManager.storage in batches.
+    Each batch is validated as a whole, checked for duplicates against hash sets of the names already in
+    the store and already read from the same source (case-insensitively, as Export compares them), has its plaintext passwords
+    hashed in parallel if a HashPool is given, and is then upserted in one transaction. Rows that fail are
+    skipped and counted; only the first few problems of each kind are logged so large runs stay readable.
+    """
+    def __init__(self, iom, logFunc=lambda text: None, hashPool=None, mapping=None, replace=False, batchSize=5000, maxMessages=20):
+        self.iom = iom
+        self.logFunc = logFunc
+        self.hashPool = hashPool
+        self.mapping = mapping or {}
+        self.replace = replace
+        self.batchSize = batchSize
+        self.maxMessages = maxMessages
+        self.imported = {table: 0 for table in TABLES}
+        self.skipped = 0
+        self.invalid = 0
+        self.messages = 0
+        self.names = {}
+        for table in TABLES:
+            namespace = self.Namespace(table)
+            names = self.names.setdefault(namespace, {})
+            for key in iom.storage[table].Keys():
+                names[key.lower().strip()] = (table, key)
+
+    def Namespace(self, table):
+        return 'room' if table == 'subserver' else table
+
+    def Problem(self, text):
+        self.messages += 1
+        if self.messages <= self.maxMessages:
+            self.logFunc(f'IMPORT: {text}')
+        elif self.messages == self.maxMessages + 1:
+            self.logFunc('IMPORT: Further problems will not be listed.')
+
+    def Import(self, path, cancelled=None):
+        """
+        Imports one source, returning False if it could not be read or the import was cancelled.
+        """
+        batches = {table: [] for table in TABLES}
+        self.seen = {table: set() for table in TABLES}
+        hashPool = None if IsExp(path) else self.hashPool
+        try:
+            for table, record in ReadRecords(path, self.logFunc):
+                try:
+                    row = ToRow(table, Remap(record, self.mapping.get(table)))
+                except SourceError as e:
+                    self.invalid += 1
+                    self.Problem(str(e))
+                    continue
+                batch = batches[table]
+                batch.append(row)
+                if len(batch) >= self.batchSize:
+                    if cancelled is not None and cancelled.is_set():
+                        self.logFunc('IMPORT CANCELLED')
+                        return False
+                    if not self.Flush(table, batch, hashPool, cancelled):
+                        return False
+                    self.logFunc(f'Imported {sum(self.imported.values())} rows...')
+            for table, batch in batches.items():
+                if batch and not self.Flush(table, batch, hashPool, cancelled):
+                    return False
+        except (SourceError, OSError, ValueError) as e:
+            self.logFunc(f'IMPORT FAILED: {e}')
+            return False
+        return True
+
+    def Validate(self, table, row):
+        if not row[0].strip():
+            return f'{table} with no name.'
+        if table == 'room' and not row[2].strip():
+            return f"Room '{row[0]}' has no parent."
+        if table == 'elevation' and (len(row) != NUM_PRIV + 2 or any(value not in ('True', 'False') for value in row[1:-1])):
+            return f"Elevation '{row[0]}' does not have {NUM_PRIV} True/False privileges."
+        if table in ('subserver', 'user') and len(row) != (2 if table == 'subserver' else 4):
+            return f"{table} '{row[0]}' has the wrong number of columns."
+        return None
+
+    def Flush(self, table, batch, hashPool, cancelled):
+        names = self.names[self.Namespace(table)]
+        accepted = []
+        replaced = []
+        seen = self.seen[table]
+        for row in batch:
+            problem = self.Validate(table, row)
+            if problem:
+                self.invalid += 1
+                self.Problem(problem)
+                continue
+            name = row[0].lower().strip()
+            if name in seen:
+                self.skipped += 1
+                self.Problem(f"Duplicate {table} '{row[0]}' in the same import.")
+                continue
+            seen.add(name)
+            existing = names.get(name)
+            if existing:
+                if not self.replace or existing[0] != table:
+                    self.skipped += 1
+                    self.Problem(f"{table} '{row[0]}' already exists.")
+                    continue
+                if existing[1] != row[0]:
+                    replaced.append(existing[1])
+            names[name] = (table, row[0])
+            accepted.append(row)
+        batch.clear()
+        if hashPool and table in ('user', 'room'):
+            if not hashPool.HashRows(accepted, cancelled=cancelled):
+                self.logFunc('IMPORT CANCELLED')
+                return False
+        storage = self.iom.storage[table]
+        if replaced:
+            storage.DeleteMany(replaced)
+        self.iom.Append(storage, accepted)
+        self.imported[table] += len(accepted)
+        return True
+
+    def Summary(self):
+        counts = ', '.join([f'{count} {table}s' for table, count in self.imported.items() if count])
+        return f"Imported {counts or 'nothing'}; {self.skipped} duplicates skipped, {self.invalid} invalid rows."
@@ -0,0 +1,190 @@
+import cProfile
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+class Span:
+    """
+    One timed phase of work. Counts can be added while it runs with Count() and it is handed to the
+    tracer's sinks as an event when it ends. Spans opened inside it (on the same thread) are its children.
+    """
+    def __init__(self, tracer, name, counts):
+        self.tracer = tracer
+        self.name = name
+        self.counts = counts
+        self.id = None
+        self.parent = None
+
+    def Count(self, **counts):
+        self.counts.update(counts)
+
+    def __enter__(self):
+        self.tracer.Enter(self)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.tracer.Exit(self, value)
+        return False
+
+class NullSpan:
+    """
+    Stands in for a Span when nothing is listening, so instrumented code costs next to nothing.
+    """
+    def Count(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    """
+    Emits a structured event for every span: its name, id, parent id, thread, start time, duration in
+    seconds, any entity counts and, if it raised, the error. Sinks receive finished events. Captures
+    (ProfileCapture, TracemallocCapture) are started and stopped around spans and add their results to the event.
+    """
+    def __init__(self, sinks=(), captures=()):
+        self.sinks = list(sinks)
+        self.captures = list(captures)
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+
+    def Span(self, name, **counts):
+        if not self.sinks and not self.captures:
+            return NULL_SPAN
+        return Span(self, name, counts)
+
+    def Stack(self):
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def Enter(self, span):
+        stack = self.Stack()
+        span.id = next(self.ids)
+        span.parent = stack[-1].id if stack else None
+        stack.append(span)
+        for capture in self.captures:
+            capture.Start(span)
+        span.wall = time.time()
+        span.start = time.perf_counter()
+
+    def Exit(self, span, error):
+        duration = time.perf_counter() - span.start
+        self.Stack().pop()
+        event = {'span': span.name, 'id': span.id, 'parent': span.parent, 'thread': threading.current_thread().name,
+                 'start': span.wall, 'duration': duration}
+        event.update(span.counts)
+        if error is not None:
+            event['error'] = repr(error)
+        for capture in reversed(self.captures):
+            capture.Stop(span, event)
+        for sink in self.sinks:
+            sink.Emit(event)
+
+    def Close(self):
+        for sink in self.sinks:
+            sink.Close()
+
+class MemorySink:
+    """
+    Collects events in a list, for tests and for summarising a run in-process.
+    """
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def Emit(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def Named(self, name):
+        return [event for event in self.events if event['span'] == name]
+
+    def Totals(self):
+        """
+        Returns the total duration of each span name.
+        """
+        totals = {}
+        for event in self.events:
+            totals[event['span']] = totals.get(event['span'], 0) + event['duration']
+        return totals
+
+    def Close(self):
+        pass
+
+class JsonLinesSink:
+    """
+    Appends each event to a file as one line of JSON.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def Emit(self, event):
+        line = json.dumps(event) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def Close(self):
+        with self.lock:
+            self.file.close()
+
+class ProfileCapture:
+    """
+    Runs cProfile over spans with the given names and dumps the stats of each to a .prof file in
+    directory, created if it doesn't exist, whose path is added to the event as 'profile'. Only one span is
+    profiled at a time.
+    """
+    def __init__(self, directory, names=('export', 'parse', 'import')):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.names = names
+        self.active = None
+
+    def Start(self, span):
+        if span.name in self.names and self.active is None:
+            self.active = (span, cProfile.Profile())
+            self.active[1].enable()
+
+    def Stop(self, span, event):
+        if self.active and self.active[0] is span:
+            profile = self.active[1]
+            profile.disable()
+            self.active = None
+            path = os.path.join(self.directory, f'{span.name}-{span.id}.prof')
+            profile.dump_stats(path)
+            event['profile'] = path
+
+class TracemallocCapture:
+    """
+    Traces allocations during spans with the given names, adding the peak traced memory in bytes to
+    the event as 'allocatedPeak'. Tracing is slow, so only trace the spans being looked into.
+    """
+    def __init__(self, names=('export', 'parse', 'import')):
+        self.names = names
+        self.active = None
+
+    def Start(self, span):
+        if span.name in self.names and self.active is None:
+            self.active = span
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def Stop(self, span, event):
+        if self.active is span:
+            event['allocatedPeak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.active = None
@@ -0,0 +1,107 @@
+import concurrent.futures
+import queue
+import threading
+
+from Events import dispatcher
+
+class Job:
+    """
+    One piece of background work. The function it runs is given the job as its first argument, through which
+    it logs (Log), reports progress (Progress) and checks whether it has been cancelled (the cancelled event).
+    """
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.cancelled = threading.Event()
+        self.future = None
+        self.progress = None
+
+    def Log(self, text):
+        self.pool.Message(self, 'log', text)
+
+    def Progress(self, done, total=None):
+        self.pool.Message(self, 'progress', (done, total))
+
+    def Cancel(self):
+        self.cancelled.set()
+
+class JobPool:
+    """
+    Runs loads, exports, validations and imports on a background thread so the Tk loop never waits on them.
+    Jobs run one at a time by default as they all work on the same IOManager. Their log lines, progress and
+    completion are put on a thread-safe queue which is drained on the Tk thread through the dispatcher, a batch
+    per wakeup: lines go to logFunc, progress to progressFunc(job, done, total) and onDone(job, result) is
+    called once the job has finished (with None as the result if it raised or was cancelled before starting).
+    """
+    def __init__(self, logFunc, progressFunc=None, workers=1):
+        self.logFunc = logFunc
+        self.progressFunc = progressFunc
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ClunksEXPJob')
+        self.messages = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.draining = False
+        self.jobs = []
+
+    def Submit(self, name, function, *args, onDone=None):
+        job = Job(self, name)
+        self.jobs.append(job)
+        job.future = self.executor.submit(self.Run, job, function, args)
+        job.future.add_done_callback(lambda future: self.Message(job, 'done', onDone))
+        return job
+
+    def Run(self, job, function, args):
+        if job.cancelled.is_set():
+            return None
+        return function(job, *args)
+
+    def Message(self, job, kind, value):
+        self.messages.put((job, kind, value))
+        with self.lock:
+            if self.draining:
+                return
+            self.draining = True
+        dispatcher.Post(self.Drain)
+
+    def Drain(self):
+        with self.lock:
+            self.draining = False
+        while True:
+            try:
+                job, kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                self.logFunc(value)
+            elif kind == 'progress':
+                job.progress = value
+                if self.progressFunc:
+                    self.progressFunc(job, *value)
+            else:
+                self.Finished(job, value)
+
+    def Finished(self, job, onDone):
+        self.jobs.remove(job)
+        result = None
+        if not job.future.cancelled():
+            error = job.future.exception()
+            if error is not None:
+                self.logFunc(f'{job.name.upper()} FAILED: {error}')
+            else:
+                result = job.future.result()
+        if onDone:
+            onDone(job, result)
+
+    def Busy(self):
+        return bool(self.jobs)
+
+    def CancelAll(self):
+        for job in self.jobs:
+            job.Cancel()
+
+    def Shutdown(self, wait=True):
+        """
+        Cancels every job and, with wait, waits for the running one to stop. Don't wait from the Tk thread while
+        a job is running, as the job may be waiting on the Tk loop to take its messages.
+        """
+        self.CancelAll()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,85 @@
+import collections
+import os
+import threading
+import time
+
+from Events import dispatcher
+
+class LogSink:
+    """
+    Buffers log lines from any thread and hands them to a widget in batches, at most once every interval
+    milliseconds, through widget.Insert(lines, hidden), which keeps a bounded number of lines. hidden is
+    the number of lines of the batch left out to stay within maxLines. Every line is also appended to a log
+    file at path which is rotated once it grows past maxBytes, keeping the given number of backups
+    (path.1 being the newest).
+    """
+    def __init__(self, widget=None, path=None, interval=100, maxLines=5000, maxBytes=1 << 20, backups=3):
+        self.widget = widget
+        self.path = path
+        self.interval = interval
+        self.maxLines = maxLines
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.buffer = collections.deque()
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.file = None
+        if path:
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def Append(self, text):
+        self.buffer.append(f"[{time.strftime('%H:%M:%S')}] {text}")
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        if self.widget is None:
+            self.Flush()
+        else:
+            dispatcher.Post(self.Schedule)
+
+    def Schedule(self):
+        self.widget.after(self.interval, self.Flush)
+
+    def Flush(self):
+        with self.lock:
+            self.scheduled = False
+        lines = []
+        while self.buffer:
+            lines.append(self.buffer.popleft())
+        if not lines:
+            return
+        self.Write(lines)
+        if self.widget is not None:
+            hidden = max(0, len(lines) - self.maxLines)
+            self.widget.Insert(lines[hidden:], hidden)
+
+    def Write(self, lines):
+        if self.file is None:
+            return
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+        if self.file.tell() >= self.maxBytes:
+            self.Rotate()
+
+    def Rotate(self):
+        self.file.close()
+        for x in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{x}'):
+                os.replace(f'{self.path}.{x}', f'{self.path}.{x + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        self.file = open(self.path, 'w', encoding='utf-8')
+
+    def Close(self):
+        """
+        Writes anything still buffered to the log file, without touching the widget, and closes it.
+        """
+        self.widget = None
+        lines = list(self.buffer)
+        self.buffer.clear()
+        if lines:
+            self.Write(lines)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
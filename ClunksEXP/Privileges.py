@@ -0,0 +1,119 @@
+from array import array
+
+FLAGS = ('Call Subservers', 'Call Rooms', 'Call Groups', 'Call User', 'Message Subserver', 'Message Rooms',
+         'Message Groups', 'Message User', 'Create Groups')
+LEGACY = 9
+
+class PrivilegeSchema:
+    """
+    Maps the privileges of an elevation, held in rows as one 'True'/'False' column per flag, to the bits of an
+    integer mask. The first LEGACY flags are the bits of the .exp 'privilege' attribute with the first flag the
+    highest, as the server reads it (padded to nine binary digits, most significant first). Flags added after
+    them take the bits above, in order, and are written to a separate 'extendedPrivilege' attribute the server
+    doesn't read, so the number it parses never grows past nine digits.
+    """
+    def __init__(self, flags=FLAGS):
+        if len(flags) < LEGACY:
+            raise ValueError(f'A privilege schema needs at least the {LEGACY} original flags.')
+        self.flags = tuple(flags)
+        self.count = len(self.flags)
+        self.bits = tuple([1 << (LEGACY - 1 - x) if x < LEGACY else 1 << x for x in range(self.count)])
+        self.legacyMask = (1 << LEGACY) - 1
+        self.names = {flag.lower(): x for x, flag in enumerate(self.flags)}
+        self.columns = [self.Columns(mask) for mask in range(1 << LEGACY)]
+
+    def Bit(self, flag):
+        """
+        Returns the bit of a flag, given by name (ignoring case) or position.
+        """
+        if isinstance(flag, str):
+            try:
+                flag = self.names[flag.strip().lower()]
+            except KeyError:
+                raise ValueError(f"Unknown privilege '{flag}'.")
+        return self.bits[flag]
+
+    def Columns(self, mask):
+        return ['True' if mask & bit else 'False' for bit in self.bits]
+
+    def Encode(self, columns):
+        mask = 0
+        for bit, value in zip(self.bits, columns):
+            if value == 'True':
+                mask |= bit
+        return mask
+
+    def Decode(self, mask):
+        if mask <= self.legacyMask:
+            return list(self.columns[mask])
+        return self.Columns(mask)
+
+    def EncodeMany(self, rows):
+        """
+        Encodes the privilege columns of a whole elevation table into an array of masks. Tables hold few distinct
+        combinations of privileges, so each is encoded once and looked up for every other row which has it.
+        """
+        masks = array('Q')
+        encoded = {}
+        for row in rows:
+            columns = tuple(row[1:self.count + 1])
+            mask = encoded.get(columns)
+            if mask is None:
+                mask = encoded[columns] = self.Encode(columns)
+            masks.append(mask)
+        return masks
+
+    def DecodeMany(self, masks):
+        return [self.Decode(mask) for mask in masks]
+
+    def Granting(self, masks, flag):
+        """
+        Returns the positions of the masks which grant a flag.
+        """
+        bit = self.Bit(flag)
+        return [x for x, mask in enumerate(masks) if mask & bit]
+
+    def Flags(self, mask):
+        return [flag for flag, bit in zip(self.flags, self.bits) if mask & bit]
+
+    def Attributes(self, name, mask, sectors):
+        attrs = {'name': name, 'privilege': str(mask & self.legacyMask), 'sectors': sectors}
+        if mask >> LEGACY:
+            attrs['extendedPrivilege'] = str(mask >> LEGACY)
+        return attrs
+
+    def Parse(self, privilege, extendedPrivilege=None):
+        """
+        Returns the mask of an .exp elevation's privilege attributes, or None if they aren't valid for this schema.
+        """
+        if privilege is None or not privilege.isdigit() or int(privilege) > self.legacyMask:
+            return None
+        mask = int(privilege)
+        if extendedPrivilege is not None:
+            if not extendedPrivilege.isdigit() or int(extendedPrivilege) >> (self.count - LEGACY):
+                return None
+            mask |= int(extendedPrivilege) << LEGACY
+        return mask
+
+class ElevationTable:
+    """
+    An elevation table with the privileges of every elevation encoded in one array of masks, for questions like
+    which elevations grant a privilege.
+    """
+    def __init__(self, rows, schema=None):
+        self.schema = schema or SCHEMA
+        self.names = [row[0] for row in rows]
+        self.sectors = [row[len(row) - 1] for row in rows]
+        self.masks = self.schema.EncodeMany(rows)
+
+    def __len__(self):
+        return len(self.names)
+
+    def Granting(self, flag):
+        return [self.names[x] for x in self.schema.Granting(self.masks, flag)]
+
+    def Rows(self):
+        return [[name] + columns + [sectors] for name, columns, sectors in zip(self.names, self.schema.DecodeMany(self.masks), self.sectors)]
+
+SCHEMA = PrivilegeSchema()
+NUM_PRIV = SCHEMA.count
@@ -0,0 +1,110 @@
+import sys
+
+SUBSERVER = 0
+ROOM = 1
+
+class SectorIndex:
+    """
+    Resolves which sectors each subserver and room is registered under. Every sector string is split and
+    interned once, however many entities or users share it. The registrations are then made in a single
+    pass over the room forest in creation order (parents before children). That pass includes the
+    inheritance of sectors by parents with no sectors of their own, exactly as the original exporter did it.
+    Entities are the ids used by Exporter: subservers first, then rooms from roomBase.
+    The results are held as reverse indexes both ways: sector -> entities and entity -> sectors.
+    """
+    def __init__(self):
+        self.parsed = {}
+        self.split = {}
+        self.sectorToSubserver = {}
+        self.sectorToRoom = {}
+        self.entitySectors = {}
+
+    def Parse(self, text):
+        """
+        Returns whether a sector string gives its entity any sectors (its first sector is not empty)
+        and the stripped sectors it registers.
+        """
+        try:
+            return self.parsed[text]
+        except KeyError:
+            pass
+        parts = text.split(',')
+        self.parsed[text] = (bool(parts[0]), tuple([sys.intern(part.strip()) for part in parts if part]))
+        return self.parsed[text]
+
+    def Split(self, text):
+        """
+        Returns every sector of a user's sector string, stripped, as used to place the user.
+        """
+        try:
+            return self.split[text]
+        except KeyError:
+            self.split[text] = tuple([sys.intern(part.strip()) for part in text.split(',')])
+            return self.split[text]
+
+    def Resolve(self, subservers, rooms, roomOrder, roomParents):
+        self.roomBase = len(subservers)
+        noSectorSubservers = {}
+        noSectorRooms = {}
+        for x, subserver in enumerate(subservers):
+            hasSectors, sectors = self.Parse(subserver[1])
+            if not hasSectors:
+                noSectorSubservers[x] = None
+                continue
+            for sector in sectors:
+                self.AddSubserver(sector, x)
+        for index, row in enumerate(roomOrder):
+            kind, parent = roomParents[index]
+            hasSectors, sectors = self.Parse(rooms[row][3])
+            if not hasSectors:
+                noSector = noSectorSubservers if kind == SUBSERVER else noSectorRooms
+                if parent in noSector:
+                    noSector[parent] = index
+                noSectorRooms[index] = None
+                continue
+            if kind == SUBSERVER:
+                #The original registers the last subserver rather than the parent, under the first sector only.
+                if parent in noSectorSubservers:
+                    self.AddSubserver(sectors[0], len(subservers) - 1)
+                    del noSectorSubservers[parent]
+            elif parent in noSectorRooms:
+                self.Inherit(parent, sys.intern(rooms[row][3].strip()), roomParents, noSectorRooms, noSectorSubservers)
+            for sector in sectors:
+                self.AddRoom(sector, index)
+
+    def Inherit(self, index, sector, roomParents, noSectorRooms, noSectorSubservers):
+        """
+        Registers a chain of sectorless parents under the whole sector string of their first sectored descendant.
+        """
+        while True:
+            self.AddRoom(sector, index)
+            del noSectorRooms[index]
+            kind, parent = roomParents[index]
+            if kind == ROOM:
+                if noSectorRooms.get(parent) == index:
+                    index = parent
+                    continue
+            elif noSectorSubservers.get(parent) == index:
+                self.AddSubserver(sector, parent)
+                del noSectorSubservers[parent]
+            break
+
+    def AddSubserver(self, sector, x):
+        self.sectorToSubserver.setdefault(sector, []).append(x)
+        self.entitySectors.setdefault(x, []).append(sector)
+
+    def AddRoom(self, sector, index):
+        self.sectorToRoom.setdefault(sector, []).append(index)
+        self.entitySectors.setdefault(self.roomBase + index, []).append(sector)
+
+    def Registered(self, sector):
+        return sector in self.sectorToSubserver or sector in self.sectorToRoom
+
+    def Entities(self, sector):
+        """
+        Returns the entity ids registered under a sector, subservers first.
+        """
+        return self.sectorToSubserver.get(sector, []) + [self.roomBase + index for index in self.sectorToRoom.get(sector, [])]
+
+    def Sectors(self, entity):
+        return self.entitySectors.get(entity, [])
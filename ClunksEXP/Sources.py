@@ -0,0 +1,184 @@
+import csv
+import json
+import os
+
+from ExpBinary import OpenSidecar
+from ExpFile import IsExp, OpenExp
+from ExpReader import ExpReader
+from Privileges import SCHEMA
+
+COLUMNS = {'subserver': ('name', 'sectors'),
+           'room': ('name', 'password', 'parent', 'sectors'),
+           'user': ('username', 'password', 'sectors', 'global'),
+           'elevation': ('name', 'privilege', 'sectors')}
+
+EXTENSIONS = ('.exp', '.exp.gz', '.json', '.jsonl', '.csv', '.ldif')
+
+class SourceError(Exception):
+    pass
+
+def TableName(name):
+    name = str(name).strip().lower().replace('-', '').replace('_', '')
+    if name.endswith('s') and name[:-1] in COLUMNS:
+        name = name[:-1]
+    return name if name in COLUMNS else None
+
+def TableFor(path):
+    """
+    Works out which table a single-table source (a CSV) belongs to, either from an explicit 'table:' prefix
+    or from the file name (users.csv, room.csv, ...).
+    """
+    table, sep, rest = path.partition(':')
+    if sep and TableName(table) and not os.path.exists(path):
+        return TableName(table), rest
+    return TableName(os.path.splitext(os.path.basename(path))[0]), path
+
+def ToRow(table, record):
+    """
+    Converts a record from a CSV/JSON source into the row format used by IOManager.storage. Records may
+    already be rows (lists) or be mappings keyed by COLUMNS; elevations given as mappings carry a single
+    integer privilege which is expanded into the per-privilege columns.
+    """
+    if isinstance(record, (list, tuple)):
+        return [str(value) for value in record]
+    if COLUMNS[table][0] not in record:
+        raise SourceError(f"{table} record is missing '{COLUMNS[table][0]}': {record}")
+    if table == 'elevation':
+        try:
+            privilege = int(record.get('privilege') or 0)
+        except ValueError:
+            raise SourceError(f"Elevation '{record['name']}' has an invalid privilege: {record.get('privilege')}")
+        if privilege < 0 or privilege >> SCHEMA.count:
+            raise SourceError(f"Elevation '{record['name']}' has an invalid privilege: {record.get('privilege')}")
+        return [str(record['name'])] + SCHEMA.Decode(privilege) + [str(record.get('sectors') or '')]
+    row = [str(record.get(column) or '') for column in COLUMNS[table]]
+    if table == 'user':
+        row[3] = 'True' if row[3].strip().lower() in ('true', '1', 'yes') else 'False'
+    return row
+
+def Remap(record, mapping):
+    """
+    Renames the fields of a source record to the names in COLUMNS. mapping maps our column name to the
+    field name used by the source, or to a list of candidate fields of which the first present is used
+    (for example {'username': ['StudentID', 'uid']}).
+    """
+    if not mapping or not isinstance(record, dict):
+        return record
+    record = dict(record)
+    for column, fields in mapping.items():
+        for field in [fields] if isinstance(fields, str) else fields:
+            field = field.strip().lower()
+            if field in record:
+                record[column] = record.pop(field)
+                break
+    return record
+
+def Lowered(record):
+    return {key.strip().lower(): value for key, value in record.items() if key}
+
+def ReadCsv(table, csvFile):
+    for record in csv.DictReader(csvFile):
+        yield table, Lowered(record)
+
+def ReadJson(jsonFile):
+    data = json.load(jsonFile)
+    if not isinstance(data, dict):
+        raise SourceError('JSON sources must be an object mapping table names to lists of records.')
+    for key, records in data.items():
+        table = TableName(key)
+        if table is None:
+            raise SourceError(f"Unknown table '{key}'.")
+        for record in records:
+            yield table, Lowered(record) if isinstance(record, dict) else record
+
+def RecordTable(record, table):
+    kind = record.pop('type', None) or record.pop('table', None)
+    if kind is not None:
+        table = TableName(kind)
+    if table is None:
+        raise SourceError(f'Record does not say which table it belongs to: {record}')
+    return table
+
+def ReadJsonLines(table, jsonFile):
+    for number, line in enumerate(jsonFile, 1):
+        if line.strip():
+            try:
+                record = Lowered(json.loads(line))
+            except (ValueError, AttributeError) as e:
+                raise SourceError(f'Line {number} is not a JSON object ({e}).')
+            yield RecordTable(record, table), record
+
+def ReadLdif(table, ldifFile):
+    """
+    Reads LDIF-style exports: records separated by blank lines, one 'attribute: value' per line. Lines
+    starting with a space continue the previous value and lines starting with '#' are comments.
+    """
+    record = {}
+    last = None
+    for line in ldifFile:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            if record:
+                yield RecordTable(record, table), record
+            record = {}
+            last = None
+        elif line.startswith('#'):
+            continue
+        elif line.startswith(' ') and last:
+            record[last] += line[1:]
+        else:
+            key, sep, value = line.partition(':')
+            if not sep:
+                raise SourceError(f"Malformed LDIF line '{line}'.")
+            last = key.strip().lower()
+            record[last] = value.strip()
+    if record:
+        yield RecordTable(record, table), record
+
+def ReadRecords(path, logFunc=lambda text: None):
+    """
+    Yields (table, record) pairs from a source without converting them, so field names can still be remapped.
+    Records from .exp files are already rows, read from the binary sidecar of the .exp when it has one.
+    """
+    table, path = TableFor(path)
+    extension = '.exp' if IsExp(path) else os.path.splitext(path)[1].lower()
+    sidecar = OpenSidecar(path) if extension == '.exp' else None
+    if sidecar is not None:
+        try:
+            yield from sidecar.Rows()
+        finally:
+            sidecar.Close()
+    elif extension == '.exp':
+        with OpenExp(path) as expFile:
+            reader = ExpReader(expFile, logFunc)
+            yield from reader.Rows()
+        if reader.failed:
+            raise SourceError(f"'{path}' could not be loaded.")
+    elif extension == '.json':
+        with open(path, encoding='utf-8') as jsonFile:
+            yield from ReadJson(jsonFile)
+    elif extension == '.jsonl':
+        with open(path, encoding='utf-8') as jsonFile:
+            yield from ReadJsonLines(table, jsonFile)
+    elif extension == '.ldif':
+        with open(path, encoding='utf-8') as ldifFile:
+            yield from ReadLdif(table, ldifFile)
+    elif extension == '.csv':
+        if table is None:
+            raise SourceError(f"Cannot tell which table '{path}' holds, name it after the table or prefix it with 'table:'.")
+        with open(path, encoding='utf-8', newline='') as csvFile:
+            yield from ReadCsv(table, csvFile)
+    else:
+        raise SourceError(f"Unsupported source '{path}'.")
+
+def ReadSource(path, logFunc=lambda text: None, mapping=None):
+    """
+    Yields (table, row) pairs from an .exp, .json, .jsonl, .ldif or .csv file, raising SourceError if it cannot be read.
+    mapping maps each table to the field renames to apply to its records (see Remap).
+    """
+    mapping = mapping or {}
+    for table, record in ReadRecords(path, logFunc):
+        yield table, ToRow(table, Remap(record, mapping.get(table)))
+
+def WriteJson(jsonFile, tables):
+    json.dump(tables, jsonFile)
@@ -0,0 +1,305 @@
+TABLES = ('subserver', 'room', 'elevation', 'user')
+KINDS = ('empty', 'duplicate', 'parent', 'cycle', 'conflict', 'coverage')
+TITLES = {'subserver': 'Subserver', 'room': 'Room', 'elevation': 'Elevation', 'user': 'User'}
+
+class Problem:
+    """
+    One error in a configuration: what kind of error it is, the table it is in, the names of the rows it is
+    about and a message describing it.
+    """
+    def __init__(self, kind, table, names, message):
+        self.kind = kind
+        self.table = table
+        self.names = tuple(names)
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+    def __eq__(self, other):
+        return isinstance(other, Problem) and (self.kind, self.table, self.names, self.message) == (other.kind, other.table, other.names, other.message)
+
+    def __hash__(self):
+        return hash((self.kind, self.table, self.names, self.message))
+
+    def Order(self):
+        return (TABLES.index(self.table), KINDS.index(self.kind), self.names)
+
+class Validator:
+    """
+    Finds every problem which would stop a configuration from exporting, rather than the first: names which
+    are not unique (compared like the exporter does, ignoring case and surrounding space), rooms whose parent
+    does not exist or which are their own ancestors, users whose sectors match more than one elevation or none,
+    and empty subserver or elevation tables.
+    Rows are indexed by name, the rooms by parent name and the users and elevations by sector, so after
+    Update() only the rows an edit can affect are checked again. The name indexes hold a key, or a set of
+    keys once a name is shared, and the users are only indexed by sector once an elevation is changed. Rows are keyed by their first column, the
+    same as the editors and the store, and Update() takes the same {key: row, or None if removed} changes.
+    """
+    def __init__(self, subservers=(), rooms=(), elevations=(), users=()):
+        self.rows = {table: {} for table in TABLES}
+        self.names = {table: {} for table in TABLES}
+        self.children = {}
+        self.elevationSectors = {}
+        self.userSectors = None
+        self.problems = {}
+        self.cycles = {}
+        self.touched = {}
+        for table, rows in zip(TABLES, (subservers, rooms, elevations, users)):
+            self.rows[table] = {row[0]: row for row in rows}
+        self.Build()
+
+    def Build(self):
+        """
+        Indexes and checks every row in one pass, which is much quicker than adding them all with Update().
+        """
+        for table in TABLES:
+            names = self.names[table]
+            for key in self.rows[table]:
+                name = key.lower().strip()
+                if name in names:
+                    self.Add(names, name, key)
+                else:
+                    names[name] = key
+        for key, room in self.rows['room'].items():
+            self.children.setdefault(room[2], set()).add(key)
+        for key, elevation in self.rows['elevation'].items():
+            for sector in elevation[len(elevation) - 1].split(','):
+                self.elevationSectors.setdefault(sector, set()).add(key)
+        for table in TABLES:
+            for name, keys in self.names[table].items():
+                if isinstance(keys, set) or (table == 'room' and name in self.names['subserver']):
+                    self.CheckNames(table, name)
+        self.CheckEmpty('subserver')
+        self.CheckEmpty('elevation')
+        self.CheckRooms(self.rows['room'])
+        self.CheckUsers(self.rows['user'])
+        self.touched = {}
+
+    def Update(self, table, changes):
+        """
+        Applies changes to a table and checks again everything they could have affected. Returns the
+        problems which were found and the problems which were fixed by them.
+        """
+        self.touched = {}
+        rows = self.rows[table]
+        names = set()
+        parents = set()
+        sectors = set()
+        for key, row in changes.items():
+            old = rows.pop(key, None)
+            for each in (old, row):
+                if each is not None:
+                    names.add(self.Normal(each[0]))
+                    parents.add(each[0])
+                    if table == 'elevation':
+                        sectors.update(each[len(each) - 1].split(','))
+            if old is not None:
+                self.Unindex(table, key, old)
+            if row is not None:
+                rows[key] = row
+                self.Index(table, key, row)
+        for name in names:
+            self.CheckNames(table, name)
+            if table == 'subserver':
+                self.CheckNames('room', name)
+        if table in ('subserver', 'elevation'):
+            self.CheckEmpty(table)
+        if table in ('subserver', 'room'):
+            rooms = set()
+            for name in parents:
+                rooms.update(self.children.get(name, ()))
+            if table == 'room':
+                rooms.update(changes)
+            self.CheckRooms(rooms)
+        elif table == 'elevation':
+            users = set()
+            userSectors = self.UserSectors()
+            for sector in sectors:
+                users.update(userSectors.get(sector, ()))
+            self.CheckUsers(users)
+        else:
+            self.CheckUsers(changes)
+        found = []
+        fixed = []
+        for subject, before in self.touched.items():
+            after = self.problems.get(subject)
+            if before != after:
+                if before is not None:
+                    fixed.append(before)
+                if after is not None:
+                    found.append(after)
+        self.touched = {}
+        return found, fixed
+
+    def Problems(self, table=None):
+        problems = [problem for problem in self.problems.values() if table is None or problem.table == table]
+        problems.sort(key=Problem.Order)
+        return problems
+
+    def Valid(self):
+        return not self.problems
+
+    def Normal(self, name):
+        return name.lower().strip()
+
+    def UserSectors(self):
+        if self.userSectors is None:
+            self.userSectors = {}
+            for key, user in self.rows['user'].items():
+                for sector in user[2].split(','):
+                    try:
+                        self.userSectors[sector].add(key)
+                    except KeyError:
+                        self.userSectors[sector] = {key}
+        return self.userSectors
+
+    def Index(self, table, key, row):
+        self.Add(self.names[table], self.Normal(row[0]), key)
+        if table == 'room':
+            self.children.setdefault(row[2], set()).add(key)
+        elif table == 'elevation':
+            for sector in row[len(row) - 1].split(','):
+                self.elevationSectors.setdefault(sector, set()).add(key)
+        elif table == 'user' and self.userSectors is not None:
+            for sector in row[2].split(','):
+                self.userSectors.setdefault(sector, set()).add(key)
+
+    def Unindex(self, table, key, row):
+        self.Discard(self.names[table], self.Normal(row[0]), key)
+        if table == 'room':
+            self.Discard(self.children, row[2], key)
+        elif table == 'elevation':
+            for sector in row[len(row) - 1].split(','):
+                self.Discard(self.elevationSectors, sector, key)
+        elif table == 'user' and self.userSectors is not None:
+            for sector in row[2].split(','):
+                self.Discard(self.userSectors, sector, key)
+
+    def Add(self, index, value, key):
+        keys = index.get(value)
+        if keys is None:
+            index[value] = key
+        elif isinstance(keys, set):
+            keys.add(key)
+        else:
+            index[value] = {keys, key}
+
+    def Discard(self, index, value, key):
+        keys = index.get(value)
+        if keys == key:
+            del index[value]
+        elif isinstance(keys, set):
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def Keys(self, index, value):
+        keys = index.get(value, ())
+        return (keys,) if isinstance(keys, str) else keys
+
+    def Set(self, subject, problem):
+        before = self.problems.get(subject)
+        if before is None and problem is None:
+            return
+        if subject not in self.touched:
+            self.touched[subject] = before
+        if problem is None:
+            self.problems.pop(subject, None)
+        else:
+            self.problems[subject] = problem
+
+    def CheckEmpty(self, table):
+        problem = None
+        if not self.rows[table]:
+            problem = Problem('empty', table, (), f'There are no {table}s.')
+        self.Set(('empty', table), problem)
+
+    def CheckNames(self, table, name):
+        keys = sorted(self.Keys(self.names[table], name))
+        others = sorted(self.Keys(self.names['subserver'], name)) if table == 'room' and keys else []
+        problem = None
+        if len(keys) + len(others) > 1:
+            names = ', '.join([f"'{key}'" for key in keys] + [f"'{key}' (subserver)" for key in others])
+            if table == 'room':
+                message = f'Room/subserver names must be unique: {names}.'
+            elif table == 'user':
+                message = f'Usernames must be unique: {names}.'
+            else:
+                message = f'{TITLES[table]} names must be unique: {names}.'
+            problem = Problem('duplicate', table, keys + others, message)
+        self.Set(('duplicate', table, name), problem)
+
+    def CheckRooms(self, keys):
+        """
+        Checks that each of the rooms has a parent and isn't in a cycle of rooms, none of which is then under a
+        subserver. Cycles the rooms were in are dropped and their other rooms checked again.
+        """
+        pending = set(keys)
+        for key in keys:
+            cycle = self.cycles.get(key)
+            if cycle is not None:
+                self.Set(('cycle', cycle), None)
+                for room in cycle:
+                    self.cycles.pop(room, None)
+                pending.update(cycle)
+        rooms = self.rows['room']
+        subservers = self.rows['subserver']
+        for key in pending:
+            room = rooms.get(key)
+            if room is None:
+                self.Set(('parent', key), None)
+                continue
+            problem = None
+            if room[2] not in subservers and room[2] not in rooms:
+                problem = Problem('parent', 'room', (key,), f"Parent '{room[2]}' of room '{key}' does not exist.")
+            self.Set(('parent', key), problem)
+            if problem is None and key not in self.cycles:
+                self.CheckCycle(key)
+
+    def CheckCycle(self, key):
+        rooms = self.rows['room']
+        subservers = self.rows['subserver']
+        path = [key]
+        seen = {key}
+        while True:
+            parent = rooms[path[-1]][2]
+            if parent in subservers or parent not in rooms:
+                return
+            if parent == key:
+                break
+            if parent in seen:
+                return
+            seen.add(parent)
+            path.append(parent)
+        cycle = tuple(path[path.index(min(path)):] + path[:path.index(min(path))])
+        for room in cycle:
+            self.cycles[room] = cycle
+        names = ' -> '.join([f"'{room}'" for room in cycle + cycle[:1]])
+        self.Set(('cycle', cycle), Problem('cycle', 'room', cycle, f'Rooms {names} are parents of each other, so none of them is under a subserver.'))
+
+    def CheckUsers(self, keys):
+        users = self.rows['user']
+        for key in keys:
+            user = users.get(key)
+            problem = None
+            if user is not None:
+                sectors = [sector for sector in user[2].split(',') if sector in self.elevationSectors]
+                if not sectors:
+                    problem = Problem('coverage', 'user', (key,), f"No elevation applied to user '{key}'.")
+                elif len(sectors) > 1:
+                    elevations = sorted(set().union(*[self.elevationSectors[sector] for sector in sectors]))
+                    problem = Problem('conflict', 'user', (key,), f"Elevation conflict on user '{key}': its sectors {', '.join([repr(sector) for sector in sectors])} "
+                                                                   f"match elevations {', '.join([repr(name) for name in elevations])}.")
+            self.Set(('user', key), problem)
+
+    def Report(self, logFunc, prefix='VALIDATION FAILED'):
+        """
+        Logs every problem, returning whether there were none.
+        """
+        problems = self.Problems()
+        for problem in problems:
+            logFunc(f'{prefix}: {problem}')
+        if problems:
+            logFunc(f'{len(problems)} problem{"s" if len(problems) != 1 else ""} found.')
+        return not problems
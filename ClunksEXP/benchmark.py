@@ -0,0 +1,200 @@
+"""
+Benchmarks for the ClunksEXP data path. A synthetic configuration is generated from the given counts,
+exported once to a temporary .exp, and each case is then timed in a fresh process so that its peak RSS
+is its own. Results are written as JSON; given a baseline from an earlier run, cases whose median time
+grew by more than the tolerance are reported and the exit code is 1.
+
+    python benchmark.py -o results.json
+    python benchmark.py --scale large --repeat 3 -o results.json --baseline release.json
+
+Cases: load (IOManager.LoadExp), sidecar (IOManager.LoadExp of an .exp with a binary sidecar), export
+(IOManager.Export), parallel (IOManager.Export with a worker process per core), save and readall (IOManager.Save/ReadAll of every table) and model (loading every table
+into an editor's EntityModel).
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from IOManager import IOManager
+from EntityModel import EntityModel
+from ExpBinary import SidecarPath
+from Privileges import NUM_PRIV
+
+SCALES = {'small': {'subservers': 10, 'rooms': 1000, 'depth': 3, 'users': 5000, 'sectors': 100, 'sectorsPerUser': 2, 'elevations': 5},
+          'medium': {'subservers': 50, 'rooms': 10000, 'depth': 4, 'users': 100000, 'sectors': 200, 'sectorsPerUser': 3, 'elevations': 10},
+          'large': {'subservers': 100, 'rooms': 50000, 'depth': 6, 'users': 500000, 'sectors': 1000, 'sectorsPerUser': 3, 'elevations': 20}}
+CASES = ('load', 'sidecar', 'export', 'parallel', 'save', 'readall', 'model')
+TABLES = ('subserver', 'room', 'elevation', 'user')
+HASH = '$2b$12$' + 'x' * 53
+
+def Generate(subservers, rooms, depth, users, sectors, sectorsPerUser, elevations, seed=0):
+    """
+    Returns the subserver, room, elevation and user tables of a valid synthetic configuration. Rooms are
+    nested in chains of the given depth under random subservers, every entity has one sector and users
+    have one elevation sector plus sectorsPerUser random sectors. One user in a hundred is global.
+    """
+    r = random.Random(seed)
+    sectorNames = [f'sector{i}' for i in range(sectors)]
+    subserverRows = [[f'subserver{i}', r.choice(sectorNames)] for i in range(subservers)]
+    roomRows = []
+    for i in range(rooms):
+        parent = r.choice(subserverRows)[0] if i % depth == 0 else roomRows[i - 1][0]
+        roomRows.append([f'room{i}', HASH, parent, r.choice(sectorNames)])
+    elevationRows = [[f'elevation{i}'] + [r.choice(['True', 'False']) for j in range(NUM_PRIV)] + [f'elevation{i}'] for i in range(elevations)]
+    userRows = []
+    for i in range(users):
+        userSectors = [f'elevation{r.randrange(elevations)}'] + r.sample(sectorNames, min(sectorsPerUser, sectors))
+        userRows.append([f'user{i}', HASH, ','.join(userSectors), 'True' if i % 100 == 0 else 'False'])
+    return subserverRows, roomRows, elevationRows, userRows
+
+def PeakRss():
+    """
+    Returns the peak resident set size of this process in bytes, or None where it cannot be read.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def Store(iom, tables):
+    for table, rows in zip(TABLES, tables):
+        iom.Save(iom.storage[table], rows)
+
+def Setup(case, config, expPath):
+    """
+    Prepares a case and returns the operation to time along with the IOManager it works on.
+    """
+    iom = IOManager()
+    tables = Generate(**config)
+    log = lambda text: None
+    if case in ('load', 'sidecar'):
+        def Run():
+            with open(expPath, encoding='utf-8') as expFile:
+                iom.LoadExp(log, expFile)
+    elif case in ('export', 'parallel'):
+        Store(iom, tables)
+        workers = os.cpu_count() if case == 'parallel' else None
+        def Run():
+            with open(os.devnull, 'w', encoding='utf-8') as expFile:
+                iom.Export(log, expFile, workers=workers)
+    elif case == 'save':
+        Run = lambda: Store(iom, tables)
+    elif case == 'readall':
+        Store(iom, tables)
+        Run = lambda: [iom.ReadAll(iom.storage[table]) for table in TABLES]
+    else:
+        rows = dict(zip(TABLES, tables))
+        Run = lambda: [EntityModel(rows[table]) for table in TABLES]
+    return Run, iom
+
+def RunCase(case, config, expPath, repeat, trace):
+    """
+    Times a case repeat times, then runs it once more under tracemalloc to measure its allocations.
+    Runs in a worker process.
+    """
+    Run, iom = Setup(case, config, expPath)
+    try:
+        rssBefore = PeakRss()
+        times = []
+        for x in range(repeat):
+            start = time.perf_counter()
+            Run()
+            times.append(time.perf_counter() - start)
+        result = {'case': case, 'times': times, 'best': min(times), 'median': statistics.median(times),
+                  'rssBefore': rssBefore, 'peakRss': PeakRss()}
+        if trace:
+            tracemalloc.start()
+            Run()
+            result['allocated'], result['allocatedPeak'] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return result
+    finally:
+        iom.Cleanup()
+
+def Compare(results, baseline, tolerance):
+    """
+    Returns a line for each case whose median time regressed past the tolerance against a baseline run.
+    """
+    before = {result['case']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = before.get(result['case'])
+        if old and result['median'] > old['median'] * (1 + tolerance):
+            regressions.append(f"REGRESSION {result['case']}: {old['median']:.3f}s -> {result['median']:.3f}s")
+    return regressions
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmark', description='Time the ClunksEXP data path on a synthetic configuration.')
+    parser.add_argument('--scale', choices=SCALES, default='small', help='preset counts, overridden by the options below')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-tracemalloc', action='store_true', help='skip the allocation run of each case')
+    parser.add_argument('-o', '--output', help='file to write the JSON results to (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed growth of a median time over the baseline')
+    args = parser.parse_args(argv)
+
+    config = dict(SCALES[args.scale])
+    for name in config:
+        if getattr(args, name) is not None:
+            config[name] = getattr(args, name)
+    config['seed'] = args.seed
+
+    handle, expPath = tempfile.mkstemp(prefix='clunksexp-bench-', suffix='.exp')
+    os.close(handle)
+    sidecarExpPath = expPath[:-len('.exp')] + '-sidecar.exp'
+    try:
+        iom = IOManager()
+        try:
+            Store(iom, Generate(**config))
+            for path, sidecar in ((expPath, False), (sidecarExpPath, True)):
+                if sidecar and 'sidecar' not in args.cases:
+                    continue
+                with open(path, 'w', encoding='utf-8') as expFile:
+                    if not iom.Export(lambda text: print(text, file=sys.stderr), expFile, sidecar=sidecar):
+                        return 1
+        finally:
+            iom.Cleanup()
+        expSize = os.path.getsize(expPath)
+        results = []
+        for case in args.cases:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(RunCase, case, config, sidecarExpPath if case == 'sidecar' else expPath, args.repeat,
+                                         not args.no_tracemalloc).result()
+            print(f"{case}: best {result['best']:.3f}s, median {result['median']:.3f}s", file=sys.stderr)
+            results.append(result)
+    finally:
+        for path in (expPath, sidecarExpPath, SidecarPath(sidecarExpPath)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    report = {'config': config, 'expSize': expSize, 'python': platform.python_version(), 'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as outputFile:
+            json.dump(report, outputFile, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baselineFile:
+            regressions = Compare(results, json.load(baselineFile), args.tolerance)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main())
@@ -0,0 +1,154 @@
+"""
+Headless entry point for ClunksEXP. Sources (.exp, .exp.gz, .json, .jsonl, .ldif or .csv) are merged in the
+order given, rows from later sources replacing rows with the same name from earlier ones.
+
+    python clunksexp.py load SOURCE...
+    python clunksexp.py validate SOURCE...
+    python clunksexp.py merge -o OUTPUT.json SOURCE...
+    python clunksexp.py export -o OUTPUT.exp|OUTPUT.exp.gz SOURCE...
+    python clunksexp.py diff BASE OTHER
+    python clunksexp.py merge3 -o OUTPUT.exp|OUTPUT.json BASE OURS THEIRS
+
+Run a command with --help for its options.
+"""
+import argparse
+import os
+import sys
+
+import Diff
+from ExpFile import IsExp, OpenExp
+from Exporter import LAYOUTS, NESTED
+from IOManager import IOManager
+from Instrumentation import Tracer, JsonLinesSink, ProfileCapture, TracemallocCapture
+from Privileges import SCHEMA, ElevationTable
+from Sources import SourceError
+import Hashing
+
+def Log(text):
+    print(text, file=sys.stderr)
+
+def Mapping(pairs):
+    mapping = {}
+    for pair in pairs:
+        column, sep, field = pair.partition('=')
+        table, dot, column = column.partition('.')
+        if not sep or not dot:
+            raise argparse.ArgumentTypeError(f"--map expects table.column=field, got '{pair}'")
+        mapping.setdefault(table, {}).setdefault(column, []).append(field)
+    return mapping
+
+def Compare(args):
+    try:
+        configs = [Diff.Load(path, Log) for path in args.configs]
+    except (SourceError, OSError, ValueError) as e:
+        Log(f'{args.command.upper()} FAILED: {e}')
+        return 2
+    if args.command == 'diff':
+        diffs = Diff.Diff(*configs)
+        for diff in diffs.values():
+            if not args.stat:
+                for line in diff.Lines():
+                    print(line)
+        for diff in diffs.values():
+            print(diff.Summary())
+        return 1 if any(diffs.values()) else 0
+    merged, conflicts = Diff.Merge(*configs, prefer=args.prefer)
+    for conflict in conflicts:
+        Log(f'CONFLICT: {conflict}')
+    if conflicts:
+        Log(f'{len(conflicts)} conflict{"s" if len(conflicts) != 1 else ""}, kept {args.prefer or Diff.OURS}.')
+    iom = IOManager()
+    try:
+        for table, rows in merged.items():
+            iom.Save(iom.storage[table], list(rows.values()))
+        if IsExp(args.output):
+            with OpenExp(args.output, 'w') as expFile:
+                if not iom.Export(Log, expFile, sidecar=args.sidecar, layout=args.layout):
+                    return 1
+        else:
+            with open(args.output, 'w', encoding='utf-8') as jsonFile:
+                iom.SaveJson(Log, jsonFile)
+    finally:
+        iom.Cleanup()
+    return 1 if conflicts and not args.prefer else 0
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(prog='clunksexp', description='Build and check CLUNKS .exp configurations without the GUI.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help in (('load', 'load the sources and print a summary'), ('validate', 'check that the merged sources would export'),
+                       ('merge', 'write the merged sources out as JSON'), ('export', 'write the merged sources out as an .exp')):
+        command = commands.add_parser(name, help=help)
+        if name in ('merge', 'export'):
+            command.add_argument('-o', '--output', required=True)
+        if name == 'load':
+            command.add_argument('--grants', metavar='PRIVILEGE', help='also list the elevations which grant PRIVILEGE, e.g. "Create Groups"')
+        if name == 'export':
+            command.add_argument('--sidecar', action='store_true', help='also write the binary sidecar of the .exp')
+            command.add_argument('--layout', choices=LAYOUTS, default=NESTED, help='how users are written (default: nested)')
+            command.add_argument('--jobs', type=int, default=1, help='number of processes rendering the subservers, 0 for one per core (default: 1)')
+        command.add_argument('--hash-passwords', action='store_true', help='hash plaintext passwords from CSV/JSON sources')
+        command.add_argument('--cost', type=int, default=Hashing.DEFAULT_COST, help='bcrypt cost used with --hash-passwords')
+        command.add_argument('--workers', type=int, default=None, help='number of hashing processes (default: one per core)')
+        command.add_argument('--map', action='append', default=[], metavar='TABLE.COLUMN=FIELD', help='read COLUMN of TABLE from the source field FIELD')
+        command.add_argument('--skip-existing', action='store_true', help='skip rows named like an existing row instead of replacing it')
+        command.add_argument('--trace', metavar='FILE', help='append timing events as JSON lines to FILE')
+        command.add_argument('--profile', metavar='DIR', help='write cProfile stats of each parse, import and export to DIR')
+        command.add_argument('--trace-memory', action='store_true', help='add peak traced allocations to parse, import and export events')
+        command.add_argument('sources', nargs='+', metavar='SOURCE', help='.exp, .exp.gz, .json, .jsonl, .ldif or .csv; a .csv holds the table it is named after, or give it as TABLE:PATH')
+    command = commands.add_parser('diff', help='list the rows which differ between two configurations',
+                                  description='List the rows added (+), removed (-) and changed (~) from BASE to OTHER, matched by name, and exit with 1 if there are any. '
+                                              'The subserver and room sectors read from an .exp are those of the users placed under them, not the configured ones.')
+    command.add_argument('--stat', action='store_true', help='only print the number of rows added, removed and changed')
+    command.add_argument('configs', nargs=2, metavar='CONFIG', help='BASE and OTHER')
+    command = commands.add_parser('merge3', help='three-way merge two configurations derived from a third',
+                                  description='Merge the changes OURS and THEIRS made to BASE. Sector lists are merged as sets; other columns changed differently on both sides, '
+                                              'or a row one side removed and the other changed, are conflicts, which are reported and resolved with --prefer (ours by default). '
+                                              'Exits with 1 if there were conflicts and no --prefer.')
+    command.add_argument('-o', '--output', required=True, help='.exp or .exp.gz, or anything else for JSON')
+    command.add_argument('--prefer', choices=(Diff.OURS, Diff.THEIRS), help='side conflicts are resolved with')
+    command.add_argument('--sidecar', action='store_true', help='also write the binary sidecar of the .exp')
+    command.add_argument('--layout', choices=LAYOUTS, default=NESTED, help='how users are written (default: nested)')
+    command.add_argument('configs', nargs=3, metavar='CONFIG', help='BASE, OURS and THEIRS')
+    args = parser.parse_args(argv)
+    if args.command in ('diff', 'merge3'):
+        return Compare(args)
+    if args.command == 'load' and args.grants:
+        try:
+            SCHEMA.Bit(args.grants)
+        except ValueError as e:
+            parser.error(f"{e} Privileges are: {', '.join(SCHEMA.flags)}.")
+    try:
+        mapping = Mapping(args.map)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    tracer = Tracer([JsonLinesSink(args.trace)] if args.trace else [],
+                    ([ProfileCapture(args.profile)] if args.profile else []) + ([TracemallocCapture()] if args.trace_memory else []))
+    iom = IOManager(tracer)
+    hashPool = Hashing.Configure(args.workers, args.cost) if args.hash_passwords else None
+    try:
+        if not iom.ImportFiles(Log, args.sources, hashPool, mapping, replace=not args.skip_existing):
+            return 1
+        if args.command == 'load':
+            for table in iom.storage:
+                print(f'{table}: {iom.storage[table].Count()}')
+            if args.grants:
+                for name in ElevationTable(iom.ReadAll(iom.storage['elevation'])).Granting(args.grants):
+                    print(f'{args.grants}: {name}')
+        elif args.command == 'validate':
+            return 0 if iom.Validate(Log) else 1
+        elif args.command == 'merge':
+            with open(args.output, 'w', encoding='utf-8') as jsonFile:
+                iom.SaveJson(Log, jsonFile)
+        elif args.command == 'export':
+            with OpenExp(args.output, 'w') as expFile:
+                workers = args.jobs or os.cpu_count()
+                return 0 if iom.Export(Log, expFile, sidecar=args.sidecar, layout=args.layout, workers=workers) else 1
+        return 0
+    finally:
+        iom.Cleanup()
+        tracer.Close()
+        Hashing.Shutdown()
+
+if __name__ == '__main__':
+    sys.exit(Main())
@@ -3,9 +3,16 @@ from tkinter import ttk
 from tkinter import messagebox
 from ttkthemes import themed_tk as tk
 from datetime import datetime
-import threading
+import concurrent.futures
 import sys
 import os
+import tempfile
+
+from EntityModel import EntityModel
+from EntityQuery import EntityQuery
+from Events import dispatcher
+from LogSink import LogSink
+import Hashing
 
 class RootWindow(tk.ThemedTk):
     def __init__(self, *args, **kwargs):
@@ -59,8 +66,14 @@ class AutoScrollbar(ttk.Scrollbar):
         raise tkinter.TclError('place cannot be used  with this widget') 
 
 class TextArea(tkinter.Text):
+    """
+    The log panel. Append can be called from any thread: lines are batched by a LogSink, which also keeps the
+    full log in a rotating file at logPath, and only the last maxLines are kept in the widget.
+    """
     def __init__(self, master, width, height, **kwargs):
         self.master = master
+        self.maxLines = kwargs.pop('maxLines', 5000)
+        logPath = kwargs.pop('logPath', None)
         self.container = ttk.Frame(self.master)
         super().__init__(self.container, width=width, height=height, wrap='none', borderwidth=0, name=str(kwargs.pop('ID', '0')), undo=True)
         self.textVsb = AutoScrollbar(self.container, orient='vertical', command=self.yview)
@@ -70,6 +83,8 @@ class TextArea(tkinter.Text):
         self.configure(background='grey')
         self.configure(foreground='white')
         self.first = True
+        self.lines = 0
+        self.sink = LogSink(self, logPath, maxLines=self.maxLines)
 
     def SelectAll(self, event):
         event.widget.tag_add('sel','1.0','end')
@@ -83,13 +98,20 @@ class TextArea(tkinter.Text):
         self.container.pack(side='top', padx=padx, pady=pady)
 
     def Append(self, text):
+        self.sink.Append(text)
+
+    def Insert(self, lines, hidden=0):
+        if hidden:
+            lines = [f'[{self.Date()}] ... {hidden} more lines in the log file'] + lines
         self.config(state=tkinter.NORMAL)
-        if not self.first:
-            self.insert(tkinter.END, f'\n[{self.Date()}] {text}')
-        else:
-            self.insert(tkinter.END, f'[{self.Date()}] {text}')
-            self.first = False
+        self.insert(tkinter.END, ('' if self.first else '\n') + '\n'.join(lines))
+        self.first = False
+        self.lines += sum([line.count('\n') + 1 for line in lines])
+        if self.lines > self.maxLines:
+            self.delete('1.0', f'{self.lines - self.maxLines + 1}.0')
+            self.lines = self.maxLines
         self.config(state=tkinter.DISABLED)
+        self.see(tkinter.END)
 
     def Date(self):
         return datetime.now().strftime("%H:%M:%S")
@@ -145,14 +167,94 @@ class ScrollableTreeView(ttk.Treeview):
         self.container.grid_columnconfigure(0, weight=1)
         self.container.pack(**kwargs)
 
+class VirtualTreeView(ScrollableTreeView):
+    """
+    A ScrollableTreeView over an EntityModel which only ever holds the rows that are on screen. The scrollbar
+    and mouse wheel move a window over the model and Refresh() re-renders just that window, so opening or
+    adding to a table costs the same however many rows the model holds. Selection is tracked by row key so
+    it survives scrolling.
+    """
+    def __init__(self, master, options, model, rows=10, *args, **kwargs):
+        super().__init__(master, options, *args, height=rows, **kwargs)
+        self.model = model
+        self.rows = rows
+        self.top = 0
+        self.visible = {}
+        self.selected = set()
+        self.configure(yscrollcommand='')
+        self.scroll.configure(command=self.Scroll)
+        self.bind('<<TreeviewSelect>>', self.Select)
+        self.bind('<MouseWheel>', lambda event: self.Move(-1 if event.delta > 0 else 1))
+        self.bind('<Button-4>', lambda event: self.Move(-1))
+        self.bind('<Button-5>', lambda event: self.Move(1))
+
+    def Scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.top = int(float(amount) * len(self.model))
+            self.Refresh()
+        else:
+            self.Move(int(amount) * (self.rows if unit == 'pages' else 1))
+
+    def Move(self, rows):
+        self.top += rows
+        self.Refresh()
+        return 'break'
+
+    def See(self, position):
+        if position < self.top or position >= self.top + self.rows:
+            self.top = position - self.rows + 1
+        self.Refresh()
+
+    def Select(self, event):
+        selection = set(self.selection())
+        for iid, key in self.visible.items():
+            if iid in selection:
+                self.selected.add(key)
+            else:
+                self.selected.discard(key)
+
+    def SelectedKeys(self):
+        return [key for key in self.selected if key in self.model]
+
+    def Refresh(self):
+        total = len(self.model)
+        self.top = max(0, min(self.top, total - self.rows))
+        self.delete(*self.get_children())
+        self.visible = {}
+        for offset, row in enumerate(self.model.Slice(self.top, self.top + self.rows)):
+            iid = str(offset)
+            self.insert('', tkinter.END, iid, text='', values=tuple(row))
+            self.visible[iid] = self.model.Key(row)
+        self.selection_set([iid for iid, key in self.visible.items() if key in self.selected])
+        if total:
+            self.scroll.set(self.top / total, min(1.0, (self.top + self.rows) / total))
+        else:
+            self.scroll.set(0.0, 1.0)
+
 class Editor:
+    """
+    Base for the entity editors. When the window is closed, onClosed is called with the editor on the Tk thread,
+    once every password still being hashed has been added to changes. onEdited is called with the editor and the
+    rows changed by each edit, {key: row, or None if removed}, so they can be checked as they are made.
+    The grid shows the model through an EntityQuery, filtered by the search box as it is typed in and sorted by
+    clicking the column headings; views the query has to scan for are filled in from the Tk loop a chunk at a time.
+    """
     def __init__(self, window, options, **kwargs):
         self.window = window
         self.options = options
         self.entries = kwargs.pop('entries', [])
-        self.closed = threading.Event()
-        self.items = 0
-        self.results = []
+        self.onClosed = kwargs.pop('onClosed', None) or (lambda editor: None)
+        self.onEdited = kwargs.pop('onEdited', None) or (lambda editor, changes: None)
+        self.closed = False
+        self.model = EntityModel()
+        columns = list(options)
+        self.query = EntityQuery(self.model, sectors=columns.index('Sectors') if 'Sectors' in columns else None,
+                                 parent=columns.index('Parent') if 'Parent' in columns else None)
+        self.sortColumn = None
+        self.descending = False
+        self.scanJob = None
+        self.changes = {}
+        self.pending = {}
 
     def New(self):
         values = []
@@ -164,27 +266,96 @@ class Editor:
         for entry in self.entries:
             entry.Reset()
         self.window.focus()
-        for child in self.treeView.get_children():
-            if self.treeView.item(child)['values'][0] == values[0]:
-                messagebox.showwarning('Invalid Data', f"Entry with {self.options[0].lower()} '{values[0]}' already exists.")
-                return
-        self.items += 1
-        self.treeView.insert('', tkinter.END, self.items, text='', values=tuple(values))
+        if self.Exists(values[0]):
+            messagebox.showwarning('Invalid Data', f"Entry with {self.options[0].lower()} '{values[0]}' already exists.")
+            return
+        self.Add(values)
+
+    def Exists(self, key):
+        return key in self.pending or key in self.model
+
+    def AddHashed(self, values, column=1):
+        """
+        Hashes values[column] in the hashing pool and adds the row once the hash is ready, so the window stays
+        responsive. The finished hash is handed back to the Tk thread through the dispatcher.
+        """
+        key = values[0]
+        future = Hashing.GetPool().Submit(values[column])
+        self.pending[key] = (values, column, future)
+        future.add_done_callback(lambda future: dispatcher.Post(self.Hashed, key))
+
+    def Hashed(self, key):
+        if key not in self.pending:
+            return
+        values, column, future = self.pending.pop(key)
+        values[column] = future.result()
+        if self.closed:
+            self.changes[key] = list(values)
+            self.onEdited(self, {key: list(values)})
+            if not self.pending:
+                self.onClosed(self)
+        else:
+            self.Add(values)
+
+    def Finish(self):
+        """
+        Waits for the passwords still being hashed and adds their rows, for when the program is closing: the
+        dispatcher must be detached first, so the hashes finishing meanwhile are dropped rather than handed to the
+        Tk thread, which is blocked here. Returns the keys of the rows which could not be hashed.
+        """
+        concurrent.futures.wait([future for values, column, future in self.pending.values()])
+        failed = []
+        for key in list(self.pending):
+            try:
+                self.Hashed(key)
+            except Exception:
+                self.pending.pop(key, None)
+                failed.append(key)
+        return failed
+
+    def Drop(self):
+        """
+        Forgets the passwords still being hashed, for when the tables their rows were to be added to are being
+        replaced: their rows are never added, even once the hash is ready. Returns their keys.
+        """
+        keys = list(self.pending)
+        for values, column, future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if keys and self.closed:
+            #Closing() left calling onClosed to the last hash.
+            dispatcher.Post(self.onClosed, self)
+        return keys
+
+    def Add(self, values):
+        self.query.Add(list(values))
+        self.changes[values[0]] = list(values)
+        position = self.query.Position(values[0])
+        if position is not None:
+            self.treeView.See(position)
+        self.Scan()
+        self.onEdited(self, {values[0]: list(values)})
 
     def Remove(self):
-        self.items -= len(self.treeView.selection())
-        for item in self.treeView.selection():
-            self.treeView.delete(item)
+        removed = {}
+        for key in self.query.Remove(self.treeView.SelectedKeys()):
+            self.changes[key] = None
+            removed[key] = None
+            self.treeView.selected.discard(key)
+        self.Scan()
+        if removed:
+            self.onEdited(self, removed)
 
     def Populate(self, include=-1):
         self.contentFrame = ttk.Frame(self.window)
         self.contentFrame.pack(fill=tkinter.BOTH, expand=True)
         #Treeview
-        self.treeView = ScrollableTreeView(self.contentFrame, self.options)
+        self.treeView = VirtualTreeView(self.contentFrame, self.options, self.query)
         for option in self.options:
             self.treeView.column(option, anchor=tkinter.CENTER, width=70, minwidth=60)
             self.treeView.heading(option, text=option, anchor=tkinter.CENTER)
         self.treeView.pack(fill=tkinter.BOTH)
+        self.Searchable()
         #New Entity
         self.creatorContainer = ttk.Frame(self.contentFrame)
         self.creatorFrame = ttk.LabelFrame(self.creatorContainer, text='Create...')
@@ -211,19 +382,71 @@ class Editor:
         self.removeBtn = ttk.Button(self.newBottom, text='Remove', cursor='hand2', command=self.Remove, takefocus=False)
         self.removeBtn.pack()
 
+    def Searchable(self):
+        """
+        Adds the search box above the grid and makes the column headings sort it.
+        """
+        self.searchEntry = PlaceholderEntry(self.contentFrame, 'Search (sector:NAME, parent:NAME)')
+        self.searchEntry.pack(before=self.treeView.container, fill=tkinter.X, padx=10, pady=(10, 5))
+        self.searchEntry.bind('<KeyRelease>', self.Search)
+        for x, option in enumerate(self.options):
+            self.treeView.heading(option, command=lambda column=x: self.SortBy(column))
+
+    def Search(self, event=None):
+        search = self.searchEntry.get()
+        if self.searchEntry['style'] == 'Placeholder.TEntry':
+            search = ''
+        if search == self.query.search:
+            return
+        self.query.Filter(search)
+        self.treeView.top = 0
+        self.Scan()
+
+    def SortBy(self, column):
+        """
+        Sorts by a column, clicking it again sorts it the other way round and a third time puts the table order back.
+        """
+        if self.sortColumn != column:
+            self.sortColumn, self.descending = column, False
+        elif not self.descending:
+            self.descending = True
+        else:
+            self.sortColumn, self.descending = None, False
+        for x, option in enumerate(self.options):
+            arrow = (' \u25bc' if self.descending else ' \u25b2') if x == self.sortColumn else ''
+            self.treeView.heading(option, text=option + arrow)
+        self.query.Sort(self.sortColumn, self.descending)
+        self.treeView.top = 0
+        self.Scan()
+
+    def Scan(self):
+        """
+        Shows the view and, while the query is still scanning for it, carries on scanning from the Tk loop.
+        """
+        if self.scanJob is not None:
+            self.window.after_cancel(self.scanJob)
+            self.scanJob = None
+        self.treeView.Refresh()
+        if self.query.pending is not None:
+            self.scanJob = self.window.after(1, self.Scanned)
+
+    def Scanned(self):
+        self.scanJob = None
+        self.query.Step()
+        self.Scan()
+
     def Load(self, data):
-        for values in data:
-            self.treeView.insert('', tkinter.END, self.items, text='', values=tuple(values))
-            self.items += 1
+        self.query.Extend(data)
+        self.treeView.Refresh()
 
     def Closing(self):
-        try:
-            for child in self.treeView.get_children():
-                self.results.append(self.treeView.item(child)['values'])
-        except:
-            pass
-        self.closed.set()
+        self.closed = True
+        if self.scanJob is not None:
+            self.window.after_cancel(self.scanJob)
+            self.scanJob = None
         self.window.destroy()
+        if not self.pending:
+            dispatcher.Post(self.onClosed, self)
 
 def RelToAbs(relPath):
     try:
@@ -231,4 +454,26 @@ def RelToAbs(relPath):
     except Exception:
         basePath = os.path.abspath(".")
 
-    return os.path.join(basePath, relPath)
\ No newline at end of file
+    return os.path.join(basePath, relPath)
+
+def ScaledImage(path, width, height):
+    """
+    Returns path shrunk to fit in width x height as a PhotoImage. The scaled copy is cached as a PNG in the temp
+    directory, which Tk loads by itself, so PIL is only imported when the cache is missing or older than path.
+    """
+    name, _ = os.path.splitext(os.path.basename(path))
+    cachePath = os.path.join(tempfile.gettempdir(), f'clunksexp-{name}-{int(width)}x{int(height)}.png')
+    try:
+        if os.path.getmtime(cachePath) >= os.path.getmtime(path):
+            return tkinter.PhotoImage(file=cachePath)
+    except (OSError, tkinter.TclError):
+        pass
+    from PIL import Image, ImageTk
+    img = Image.open(path)
+    img.thumbnail([width, height], Image.LANCZOS)
+    try:
+        img.save(cachePath + '.tmp', 'PNG')
+        os.replace(cachePath + '.tmp', cachePath)
+    except OSError:
+        pass
+    return ImageTk.PhotoImage(img)
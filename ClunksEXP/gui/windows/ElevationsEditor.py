@@ -5,20 +5,23 @@ from tkinter import ttk
 import threading
 
 import gui.CustomWidgets as cw
+from Privileges import SCHEMA
+
+WIDTHS = {'Call Subservers': 75, 'Call Rooms': 55, 'Call Groups': 55, 'Call User': 50, 'Message Subserver': 95, 'Message Rooms': 80,
+          'Message Groups': 80, 'Message User': 80, 'Create Groups': 70}
 
 class ElevationsEditor(cw.Editor):
-    OPTIONS = {'Name': 35, 'Call Subservers': 75, 'Call Rooms': 55, 'Call Groups': 55, 'Call User': 50, 'Message Subserver': 95, 'Message Rooms': 80, 
-               'Message Groups': 80, 'Message User': 80, 'Create Groups': 70, 'Sectors': 35}
+    OPTIONS = {'Name': 35, **{flag: WIDTHS.get(flag, 70) for flag in SCHEMA.flags}, 'Sectors': 35}
 
-    def __init__(self, master, width, height):
+    def __init__(self, master, width, height, onClosed=None, onEdited=None):
         self.width = width
         self.height = height
         self.window = master.AddWindow(title='ClunksEXP - Elevations', icon=cw.RelToAbs('gui/img/icon.ico'), width=self.width, height=self.height, center=True, resizable=False)
         self.window.protocol('WM_DELETE_WINDOW', super().Closing)
         self.style = ttk.Style(self.window)
         self.style.configure('Placeholder.TEntry', foreground='#d5d5d5')
+        super().__init__(self.window, self.OPTIONS, onClosed=onClosed, onEdited=onEdited)
         self.Populate()
-        super().__init__(self.window, self.OPTIONS)
 
     def OnTreeViewClick(self, event):
         if self.treeView.identify_region(event.x, event.y) == 'separator':
@@ -39,23 +42,22 @@ class ElevationsEditor(cw.Editor):
         self.nameEntry.Reset()
         self.sectorsEntry.Reset()
         self.window.focus()
-        for child in self.treeView.get_children():
-            if self.treeView.item(child)['values'][0] == values[0]:
-                messagebox.showwarning('Invalid Data', f"Entry with name '{values[0]}' already exists.")
-                return
-        self.items += 1
-        self.treeView.insert('', tkinter.END, self.items, text='', values=tuple(values))
+        if self.Exists(values[0]):
+            messagebox.showwarning('Invalid Data', f"Entry with name '{values[0]}' already exists.")
+            return
+        self.Add(values)
 
     def Populate(self):
         self.contentFrame = ttk.Frame(self.window)
         self.contentFrame.pack(fill=tkinter.BOTH, expand=True)
         #Treeview
-        self.treeView = cw.ScrollableTreeView(self.contentFrame, tuple(self.OPTIONS.keys()))
+        self.treeView = cw.VirtualTreeView(self.contentFrame, tuple(self.OPTIONS.keys()), self.query)
         for option in self.OPTIONS:
             self.treeView.column(option, anchor=tkinter.CENTER, width=self.OPTIONS[option], minwidth=self.OPTIONS[option])
             self.treeView.heading(option, text=option, anchor=tkinter.CENTER)
         self.treeView.bind('<Button-1>', self.OnTreeViewClick)
         self.treeView.pack(fill=tkinter.BOTH)
+        self.Searchable()
         #New Elevation
         self.creatorContainer = ttk.Frame(self.contentFrame)
         self.creatorFrame = ttk.LabelFrame(self.creatorContainer, text='Create...')
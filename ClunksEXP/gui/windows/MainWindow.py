@@ -1,117 +1,231 @@
 import tkinter
 from tkinter import ttk
 from tkinter import filedialog
+from tkinter import messagebox
 from ttkthemes import themed_tk as tk
-from PIL import ImageTk, Image
-import threading
+import sqlite3
+import tempfile
+import time
+import os
 
-from IOManager import IOManager
-from ThreadingHelper import STWThread, QUIT
-from gui.CustomWidgets import TextArea, RelToAbs
-from gui.windows.UsersEditor import UsersEditor
-from gui.windows.SubServersEditor import SubServersEditor
-from gui.windows.RoomsEditor import RoomsEditor
-from gui.windows.ElevationsEditor import ElevationsEditor
+import Hashing
+from Events import dispatcher
+from ExpFile import OpenExp
+from Jobs import JobPool
+from gui.CustomWidgets import TextArea, RelToAbs, ScaledImage
+
+#Jobs which replace the tables.
+REPLACING = ('load', 'import', 'recover')
 
 class MainWindow():
-    def __init__(self, master, width, height):
+    """
+    The window is shown before the storage and exporter are set up, which happens in the background; the editor
+    windows are only imported when first opened. started is the time.perf_counter() the program started at, the
+    time from it until the buttons are enabled is logged.
+    """
+    def __init__(self, master, width, height, started=None):
         self.master = master
+        self.started = started if started is not None else time.perf_counter()
         self.width = width
         self.height = height
         self.master.SetupWindow(title='ClunksEXP', icon=RelToAbs('gui/img/icon.ico'), width=self.width, height=self.height, center=True, resizable=False, onClosing=self.Closing)
         self.master.protocol('WM_DELETE_WINDOW', self.Closing)
         self.Setup()
 
-    def ResetUserEditor(self):
-        self.iom.Save(self.iom.storage['user'], self.userEditor.results)
+    #Edits are written to the session store as they are made (see Edited), the editors only need forgetting.
+    def ResetUserEditor(self, editor):
         self.userEditor = None
         self.log.Append(f'Saved [users]')
 
-    def ResetServerEditor(self):
-        self.iom.Save(self.iom.storage['subserver'], self.subserverEditor.results)
+    def ResetServerEditor(self, editor):
         self.subserverEditor = None
         self.log.Append(f'Saved [subservers]')
 
-    def ResetRoomsEditor(self):
-        self.iom.Save(self.iom.storage['room'], self.roomsEditor.results)
+    def ResetRoomsEditor(self, editor):
         self.roomsEditor = None
         self.log.Append(f'Saved [rooms]')
 
-    def ResetElevationEditor(self):
-        self.iom.Save(self.iom.storage['elevation'], self.elevationEditor.results)
+    def ResetElevationEditor(self, editor):
         self.elevationEditor = None
         self.log.Append(f'Saved [elevations]')
 
+    def LoadTemp(self, table):
+        try:
+            return self.iom.ReadAll(table)
+        except (sqlite3.Error, ValueError):
+            messagebox.showerror('Oh no!', 'Data has been corrupted, please restart the program.')
+            dispatcher.Emit('quit')
+            return []
+
     def OpenUserEditor(self):
         if not self.userEditor:
-            self.userEditor = UsersEditor(self.master, 950, 370)
-            self.userEditor.Load(self.iom.LoadTemp(self.iom.storage['user']))
-            self.watchUsersThread = STWThread(mainFunction=self.ResetUserEditor, waitFlags=[self.userEditor.closed], name="WatchUsersThread")
-            self.watchUsersThread.start()
-        else:
+            from gui.windows.UsersEditor import UsersEditor
+            self.userEditor = UsersEditor(self.master, 950, 370, onClosed=self.ResetUserEditor, onEdited=lambda editor, changes: self.Edited('user', changes))
+            self.Index()
+            self.userEditor.Load(self.LoadTemp(self.iom.storage['user']))
+        elif not self.userEditor.closed:
             self.userEditor.window.lift()
 
     def OpenSubServerEditor(self):
         if not self.subserverEditor:
-            self.subserverEditor = SubServersEditor(self.master, 950, 340)
-            self.subserverEditor.Load(self.iom.LoadTemp(self.iom.storage['subserver']))
-            self.watchServersThread = STWThread(mainFunction=self.ResetServerEditor, waitFlags=[self.subserverEditor.closed], name="WatchSubServersThread")
-            self.watchServersThread.start()
-        else:
+            from gui.windows.SubServersEditor import SubServersEditor
+            self.subserverEditor = SubServersEditor(self.master, 950, 340, onClosed=self.ResetServerEditor, onEdited=lambda editor, changes: self.Edited('subserver', changes))
+            self.Index()
+            self.subserverEditor.Load(self.LoadTemp(self.iom.storage['subserver']))
+        elif not self.subserverEditor.closed:
             self.subserverEditor.window.lift()
 
     def OpenRoomsEditor(self):
         if not self.roomsEditor:
-            self.roomsEditor = RoomsEditor(self.master, 950, 340)
-            self.roomsEditor.Load(self.iom.LoadTemp(self.iom.storage['room']))
-            self.watchRoomsThread = STWThread(mainFunction=self.ResetRoomsEditor, waitFlags=[self.roomsEditor.closed], name="WatchRoomsThread")
-            self.watchRoomsThread.start()
-        else:
+            from gui.windows.RoomsEditor import RoomsEditor
+            self.roomsEditor = RoomsEditor(self.master, 950, 340, onClosed=self.ResetRoomsEditor, onEdited=lambda editor, changes: self.Edited('room', changes))
+            self.Index()
+            self.roomsEditor.Load(self.LoadTemp(self.iom.storage['room']))
+        elif not self.roomsEditor.closed:
             self.roomsEditor.window.lift()
 
     def OpenElevationsEditor(self):
         if not self.elevationEditor:
-            self.elevationEditor = ElevationsEditor(self.master, 950, 400)
-            self.elevationEditor.Load(self.iom.LoadTemp(self.iom.storage['elevation']))
-            self.watchElevationsThread = STWThread(mainFunction=self.ResetElevationEditor, waitFlags=[self.elevationEditor.closed], name="WatchElevationsThread")
-            self.watchElevationsThread.start()
-        else:
+            from gui.windows.ElevationsEditor import ElevationsEditor
+            self.elevationEditor = ElevationsEditor(self.master, 950, 400, onClosed=self.ResetElevationEditor, onEdited=lambda editor, changes: self.Edited('elevation', changes))
+            self.Index()
+            self.elevationEditor.Load(self.LoadTemp(self.iom.storage['elevation']))
+        elif not self.elevationEditor.closed:
             self.elevationEditor.window.lift()
 
+    def Index(self):
+        """
+        Builds the validator for the editors in the background, edits made before it is ready are queued.
+        """
+        if self.validator is None and self.edits is None:
+            self.edits = []
+            self.jobs.Submit('index', lambda job: self.iom.Validator(), onDone=self.Indexed)
+
+    def Indexed(self, job, validator):
+        edits, self.edits = self.edits, None
+        self.validator = validator
+        if validator is not None:
+            for table, changes in edits:
+                validator.Update(table, changes)
+            problems = len(validator.problems)
+            self.log.Append(f'{problems} problem{"s" if problems != 1 else ""} found, edits will be checked as they are made.')
+        self.JobDone(job, None)
+
+    def Edited(self, table, changes):
+        self.iom.Apply(self.iom.storage[table], changes)
+        if self.edits is not None:
+            self.edits.append((table, dict(changes)))
+            return
+        if self.validator is None:
+            return
+        found, fixed = self.validator.Update(table, changes)
+        for problem in fixed:
+            self.log.Append(f'Fixed: {problem}')
+        for problem in found:
+            self.log.Append(f'PROBLEM: {problem}')
+
+    def RunJob(self, name, function, *args):
+        if name in REPLACING:
+            self.CloseEditors()
+        for button in self.jobButtons:
+            button.configure(state=tkinter.DISABLED)
+        self.cancelBtn.configure(state=tkinter.NORMAL)
+        self.status.configure(text=f'Running {name}...')
+        self.jobs.Submit(name, function, *args, onDone=self.JobDone)
+
+    def CloseEditors(self):
+        """
+        Closes the open editors before a job replaces the tables, so none of them keeps showing the old rows and
+        writes them back over the new ones. Rows still being hashed, by closed editors too, are dropped for the
+        same reason. Their buttons stay disabled until the job is done.
+        """
+        editors = [editor for editor in (self.userEditor, self.subserverEditor, self.roomsEditor, self.elevationEditor) if editor is not None]
+        dropped = []
+        for editor in editors:
+            dropped.extend(editor.Drop())
+        closing = [editor for editor in editors if not editor.closed]
+        for editor in closing:
+            editor.Closing()
+        if closing:
+            self.log.Append('Closed the open editors, the tables are being replaced.')
+        if dropped:
+            self.log.Append(f"Not saved, the tables are being replaced: {', '.join(dropped)}.")
+
+    def JobProgress(self, job, done, total):
+        self.status.configure(text=f'Running {job.name}... {done}/{total}' if total else f'Running {job.name}... {done}')
+
+    def JobDone(self, job, result):
+        if job.name in REPLACING:
+            #The tables were replaced, index them again when an editor is next opened.
+            self.validator = None
+        if self.jobs.Busy():
+            return
+        if self.closing:
+            self.Closing()
+            return
+        for button in self.jobButtons:
+            button.configure(state=tkinter.NORMAL)
+        self.cancelBtn.configure(state=tkinter.DISABLED)
+        self.status.configure(text='')
+
+    def Cancel(self):
+        self.jobs.CancelAll()
+        self.status.configure(text='Cancelling...')
+
     def Export(self):
-        try:
-            with filedialog.asksaveasfile(defaultextension='.exp', filetypes=[('EXP File', '.exp')]) as exp:
-                self.iom.Export(self.log.Append, exp)
-        except AttributeError:
-            pass
-        except:
-            self.log.Append('EXPORT FAILED')
+        path = filedialog.asksaveasfilename(defaultextension='.exp', filetypes=[('EXP File', '.exp'), ('Compressed EXP File', '.exp.gz')])
+        if path:
+            self.RunJob('export', self.ExportJob, path, self.sidecar.get())
+
+    #The sidecar is written from the whole document, which costs an incremental export most of what it saves.
+    def ExportJob(self, job, path, sidecar):
+        with OpenExp(path, 'w') as exp:
+            return self.iom.Export(job.Log, exp, incremental=True, cancelled=job.cancelled, progressFunc=job.Progress,
+                                  sidecar=sidecar)
 
     def Load(self):
-        try:
-            with filedialog.askopenfile(defaultextension='.exp', filetypes=[('EXP File', '.exp')]) as exp:
-                self.iom.LoadExp(self.log.Append, exp)
-        except AttributeError:
-            pass
+        path = filedialog.askopenfilename(defaultextension='.exp', filetypes=[('EXP File', '.exp .exp.gz')])
+        if path:
+            self.RunJob('load', self.LoadJob, path)
+
+    def LoadJob(self, job, path):
+        with OpenExp(path) as exp:
+            return self.iom.LoadExp(job.Log, exp, cancelled=job.cancelled)
+
+    def Import(self):
+        from Sources import EXTENSIONS
+        paths = filedialog.askopenfilenames(filetypes=[('Import Sources', ' '.join(['*' + extension for extension in EXTENSIONS]))])
+        if paths:
+            self.RunJob('import', lambda job: self.iom.ImportFiles(job.Log, list(paths), Hashing.GetPool(), cancelled=job.cancelled))
+
+    def Validate(self):
+        self.RunJob('validate', lambda job: self.iom.Validate(job.Log))
 
     def Populate(self):
         self.contentFrame = ttk.Frame(self.master.container)
         self.contentFrame.pack(fill=tkinter.BOTH, expand=True)
-        img = Image.open(RelToAbs('gui/img/title.png'))
-        img.thumbnail([self.width, self.height/10], Image.ANTIALIAS)
-        self.titleImg = ImageTk.PhotoImage(img)
+        self.titleImg = ScaledImage(RelToAbs('gui/img/title.png'), self.width, self.height/10)
         self.titleLbl = ttk.Label(self.contentFrame, image=self.titleImg)
         self.titleLbl.pack(padx=(10, 0), pady=15)
         self.topBtns = ttk.Frame(self.contentFrame)
         self.loadBtn = ttk.Button(self.topBtns, text='Load EXP', cursor='hand2', command=self.Load, takefocus=False)
+        self.importBtn = ttk.Button(self.topBtns, text='Import', cursor='hand2', command=self.Import, takefocus=False)
         self.usersBtn = ttk.Button(self.topBtns, text='Edit Users', cursor='hand2', command=self.OpenUserEditor, takefocus=False)
         self.serversBtn = ttk.Button(self.topBtns, text='Edit Sub-Servers', cursor='hand2', command=self.OpenSubServerEditor, takefocus=False)
         self.roomsBtn = ttk.Button(self.topBtns, text='Edit Rooms', cursor='hand2', command=self.OpenRoomsEditor, takefocus=False)
         self.elevationsBtn = ttk.Button(self.topBtns, text='Edit Elevations', cursor='hand2', command=self.OpenElevationsEditor, takefocus=False)
         self.logFrame = ttk.LabelFrame(self.contentFrame, text='Log')
-        self.log = TextArea(self.logFrame, 70, 10)
-        self.exportBtn = ttk.Button(self.contentFrame, text='Export', cursor='hand2', command=self.Export, takefocus=False)
+        self.log = TextArea(self.logFrame, 70, 10, logPath=os.path.join(tempfile.gettempdir(), 'clunksexp.log'))
+        self.bottomBtns = ttk.Frame(self.contentFrame)
+        self.validateBtn = ttk.Button(self.bottomBtns, text='Validate', cursor='hand2', command=self.Validate, takefocus=False)
+        self.exportBtn = ttk.Button(self.bottomBtns, text='Export', cursor='hand2', command=self.Export, takefocus=False)
+        self.cancelBtn = ttk.Button(self.bottomBtns, text='Cancel', cursor='hand2', command=self.Cancel, takefocus=False, state=tkinter.DISABLED)
+        self.sidecar = tkinter.BooleanVar(self.master, value=False)
+        self.sidecarChk = ttk.Checkbutton(self.bottomBtns, text='Write sidecar', variable=self.sidecar, cursor='hand2', takefocus=False)
+        self.status = ttk.Label(self.contentFrame)
+        self.jobButtons = [self.loadBtn, self.importBtn, self.usersBtn, self.serversBtn, self.roomsBtn, self.elevationsBtn, self.validateBtn, self.exportBtn]
         self.loadBtn.pack(padx=(0, 10), side=tkinter.LEFT)
+        self.importBtn.pack(padx=(0, 10), side=tkinter.LEFT)
         self.usersBtn.pack(padx=(0, 10), side=tkinter.LEFT)
         self.serversBtn.pack(padx=(0, 10), side=tkinter.LEFT)
         self.roomsBtn.pack(padx=(0, 10), side=tkinter.LEFT)
@@ -119,19 +233,84 @@ class MainWindow():
         self.topBtns.pack()
         self.log.pack()
         self.logFrame.pack(pady=(20, 6))
-        self.exportBtn.pack(pady=10)
+        self.validateBtn.pack(padx=(0, 10), side=tkinter.LEFT)
+        self.exportBtn.pack(padx=(0, 10), side=tkinter.LEFT)
+        self.sidecarChk.pack(padx=(0, 10), side=tkinter.LEFT)
+        self.cancelBtn.pack(side=tkinter.LEFT)
+        self.bottomBtns.pack(pady=(10, 0))
+        self.status.pack()
 
     def Setup(self):
         self.elevationEditor = None
         self.userEditor = None
         self.subserverEditor = None
         self.roomsEditor = None
-        self.iom = IOManager()
+        self.closing = False
+        self.validator = None
+        self.edits = None
+        self.iom = None
         self.Populate()
-        self.watchQuitThread = STWThread(mainFunction=self.Closing, waitFlags=[QUIT], name="WatchQuitThread")
-        self.watchQuitThread.start()
+        dispatcher.Attach(self.master)
+        dispatcher.Subscribe('quit', self.Closing)
+        self.jobs = JobPool(self.log.Append, self.JobProgress)
+        for button in self.jobButtons:
+            button.configure(state=tkinter.DISABLED)
+        self.status.configure(text='Starting...')
+        self.jobs.Submit('start', self.StartJob, onDone=self.Started)
+
+    def StartJob(self, job):
+        from EntityStore import Sessions
+        from IOManager import IOManager
+        sessions = Sessions()
+        return IOManager(session=True), sessions
+
+    def Started(self, job, result):
+        self.iom, sessions = result if result is not None else (None, [])
+        if self.iom is None and not self.closing:
+            self.status.configure(text='Could not start, please restart the program.')
+            return
+        if self.iom is not None:
+            self.log.Append(f'Ready in {(time.perf_counter() - self.started) * 1000:.0f} ms.')
+        self.JobDone(job, None)
+        if self.iom is not None and sessions and not self.closing:
+            self.Recover(sessions)
+
+    def Recover(self, sessions):
+        """
+        Offers to recover the sessions left behind by crashes, newest first. The first one accepted is recovered,
+        any declined are deleted and any after the accepted one are offered again next time.
+        """
+        from EntityStore import Discard
+        for path, modified in sessions:
+            modified = time.strftime('%d/%m/%Y %H:%M', time.localtime(modified))
+            if messagebox.askyesno('Recover Session', f'ClunksEXP did not close properly. Recover the session last changed {modified}?'):
+                self.RunJob('recover', self.RecoverJob, path)
+                return
+            Discard(path)
+
+    def RecoverJob(self, job, path):
+        counts = self.iom.Recover(path)
+        job.Log(f"Recovered {', '.join([f'{count} {table}s' for table, count in counts.items()])}.")
+        return True
 
     def Closing(self):
-        QUIT.set()
-        self.iom.Cleanup()
+        if self.jobs.Busy():
+            #Finish closing once the running job has stopped, it may be waiting on this loop.
+            self.closing = True
+            self.Cancel()
+            return
+        #Rows still being hashed would be lost with the hashing pool, add them before it is shut down. The
+        #dispatcher is detached first so the hashes finishing meanwhile aren't handed to a Tk about to be destroyed.
+        dispatcher.Detach()
+        failed = []
+        for editor in (self.userEditor, self.subserverEditor, self.roomsEditor, self.elevationEditor):
+            if editor is not None and editor.pending:
+                failed.extend(editor.Finish())
+        if failed:
+            messagebox.showwarning('Not Saved', f"Could not hash the passwords of: {', '.join(failed)}.")
+        self.jobs.Shutdown()
+        self.log.sink.Close()
+        Hashing.Shutdown()
+        if self.iom:
+            self.iom.Cleanup()
         self.master.destroy()
\ No newline at end of file
@@ -1,4 +1,3 @@
-import bcrypt
 import tkinter
 from tkinter import ttk
 from tkinter import messagebox
@@ -10,14 +9,14 @@ import gui.CustomWidgets as cw
 class UsersEditor(cw.Editor):
     OPTIONS = ('Username', 'Password', 'Sectors', 'Global')
 
-    def __init__(self, master, width, height):
+    def __init__(self, master, width, height, onClosed=None, onEdited=None):
         self.width = width
         self.height = height
         self.window = master.AddWindow(title='ClunksEXP - Users', icon=cw.RelToAbs('gui/img/icon.ico'), width=self.width, height=self.height, center=True, resizable=False)
         self.window.protocol('WM_DELETE_WINDOW', super().Closing)
         self.style = ttk.Style(self.window)
         self.style.configure('Placeholder.TEntry', foreground='#d5d5d5')
-        super().__init__(self.window, self.OPTIONS)
+        super().__init__(self.window, self.OPTIONS, onClosed=onClosed, onEdited=onEdited)
         super().Populate(include=3)
         #Add Global checkbutton
         self.isGlobal = cw.LabeledCheckbutton(self.newTop, self.OPTIONS[3])
@@ -38,13 +37,12 @@ class UsersEditor(cw.Editor):
         for entry in self.entries:
             entry.Reset()
         self.window.focus()
-        if values[1]:
-            values[1] = bcrypt.hashpw(values[1].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         values.append(str(bool(self.isGlobal.variable.get())))
         self.isGlobal.variable.set(0)
-        for child in self.treeView.get_children():
-            if self.treeView.item(child)['values'][0] == values[0]:
-                messagebox.showwarning('Invalid Data', f"Entry with {self.options[0].lower()} '{values[0]}' already exists.")
-                return
-        self.items += 1
-        self.treeView.insert('', tkinter.END, self.items, text='', values=tuple(values))
\ No newline at end of file
+        if self.Exists(values[0]):
+            messagebox.showwarning('Invalid Data', f"Entry with {self.options[0].lower()} '{values[0]}' already exists.")
+            return
+        if values[1]:
+            self.AddHashed(values)
+        else:
+            self.Add(values)
\ No newline at end of file
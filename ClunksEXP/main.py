@@ -1,7 +1,12 @@
+import time
+started = time.perf_counter()
+import multiprocessing
+
 from gui.CustomWidgets import RootWindow
 from gui.windows.MainWindow import MainWindow
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = RootWindow(theme='equilux')
-    mainWindow = MainWindow(root, 600, 370)
-    root.mainloop()
\ No newline at end of file
+    mainWindow = MainWindow(root, 600, 420, started=started)
+    root.mainloop()
@@ -0,0 +1,82 @@
+import io
+import random
+
+from Validator import TABLES
+
+def Generate(seed, subservers=4, rooms=20, users=40, sectors=6, elevations=3):
+    """
+    Returns random subserver, room, elevation and user tables. They are small enough for exports to be
+    compared whole, and often invalid in some way (clashing elevations, users no elevation covers).
+    """
+    r = random.Random(seed)
+    names = [f's{x}' for x in range(sectors)]
+    def Sectors():
+        if r.random() < 0.4:
+            return ''
+        return r.choice([',', ', ']).join([r.choice(names) for x in range(r.randint(1, 3))])
+    subserverRows = [[f'sub{x}', Sectors()] for x in range(subservers)]
+    roomRows = []
+    for x in range(rooms):
+        parent = r.choice(subserverRows)[0] if not roomRows or r.random() < 0.4 else r.choice(roomRows)[0]
+        roomRows.append([f'room{x}', f'pw{x}', parent, Sectors()])
+    elevationSectors = [f'e{x}' for x in range(elevations)]
+    elevationRows = [[f'elv{x}'] + [r.choice(['True', 'False']) for y in range(9)] + [elevationSectors[x]] for x in range(elevations)]
+    userRows = []
+    for x in range(users):
+        userSectors = [r.choice(elevationSectors)] + [r.choice(names) for y in range(r.randint(0, 3))]
+        r.shuffle(userSectors)
+        userRows.append([f'user{x}', f'h{x}', ','.join(userSectors), r.choice(['True', 'False', 'False', 'False'])])
+    return subserverRows, roomRows, elevationRows, userRows
+
+def Store(iom, tables):
+    for table, rows in zip(TABLES, tables):
+        iom.Save(iom.storage[table], rows)
+
+def Export(iom, **kwargs):
+    """
+    Exports to a string, returning whether the export succeeded, the .exp and what was logged.
+    """
+    expFile = io.StringIO()
+    expFile.name = 'test.exp'
+    logs = []
+    exported = iom.Export(logs.append, expFile, **kwargs)
+    return exported, expFile.getvalue(), logs
+
+def Edit(iom, r, step):
+    """
+    Makes one random edit to the store, of the kinds the editors make.
+    """
+    table = r.choice(['user', 'user', 'room', 'subserver', 'elevation'])
+    store = iom.storage[table]
+    rows = store.All()
+    sectors = lambda: r.choice(['', 's1', 's2, s3', 's0,s4', 's5'])
+    op = r.random()
+    row = list(r.choice(rows))
+    if table == 'user':
+        if op < 0.3:
+            row[1] = f'new{step}'
+        elif op < 0.6:
+            row[2] = ','.join([sector for sector in row[2].split(',') if sector.startswith('e')] + [sectors()])
+        elif op < 0.8:
+            store.Delete(row[0])
+            return
+        else:
+            row[0] = f'newuser{step}'
+    elif table == 'room':
+        if op < 0.4:
+            row[3] = sectors()
+        elif op < 0.7:
+            row[2] = r.choice(iom.storage['subserver'].All())[0]
+        elif op < 0.85:
+            row = [f'newroom{step}', 'p', r.choice(rows)[0], sectors()]
+        else:
+            row[1] = 'pw'
+    elif table == 'subserver':
+        row = row if op < 0.6 else [f'newsub{step}', '']
+        row[1] = sectors()
+    else:
+        if op < 0.5:
+            row[1] = 'True' if row[1] == 'False' else 'False'
+        else:
+            row[-1] = r.choice(['e0', 'e1', 'e2', 'e0,e1'])
+    store.Upsert(row)
@@ -0,0 +1,101 @@
+from Diff import Diff, Keyed, Merge, MergeSectors, OURS, THEIRS
+
+FLAGS = ['False'] * 9
+
+def Config(*rows):
+    """
+    Builds a configuration from (table, row) pairs on top of a subserver, a room, an elevation and two users.
+    """
+    base = [('subserver', ['s1', 'a']), ('room', ['r1', 'p', 's1', 'a']), ('elevation', ['e1'] + FLAGS + ['a']),
+            ('user', ['u1', 'h1', 'a', 'False']), ('user', ['u2', 'h2', 'b', 'False'])]
+    return Keyed(base + list(rows))
+
+def Without(config, table, key):
+    del config[table][key]
+    return config
+
+def test_diff():
+    base = Config(('user', ['u3', 'h3', 'c', 'False']))
+    other = Without(Config(('user', ['u2', 'h9', 'b', 'False']), ('room', ['r2', 'p', 's1', ''])), 'user', 'u1')
+    diffs = Diff(base, other)
+    assert diffs['subserver'].added == diffs['subserver'].removed == diffs['subserver'].changed == {}
+    assert not diffs['subserver']
+    assert list(diffs['room'].added) == ['r2']
+    assert sorted(diffs['user'].removed) == ['u1', 'u3']
+    assert diffs['user'].changed == {'u2': (['u2', 'h2', 'b', 'False'], ['u2', 'h9', 'b', 'False'])}
+    assert list(diffs['user'].Lines()) == ["- user 'u1'", "- user 'u3'", "~ user 'u2': password changed"]
+    assert diffs['user'].Summary() == 'user: 0 added, 2 removed, 1 changed'
+
+def test_merge_sectors():
+    assert MergeSectors('a,b', 'a,b,c', 'b,d') == 'b,c,d'
+    assert MergeSectors('a', 'a', 'a') == 'a'
+    assert MergeSectors(None, 'x,y', 'y,z') == 'x,y,z'
+    assert MergeSectors('a,b', '', 'a,b') == ''
+
+def test_clean_merge():
+    base = Config()
+    ours = Config(('user', ['u1', 'h1', 'a,c', 'False']), ('room', ['r2', 'p', 's1', '']))
+    theirs = Without(Config(('user', ['u1', 'h7', 'a', 'False']), ('subserver', ['s2', ''])), 'user', 'u2')
+    merged, conflicts = Merge(base, ours, theirs)
+    assert conflicts == []
+    assert merged['user'] == {'u1': ['u1', 'h7', 'a,c', 'False']}
+    assert list(merged['room']) == ['r1', 'r2']
+    assert list(merged['subserver']) == ['s1', 's2']
+
+def test_sectors_merge_as_sets():
+    base = Config()
+    ours = Config(('room', ['r1', 'p', 's1', 'a,b']))
+    theirs = Config(('room', ['r1', 'p', 's1', 'c']))
+    merged, conflicts = Merge(base, ours, theirs)
+    assert conflicts == []
+    assert merged['room']['r1'] == ['r1', 'p', 's1', 'b,c']
+
+def test_delete_modify():
+    base = Config()
+    changed = Config(('user', ['u1', 'h1', 'a', 'True']))
+    removed = Without(Config(), 'user', 'u1')
+    merged, conflicts = Merge(base, removed, changed)
+    [conflict] = conflicts
+    assert (conflict.table, conflict.key, conflict.kind, conflict.columns) == ('user', 'u1', 'delete/modify', ())
+    assert conflict.row is None and 'u1' not in merged['user']
+    assert str(conflict) == f"User 'u1' was removed in {OURS} and changed in {THEIRS}."
+    merged, [conflict] = Merge(base, removed, changed, prefer=THEIRS)
+    assert merged['user']['u1'] == conflict.row == ['u1', 'h1', 'a', 'True']
+
+    merged, [conflict] = Merge(base, changed, removed)
+    assert conflict.kind == 'delete/modify'
+    assert merged['user']['u1'] == ['u1', 'h1', 'a', 'True']
+    assert str(conflict) == f"User 'u1' was removed in {THEIRS} and changed in {OURS}."
+
+def test_modify_modify():
+    base = Config()
+    ours = Config(('room', ['r1', 'q', 's1', 'a,b']))
+    theirs = Config(('room', ['r1', 'z', 's1', 'a,c']))
+    merged, [conflict] = Merge(base, ours, theirs)
+    assert (conflict.kind, conflict.columns) == ('modify/modify', ('password',))
+    assert merged['room']['r1'] == conflict.row == ['r1', 'q', 's1', 'a,b,c']
+    assert str(conflict) == "Room 'r1' has conflicting changes to password."
+    merged, [conflict] = Merge(base, ours, theirs, prefer=THEIRS)
+    assert merged['room']['r1'] == ['r1', 'z', 's1', 'a,b,c']
+
+def test_add_add():
+    base = Config()
+    ours = Config(('subserver', ['s2', 'x']), ('user', ['u3', 'h3', 'c', 'False']))
+    theirs = Config(('subserver', ['s2', 'y']), ('user', ['u3', 'h4', 'c', 'True']))
+    merged, conflicts = Merge(base, ours, theirs)
+    assert [c.kind for c in conflicts] == ['add/add']
+    [conflict] = conflicts
+    assert conflict.columns == ('password', 'global')
+    assert merged['user']['u3'] == ['u3', 'h3', 'c', 'False']
+    assert str(conflict) == "User 'u3' was added in both with different password, global."
+    assert merged['subserver']['s2'] == ['s2', 'x,y']
+    merged, _ = Merge(base, ours, theirs, prefer=THEIRS)
+    assert merged['user']['u3'] == ['u3', 'h4', 'c', 'True']
+
+def test_merge_key_order():
+    base = Config(('user', ['u0', 'h0', '', 'False']))
+    ours = Config(('user', ['u4', 'h4', '', 'False']))
+    theirs = Config(('user', ['u0', 'h0', '', 'False']), ('user', ['u3', 'h3', '', 'False']))
+    merged, conflicts = Merge(base, Without(ours, 'user', 'u1'), theirs)
+    assert conflicts == []
+    assert list(merged['user']) == ['u2', 'u4', 'u3']
@@ -0,0 +1,73 @@
+import threading
+
+from Events import Dispatcher
+
+class Widget:
+    """
+    Stands in for the Tk widget a Dispatcher is attached to, running what it is asked to schedule when told to.
+    Records the threads it was called from.
+    """
+    def __init__(self):
+        self.scheduled = []
+        self.failing = False
+        self.threads = set()
+
+    def after_idle(self, callback):
+        self.threads.add(threading.get_ident())
+        if self.failing:
+            raise RuntimeError('main thread is not in main loop')
+        self.scheduled.append(callback)
+
+    def after(self, ms, callback):
+        self.after_idle(callback)
+
+    def Run(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for callback in scheduled:
+            callback()
+
+def test_post_after_failed_wakeup():
+    widget = Widget()
+    dispatcher = Dispatcher()
+    dispatcher.Attach(widget)
+    called = []
+    widget.failing = True
+    try:
+        dispatcher.Post(called.append, 1)
+    except RuntimeError:
+        pass
+    widget.failing = False
+    thread = threading.Thread(target=dispatcher.Post, args=(called.append, 2))
+    thread.start()
+    thread.join()
+    widget.Run()
+    assert called == [1, 2]
+
+def test_posts_from_other_threads_are_polled():
+    widget = Widget()
+    dispatcher = Dispatcher()
+    dispatcher.Attach(widget)
+    called = []
+    threads = [threading.Thread(target=dispatcher.Post, args=(called.append, x)) for x in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert called == []
+    widget.Run()
+    assert sorted(called) == list(range(10))
+    assert widget.threads == {threading.get_ident()}
+    dispatcher.Detach()
+    widget.Run()
+    assert widget.scheduled == []
+
+def test_failing_callback_keeps_draining(capsys):
+    widget = Widget()
+    dispatcher = Dispatcher()
+    dispatcher.Attach(widget)
+    called = []
+    dispatcher.Post(lambda: 1 / 0)
+    dispatcher.Post(called.append, 1)
+    widget.Run()
+    assert called == [1]
+    assert 'ZeroDivisionError' in capsys.readouterr().err
@@ -0,0 +1,69 @@
+import random
+
+from IOManager import IOManager
+from configs import Edit, Export, Generate, Store
+
+def test_incremental_matches_full():
+    for seed in range(40):
+        r = random.Random(seed)
+        iom = IOManager()
+        try:
+            Store(iom, Generate(seed, subservers=r.randint(1, 6)))
+            for step in range(8):
+                exported, incremental, logs = Export(iom, incremental=True)
+                assert (exported, incremental, logs) == Export(iom), (seed, step)
+                Edit(iom, r, step)
+        finally:
+            iom.Cleanup()
+
+def test_last_subserver_registration():
+    #A sectored room directly under a subserver without sectors registers the last subserver instead.
+    iom = IOManager()
+    try:
+        Store(iom, ([['a', ''], ['b', 's1']], [['r', 'p', 'a', 's2']], [['e'] + ['False'] * 9 + ['e']],
+                    [['u', 'h', 'e,s2', 'False'], ['v', 'h', 'e,s1', 'False']]))
+        Export(iom, incremental=True)
+        iom.storage['room'].Upsert(['r', 'p', 'a', 's1'])
+        assert Export(iom, incremental=True) == Export(iom)
+        iom.storage['subserver'].Upsert(['c', ''])
+        assert Export(iom, incremental=True) == Export(iom)
+    finally:
+        iom.Cleanup()
+
+def test_edit_between_read_and_snapshot():
+    #An edit landing after the tables were read must still be exported by the next incremental export.
+    iom = IOManager()
+    try:
+        Store(iom, ([['sub', 'a']], [['r', 'p', 'sub', 'a']], [['e'] + ['False'] * 9 + ['staff']], [['u', 'pw1', 'staff,a', 'False']]))
+        Export(iom, incremental=True)
+        WriteExp = iom.WriteExp
+        def EditingWriteExp(*args, **kwargs):
+            iom.Apply(iom.storage['user'], {'u': ['u', 'pw2', 'staff,a', 'False']})
+            return WriteExp(*args, **kwargs)
+        iom.WriteExp = EditingWriteExp
+        exported, text, logs = Export(iom, incremental=True)
+        assert exported and 'pw2' not in text
+        iom.WriteExp = WriteExp
+        exported, text, logs = Export(iom, incremental=True)
+        assert 'pw2' in text
+        assert (exported, text, logs) == Export(iom)
+    finally:
+        iom.Cleanup()
+
+def test_edit_during_export():
+    #Editors stay open while an export job runs and write each edit to the store as it is made.
+    iom = IOManager()
+    try:
+        Store(iom, Generate(7))
+        Export(iom, incremental=True)
+        edits = iter(range(100))
+        def Progress(done, total):
+            step = next(edits)
+            iom.Apply(iom.storage['user'], {f'user{step}': [f'user{step}', f'edited{step}', 'e0,s1', 'False']})
+        exported, text, logs = Export(iom, incremental=True, progressFunc=Progress)
+        assert exported
+        exported, text, logs = Export(iom, incremental=True)
+        assert (exported, text, logs) == Export(iom)
+        assert 'edited0' in text
+    finally:
+        iom.Cleanup()
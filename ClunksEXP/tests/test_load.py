@@ -0,0 +1,74 @@
+import os
+
+from ExpBinary import SidecarPath
+from ExpFile import OpenExp
+from IOManager import IOManager
+from configs import Generate, Store
+
+def Write(path, seed, sidecar=False):
+    iom = IOManager()
+    try:
+        Store(iom, Generate(seed, subservers=10, rooms=60, users=400, elevations=1))
+        with OpenExp(path, 'w') as expFile:
+            assert iom.Export(lambda text: None, expFile, sidecar=sidecar)
+    finally:
+        iom.Cleanup()
+
+def Truncate(path, fraction=0.6):
+    with open(path, 'rb') as expFile:
+        data = expFile.read()
+    with open(path, 'wb') as expFile:
+        expFile.write(data[:int(len(data) * fraction)])
+
+def Load(iom, path):
+    logs = []
+    with OpenExp(path) as expFile:
+        loaded = iom.LoadExp(logs.append, expFile)
+    return loaded, logs
+
+def Populated():
+    iom = IOManager()
+    Store(iom, Generate(1))
+    return iom, iom.Tables()
+
+def test_truncated_gzip_leaves_tables(tmp_path):
+    path = str(tmp_path / 'config.exp.gz')
+    Write(path, 0)
+    Truncate(path)
+    iom, tables = Populated()
+    try:
+        loaded, logs = Load(iom, path)
+        assert not loaded
+        assert any(log.startswith('LOAD FAILED') for log in logs)
+        assert iom.Tables() == tables
+    finally:
+        iom.Cleanup()
+
+def test_parse_error_leaves_tables(tmp_path):
+    path = str(tmp_path / 'config.exp')
+    Write(path, 0)
+    Truncate(path)
+    iom, tables = Populated()
+    try:
+        assert not Load(iom, path)[0]
+        assert iom.Tables() == tables
+    finally:
+        iom.Cleanup()
+
+def test_load_replaces_tables(tmp_path):
+    path = str(tmp_path / 'config.exp')
+    Write(path, 0, sidecar=True)
+    assert os.path.exists(SidecarPath(path))
+    iom, tables = Populated()
+    try:
+        assert Load(iom, path)[0]
+        loaded = iom.Tables()
+        assert loaded != tables
+        assert loaded['user']
+        #The store was replaced, so the next incremental export renders everything.
+        assert iom.storage.Changes()[0] == set(iom.storage)
+        os.remove(SidecarPath(path))
+        assert Load(iom, path)[0]
+        assert iom.Tables() == loaded
+    finally:
+        iom.Cleanup()
@@ -0,0 +1,102 @@
+import io
+import os
+
+import pytest
+
+from ExpBinary import OpenSidecar, SidecarPath
+from ExpFile import OpenExp
+from ExpReader import ExpReader
+from Exporter import LAYOUTS
+from IOManager import IOManager
+from configs import Generate, Store
+
+def Write(path, seed, layout, sidecar=True):
+    """
+    Exports a valid random configuration to path, returning whether it could be exported.
+    """
+    iom = IOManager()
+    try:
+        Store(iom, Generate(seed, users=30, elevations=1))
+        with OpenExp(path, 'w') as expFile:
+            return iom.Export(lambda text: None, expFile, sidecar=sidecar, layout=layout)
+    finally:
+        iom.Cleanup()
+
+def Tables(pairs):
+    tables = {}
+    for table, row in pairs:
+        tables.setdefault(table, []).append(row)
+    return tables
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_round_trip(tmp_path, layout):
+    for seed in range(10):
+        path = str(tmp_path / f'{seed}.exp')
+        assert Write(path, seed, layout)
+        with open(path, encoding='utf-8') as expFile:
+            expected = Tables(ExpReader(expFile).Rows())
+        sidecar = OpenSidecar(path)
+        assert sidecar is not None
+        try:
+            assert Tables(sidecar.Rows()) == expected
+            for table in ('subserver', 'room'):
+                for row in expected.get(table, []):
+                    assert sidecar.String(sidecar.Node(sidecar.Find(row[0]))[1]) == row[0]
+            assert sidecar.Find('missing') is None
+            written = io.StringIO()
+            sidecar.WriteExp(written)
+            with open(path, encoding='utf-8') as expFile:
+                assert written.getvalue() == expFile.read()
+        finally:
+            sidecar.Close()
+
+def test_stale_sidecar(tmp_path):
+    path = str(tmp_path / 'config.exp')
+    assert Write(path, 0, 'nested')
+    with open(path, encoding='utf-8') as expFile:
+        text = expFile.read()
+    #The same size but different content, as after copying another .exp over it.
+    with open(path, 'w', encoding='utf-8') as expFile:
+        expFile.write(text.replace('sub0', 'bus0'))
+    os.utime(path, ns=(0, 0))
+    assert OpenSidecar(path) is None
+    with open(path, 'w', encoding='utf-8') as expFile:
+        expFile.write(text + ' ')
+    assert OpenSidecar(path) is None
+    #Put back with a different modification time, the checksum still matches.
+    with open(path, 'w', encoding='utf-8') as expFile:
+        expFile.write(text)
+    os.utime(path, ns=(0, 0))
+    sidecar = OpenSidecar(path)
+    assert sidecar is not None
+    sidecar.Close()
+
+@pytest.mark.parametrize('damage', ['truncate', 'magic', 'empty'])
+def test_corrupted_sidecar(tmp_path, damage):
+    path = str(tmp_path / 'config.exp')
+    assert Write(path, 1, 'nested')
+    with open(SidecarPath(path), 'rb') as sidecarFile:
+        data = sidecarFile.read()
+    data = {'truncate': data[:len(data) - 3], 'magic': b'XXXX' + data[4:], 'empty': b''}[damage]
+    with open(SidecarPath(path), 'wb') as sidecarFile:
+        sidecarFile.write(data)
+    assert OpenSidecar(path) is None
+    iom = IOManager()
+    try:
+        with open(path, encoding='utf-8') as expFile:
+            assert iom.LoadExp(lambda text: None, expFile)
+    finally:
+        iom.Cleanup()
+
+def test_no_sidecar_for_compressed(tmp_path):
+    path = str(tmp_path / 'config.exp.gz')
+    assert Write(path, 2, 'nested')
+    assert not os.path.exists(SidecarPath(path))
+    assert OpenSidecar(path) is None
+    iom = IOManager()
+    try:
+        with OpenExp(path) as expFile:
+            assert iom.LoadExp(lambda text: None, expFile)
+        assert iom.storage['subserver'].Count() == 4
+    finally:
+        iom.Cleanup()
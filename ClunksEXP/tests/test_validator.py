@@ -0,0 +1,57 @@
+import random
+
+from Validator import TABLES, Validator
+from configs import Generate
+
+def RandomChange(r, tables, step):
+    """
+    Returns a table and the {key: row, or None} changes of a random edit to tables, which is applied to them.
+    Edits favour the problems the validator looks for: names clashing ignoring case, missing or cyclic parents,
+    users matching no elevation or several, and emptied tables.
+    """
+    table = r.choice(TABLES)
+    rows = tables[table]
+    keys = list(rows)
+    sectors = lambda: r.choice(['', 's1', 's2,s3', 'e0', 'e1', 'e0,e1', 'e2,s1'])
+    changes = {}
+    op = r.random()
+    if keys and op < 0.25:
+        for key in r.sample(keys, min(len(keys), r.randint(1, 3))):
+            changes[key] = None
+    elif keys and op < 0.4:
+        #A new row named like an existing one, ignoring case and spaces.
+        key = f' {r.choice(keys).upper()} '
+        changes[key] = [key] + list(rows[r.choice(keys)][1:])
+    else:
+        key = r.choice(keys) if keys and op < 0.8 else f'new{table}{step}'
+        if table == 'subserver':
+            row = [key, sectors()]
+        elif table == 'room':
+            parents = list(tables['room']) + list(tables['subserver']) + ['nowhere']
+            row = [key, 'p', r.choice(parents), sectors()]
+        elif table == 'elevation':
+            row = [key] + ['False'] * 9 + [r.choice(['e0', 'e1', 'e2', 'e0,e1', 's1'])]
+        else:
+            row = [key, 'h', sectors(), r.choice(['True', 'False'])]
+        changes[key] = row
+    for key, row in changes.items():
+        if row is None:
+            rows.pop(key, None)
+        else:
+            rows[key] = row
+    return table, changes
+
+def test_update_matches_rebuild():
+    for seed in range(60):
+        r = random.Random(seed)
+        tables = {table: {row[0]: row for row in rows} for table, rows in zip(TABLES, Generate(seed, subservers=r.randint(1, 4), rooms=12, users=20))}
+        validator = Validator(*[list(tables[table].values()) for table in TABLES])
+        for step in range(40):
+            before = set(validator.Problems())
+            table, changes = RandomChange(r, tables, step)
+            found, fixed = validator.Update(table, dict(changes))
+            after = set(validator.Problems())
+            assert after == (before - set(fixed)) | set(found), (seed, step)
+            assert not set(found) & set(fixed)
+            fresh = Validator(*[list(tables[table].values()) for table in TABLES])
+            assert validator.Problems() == fresh.Problems(), (seed, step)
@@ -186,7 +186,8 @@ namespace Server.DBHandler
                     ", elevation.Attribute("name").Value, paramList[0], paramList[1], paramList[2], paramList[3], paramList[4], paramList[5], paramList[6], paramList[7], paramList[8]);
                 }
 
-                IEnumerable<XElement> globalUsers = exp.Descendants("globalUsers").Descendants("user");
+                Dictionary<string, XElement> userTable = exp.Root.Elements("users").Elements("user").ToDictionary(user => user.Attribute("id").Value);
+                IEnumerable<XElement> globalUsers = Users(exp.Descendants("globalUsers"), userTable);
 
                 foreach (XElement subserver in exp.Descendants("subserver"))
                 {
@@ -194,7 +195,7 @@ namespace Server.DBHandler
                     int subserverID = cursor.Execute<int>("SELECT last_insert_rowid();");
 
                     List<int> processed = new List<int>();
-                    foreach (XElement user in subserver.Descendants("user").Concat(globalUsers))
+                    foreach (XElement user in Users(new XElement[] { subserver }, userTable).Concat(globalUsers))
                     {
                         if (!processed.Contains(user.ToString().GetHashCode()))
                         {
@@ -211,7 +212,7 @@ namespace Server.DBHandler
                     {
                         if (!processed.Contains(room.ToString().GetHashCode()))
                         {
-                            ProcessRoom(cursor, room, subserverID, globalUsers, false);
+                            ProcessRoom(cursor, room, subserverID, globalUsers, userTable, false);
                             processed.Add(room.ToString().GetHashCode());
                         }
                     }
@@ -225,15 +226,17 @@ namespace Server.DBHandler
         /// <param name="cursor">The Cursor to use</param>
         /// <param name="room">The EXP representaion of the room</param>
         /// <param name="parentID">The database id of the parent of the room</param>
+        /// <param name="globalUsers">The global users of the EXP</param>
+        /// <param name="userTable">The users of the EXP's user table by id, empty if it doesn't have one</param>
         /// <param name="parentIsRoom">A boolean to represent if the parent of the room is another room</param>
-        private static void ProcessRoom(Cursor cursor, XElement room, int parentID, IEnumerable<XElement> globalUsers, bool parentIsRoom = true)
+        private static void ProcessRoom(Cursor cursor, XElement room, int parentID, IEnumerable<XElement> globalUsers, Dictionary<string, XElement> userTable, bool parentIsRoom = true)
         {
             cursor.Execute("INSERT INTO rooms (name, password) VALUES ($name, $password)", room.Attribute("name").Value, room.Attribute("password").Value);
             int roomID = cursor.Execute<int>("SELECT last_insert_rowid();");
             cursor.Execute($"INSERT INTO {(parentIsRoom ? "room" : "subserver")}_rooms ({(parentIsRoom ? "parent, child" : "subserverID, roomID")}) VALUES ($parent, $roomID);", parentID, roomID);
 
             List<int> processed = new List<int>();
-            foreach (XElement user in room.Descendants("user").Concat(globalUsers))
+            foreach (XElement user in Users(new XElement[] { room }, userTable).Concat(globalUsers))
             {
                 if (!processed.Contains(user.ToString().GetHashCode()))
                 {
@@ -248,12 +251,23 @@ namespace Server.DBHandler
             {
                 if (!processed.Contains(room.ToString().GetHashCode()))
                 {
-                    ProcessRoom(cursor, child, roomID, globalUsers);
+                    ProcessRoom(cursor, child, roomID, globalUsers, userTable);
                     processed.Add(room.ToString().GetHashCode());
                 }
             }
         }
 
+        /// <summary>
+        /// A method to get the users under EXP elements, resolving the member references of an EXP exported with a user table
+        /// </summary>
+        /// <param name="parents">The elements to get the users under</param>
+        /// <param name="userTable">The users of the EXP's user table by id</param>
+        /// <returns>The user elements under the parents</returns>
+        private static IEnumerable<XElement> Users(IEnumerable<XElement> parents, Dictionary<string, XElement> userTable)
+        {
+            return parents.Descendants("user").Concat(from member in parents.Descendants("member") select userTable[member.Attribute("user").Value]);
+        }
+
         /// <summary>
         /// A method to set a user as present in a parent entity
         /// </summary>